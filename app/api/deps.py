@@ -1 +1,68 @@
 from __future__ import annotations
+
+from typing import AsyncIterator
+
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import session_scope
+from app.services import auth
+from app.services.http_client import HttpClientException, retry_after_headers
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Dependency FastAPI: una sessione DB per richiesta, chiusa a fine richiesta."""
+    async with session_scope() as db:
+        yield db
+
+
+async def get_current_user(request: Request) -> dict:
+    """Dependency FastAPI: verifica il bearer token della richiesta una sola volta.
+
+    Il payload viene salvato su request.state (token_payload, user_id, session_id): le altre dipendenze e
+    le route della stessa richiesta lo riusano senza verificare di nuovo il token.
+
+    Raises:
+        HTTPException: 401 se l'header Authorization manca o il token non è valido.
+    Returns:
+        dict: Payload del token.
+    """
+    payload = getattr(request.state, "token_payload", None)
+    if payload is not None:
+        return payload
+
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise HTTPException(status_code=401, detail={"message": "Unauthorized",
+                                                     "stack": "Missing Authorization header",
+                                                     "url": request.url.path})
+    try:
+        payload = await auth.authenticate(token.strip())
+    except HttpClientException as e:
+        raise HTTPException(status_code=e.status_code, headers=retry_after_headers(e),
+                            detail={"message": e.message, "stack": e.server_message, "url": e.url})
+
+    request.state.token_payload = payload
+    request.state.user_id = payload.get("user_id")
+    request.state.session_id = payload.get("session_id")
+    return payload
+
+
+# Ruolo (claim "role" o elemento di "roles" del token) che permette di agire sugli altri utenti
+ADMIN_ROLE = "admin"
+
+
+async def get_admin_user(request: Request, payload: dict = Depends(get_current_user)) -> dict:
+    """Dependency FastAPI: come get_current_user, ma richiede che il token abbia il ruolo di amministratore.
+
+    Raises:
+        HTTPException: 401 se il token manca o non è valido, 403 se l'utente non è amministratore.
+    Returns:
+        dict: Payload del token.
+    """
+    roles = payload.get("roles") or []
+    if payload.get("role") != ADMIN_ROLE and ADMIN_ROLE not in roles:
+        raise HTTPException(status_code=403, detail={"message": "Forbidden",
+                                                     "stack": "Administrator role required",
+                                                     "url": request.url.path})
+    return payload
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.deps import get_db
 from app.core.logging import get_logger
 from app.schemas.auth import UserLogin, TokenResponse, TokenRequest, UserRegistration
 from app.services import auth
-from app.services.http_client import HttpClientException
+from app.services.http_client import HttpClientException, retry_after_headers
+from app.services.rate_limit import RateLimitedException, login_limiter
 
 logger = get_logger(__name__)
 router = APIRouter()
@@ -15,11 +18,16 @@ router = APIRouter()
 # TODO: implemento creazione utente e modifica password (passando dal servizio dedicato)
 # TODO: implemento il routing tra servizi con la gestione delle sessioni
 @router.post("/login", response_model=TokenResponse)
-async def login(user: UserLogin):
+async def login(user: UserLogin, request: Request, db: AsyncSession = Depends(get_db)):
     try:
-        return await auth.login(user)
+        # controllo di ammissione prima di qualsiasi hash argon2
+        await login_limiter.check(request.client.host if request.client else None, user.email)
+        return await auth.login(user, db)
+    except RateLimitedException as e:
+        raise HTTPException(status_code=e.status_code, headers={"Retry-After": str(e.retry_after)},
+                            detail={"message": e.message, "stack": e.server_message, "url": "auth/login"})
     except HttpClientException as e:
-        raise HTTPException(status_code=e.status_code,
+        raise HTTPException(status_code=e.status_code, headers=retry_after_headers(e),
                             detail={"message": e.message, "stack": e.server_message, "url": e.url})
     except Exception as e:
         logger.error(f"Unexpected error during login: {str(e)}", exc_info=True)
@@ -33,7 +41,7 @@ async def post_refresh_token(refresh_token: TokenRequest):
     try:
         return await auth.refresh_token(refresh_token)
     except HttpClientException as e:
-        raise HTTPException(status_code=e.status_code,
+        raise HTTPException(status_code=e.status_code, headers=retry_after_headers(e),
                             detail={"message": e.message, "stack": e.server_message, "url": e.url})
     except Exception as e:
         logger.error(f"Unexpected error during token refresh: {str(e)}", exc_info=True)
@@ -51,7 +59,7 @@ async def logout(access_token: TokenRequest):
     except auth.InvalidSessionException as e:
         raise HTTPException(status_code=403, detail=str(e))
     except HttpClientException as e:
-        raise HTTPException(status_code=e.status_code,
+        raise HTTPException(status_code=e.status_code, headers=retry_after_headers(e),
                             detail={"message": e.message, "stack": e.server_message, "url": e.url})
     except Exception as e:
         logger.error(f"Unexpected error during logout: {str(e)}", exc_info=True)
@@ -61,11 +69,15 @@ async def logout(access_token: TokenRequest):
 
 
 @router.post("/register", response_model=TokenResponse)
-async def register(user: UserRegistration):
+async def register(user: UserRegistration, request: Request, db: AsyncSession = Depends(get_db)):
     try:
-        return await auth.register(user)
+        await login_limiter.check(request.client.host if request.client else None, user.email)
+        return await auth.register(user, db)
+    except RateLimitedException as e:
+        raise HTTPException(status_code=e.status_code, headers={"Retry-After": str(e.retry_after)},
+                            detail={"message": e.message, "stack": e.server_message, "url": "auth/register"})
     except HttpClientException as e:
-        raise HTTPException(status_code=e.status_code,
+        raise HTTPException(status_code=e.status_code, headers=retry_after_headers(e),
                             detail={"message": e.message, "stack": e.server_message, "url": e.url})
     except Exception as e:
         logger.error(f"Unexpected error during registration: {str(e)}", exc_info=True)
@@ -2,14 +2,16 @@ from __future__ import annotations
 
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi import Query
 
+from app.api.deps import get_current_user
 from app.schemas.school import SchoolsList, SchoolBase
 from app.services import school as school_service
-from app.services.http_client import HttpClientException
+from app.services.http_client import HttpClientException, retry_after_headers
 
-router = APIRouter()
+# Tutte le route richiedono un access token valido, verificato una volta per richiesta
+router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
 @router.get("/", response_model=SchoolsList)
@@ -50,6 +52,7 @@ async def get_schools(
     except HttpClientException as e:
         raise HTTPException(
             status_code=e.status_code,
+            headers=retry_after_headers(e),
             detail={
                 "message": e.message,
                 "stack": e.server_message,
@@ -96,6 +99,7 @@ async def get_school(school_id: int):
     except HttpClientException as e:
         raise HTTPException(
             status_code=e.status_code,
+            headers=retry_after_headers(e),
             detail={
                 "message": e.message,
                 "stack": e.server_message,
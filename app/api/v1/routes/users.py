@@ -1,27 +1,22 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 
+from app.api.deps import get_admin_user, get_current_user
 from app.core.logging import get_logger
 from app.schemas.users import ChangePasswordRequest, ChangePasswordResponse, UpdateUserRequest, UpdateUserResponse, \
-    DeleteUserResponse
-from app.services import users, auth
-from app.services.http_client import HttpClientException
+    DeleteUserResponse, RevokeSessionsRequest, RevokeSessionsResponse, SessionListResponse, SessionOut
+from app.services import auth, users
+from app.services.http_client import HttpClientException, retry_after_headers
 
 logger = get_logger(__name__)
-router = APIRouter()
+# Tutte le route richiedono un access token valido, verificato una volta per richiesta
+router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
 @router.post("/change_password", response_model=ChangePasswordResponse)
-async def change_password(passwords: ChangePasswordRequest, request: Request):
+async def change_password(passwords: ChangePasswordRequest, payload: dict = Depends(get_current_user)):
     try:
-        token = request.headers.get("Authorization")
-        if not token:
-            raise HTTPException(status_code=401, detail={"message": "Unauthorized",
-                                                        "stack": "Missing Authorization header",
-                                                        "url": "users/change_password"})
-        token = token.replace("Bearer ", "").strip()
-        payload = await auth.verify_token(token)
         changed = await users.change_password(passwords, payload["user_id"])
         if changed:
             return ChangePasswordResponse()
@@ -30,7 +25,7 @@ async def change_password(passwords: ChangePasswordRequest, request: Request):
                                                         "stack": "Couldn't change the password",
                                                         "url": "users/change_password"})
     except HttpClientException as e:
-        raise HTTPException(status_code=e.status_code,
+        raise HTTPException(status_code=e.status_code, headers=retry_after_headers(e),
                             detail={"message": e.message, "stack": e.server_message, "url": e.url})
     except Exception as e:
         logger.error(f"Unexpected error during change_password: {str(e)}", exc_info=True)
@@ -40,18 +35,11 @@ async def change_password(passwords: ChangePasswordRequest, request: Request):
 
 
 @router.patch("/", response_model=UpdateUserResponse)
-async def update_user_self(new_data: UpdateUserRequest, request: Request):
+async def update_user_self(new_data: UpdateUserRequest, payload: dict = Depends(get_current_user)):
     try:
-        token = request.headers.get("Authorization")
-        if not token:
-            raise HTTPException(status_code=401, detail={"message": "Unauthorized",
-                                                        "stack": "Missing Authorization header",
-                                                        "url": "users/change_password"})
-        token = token.replace("Bearer ", "").strip()
-        payload = await auth.verify_token(token)
         return await users.update_user(payload["user_id"], new_data)
     except HttpClientException as e:
-        raise HTTPException(status_code=e.status_code,
+        raise HTTPException(status_code=e.status_code, headers=retry_after_headers(e),
                             detail={"message": e.message, "stack": e.server_message, "url": e.url})
     except Exception as e:
         logger.error(f"Unexpected error during self user update: {str(e)}", exc_info=True)
@@ -60,20 +48,58 @@ async def update_user_self(new_data: UpdateUserRequest, request: Request):
                                                      "url": "users/update_user_self"})
 
 
+@router.get("/sessions", response_model=SessionListResponse)
+async def list_sessions(before: int | None = Query(default=None, description="next_cursor della pagina precedente"),
+                        limit: int = Query(default=50, ge=1, le=200),
+                        payload: dict = Depends(get_current_user)):
+    try:
+        sessions, next_cursor = await auth.list_user_sessions(payload["user_id"], before=before, limit=limit)
+        return SessionListResponse(
+            sessions=[SessionOut(id=s.id, created_at=s.created_at, updated_at=s.updated_at, expires_at=s.expires_at,
+                                 current=s.id == payload.get("session_id")) for s in sessions],
+            next_cursor=next_cursor)
+    except Exception as e:
+        logger.error(f"Unexpected error during sessions listing: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail={"message": "Internal Server Error",
+                                                     "stack": "Swiggity Swoggity, U won't find my log",
+                                                     "url": "users/sessions"})
+
+
+@router.post("/sessions/revoke", response_model=RevokeSessionsResponse)
+async def revoke_sessions(filters: RevokeSessionsRequest, payload: dict = Depends(get_current_user)):
+    try:
+        revoked = await auth.revoke_user_sessions(
+            payload["user_id"], session_ids=filters.session_ids, created_before=filters.created_before,
+            keep_session_id=payload.get("session_id") if filters.keep_current else None)
+        return RevokeSessionsResponse(revoked=revoked)
+    except Exception as e:
+        logger.error(f"Unexpected error during sessions revocation: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail={"message": "Internal Server Error",
+                                                     "stack": "Swiggity Swoggity, U won't find my log",
+                                                     "url": "users/sessions/revoke"})
+
+
+@router.post("/{user_id}/sessions/revoke", response_model=RevokeSessionsResponse,
+             dependencies=[Depends(get_admin_user)])
+async def revoke_user_sessions(user_id: int, filters: RevokeSessionsRequest):
+    try:
+        revoked = await auth.revoke_user_sessions(user_id, session_ids=filters.session_ids,
+                                                  created_before=filters.created_before)
+        return RevokeSessionsResponse(revoked=revoked)
+    except Exception as e:
+        logger.error(f"Unexpected error during user sessions revocation: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail={"message": "Internal Server Error",
+                                                     "stack": "Swiggity Swoggity, U won't find my log",
+                                                     "url": "users/revoke_user_sessions"})
+
+
 @router.patch("/{user_id}", response_model=UpdateUserResponse)
-async def update_user(user_id: int, new_data: UpdateUserRequest, request: Request):
+async def update_user(user_id: int, new_data: UpdateUserRequest):
     try:
         # TODO: verificare che l'utente abbia i permessi per modificare un altro utente
-        token = request.headers.get("Authorization")
-        if not token:
-            raise HTTPException(status_code=401, detail={"message": "Unauthorized",
-                                                        "stack": "Missing Authorization header",
-                                                        "url": "users/change_password"})
-        token = token.replace("Bearer ", "").strip()
-        await auth.verify_token(token)
         return await users.update_user(user_id, new_data)
     except HttpClientException as e:
-        raise HTTPException(status_code=e.status_code,
+        raise HTTPException(status_code=e.status_code, headers=retry_after_headers(e),
                             detail={"message": e.message, "stack": e.server_message, "url": e.url})
     except Exception as e:
         logger.error(f"Unexpected error during user update: {str(e)}", exc_info=True)
@@ -83,19 +109,12 @@ async def update_user(user_id: int, new_data: UpdateUserRequest, request: Reques
 
 
 @router.delete("/{user_id}", response_model=DeleteUserResponse)
-async def delete_user(user_id: int, request: Request):
+async def delete_user(user_id: int):
     try:
         # TODO: verificare che l'utente abbia i permessi per eliminare un altro utente
-        token = request.headers.get("Authorization")
-        if not token:
-            raise HTTPException(status_code=401, detail={"message": "Unauthorized",
-                                                        "stack": "Missing Authorization header",
-                                                        "url": "users/change_password"})
-        token = token.replace("Bearer ", "").strip()
-        await auth.verify_token(token)
         return await users.delete_user(user_id)
     except HttpClientException as e:
-        raise HTTPException(status_code=e.status_code,
+        raise HTTPException(status_code=e.status_code, headers=retry_after_headers(e),
                             detail={"message": e.message, "stack": e.server_message, "url": e.url})
     except Exception as e:
         logger.error(f"Unexpected error during user deletion: {str(e)}", exc_info=True)
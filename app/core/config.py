@@ -1,10 +1,20 @@
+from typing import Literal
+
 from pydantic_settings import SettingsConfigDict, BaseSettings
 
+HttpVersion = Literal["1.1", "2", "h2c"]
+
 
 class Settings(BaseSettings):
     SERVICE_NAME: str = "FastAPI Gateway"
     SERVICE_VERSION: str = "0.1.0"
     DATABASE_URL: str = "sqlite:///./database.db"
+    ASYNC_DATABASE_URL: str = ""  # se vuoto viene derivato da DATABASE_URL (es. postgresql -> postgresql+asyncpg)
+    DB_MAX_CONNECTIONS: int = 80  # budget totale di connessioni al DB, diviso tra i worker (< max_connections di Postgres)
+    DB_WORKERS: int = 0  # worker che condividono il budget, se 0 si usa WEB_CONCURRENCY (default 1)
+    DB_POOL_TIMEOUT: int = 5  # secondi prima di dare errore se pool pieno
+    DB_POOL_RECYCLE: int = 1800  # ricrea connessioni vecchie ogni 30 minuti
+    DB_STATEMENT_CACHE_SIZE: int = 500  # prepared statement in cache per connessione (asyncpg)
     RABBITMQ_HOST: str = "localhost"
     RABBITMQ_PORT: int = 5672
     RABBITMQ_USER: str = "guest"
@@ -16,12 +26,132 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30
     API_PREFIX: str = "/api/v1"
+    # "rows": una riga per ogni access/refresh token emesso; "family": solo la coppia corrente sulla sessione.
+    # In entrambi i casi la sessione tiene i digest correnti, quindi si può passare da "rows" a "family" in ogni momento
+    TOKEN_STORAGE: str = "rows"
+    TOKEN_PAIR_ENDPOINT: str = ""  # es. "/token/create_pair": se il servizio token emette access+refresh in una chiamata
+
+    #### VERIFICA TOKEN      # noqa: E266
+    TOKEN_VERIFY_MODE: str = "remote"  # "remote" (POST /token/verify) oppure "local" (verifica JWT in-process)
+    JWT_ALGORITHM: str = "RS256"
+    JWT_SECRET: str = ""  # segreto condiviso per gli algoritmi HS*, se vuoto si usa la chiave pubblica
+    PUBLIC_KEY: str = ""  # percorso del file PEM della chiave pubblica, se vuoto viene scaricata dal servizio token
+    JWT_PUBLIC_KEY_ENDPOINT: str = "/token/public_key"
+    JWT_KEY_CACHE_SECONDS: int = 3600  # ogni quanto riscaricare la chiave pubblica
+    JWT_KEY_REFRESH_MIN_SECONDS: int = 30  # intervallo minimo tra due download (es. kid sconosciuto)
+    JWT_LEEWAY_SECONDS: int = 0
+    JWT_ISSUER: str = ""
+    JWT_AUDIENCE: str = ""
+    TOKEN_VERIFY_BATCH_ENDPOINT: str = ""  # es. "/token/verify_batch": se vuoto ogni verifica remota è una richiesta
+    TOKEN_VERIFY_BATCH_WINDOW_MS: float = 2.0  # attesa massima per raccogliere altri token nella stessa richiesta
+    TOKEN_VERIFY_BATCH_MAX: int = 64  # token per richiesta, raggiunto il limite la richiesta parte subito
+    TOKEN_CACHE_ENABLED: bool = True  # cache in memoria dei token già verificati
+    TOKEN_CACHE_MAX_ENTRIES: int = 10000
+    TOKEN_CACHE_MAX_TTL_SECONDS: int = 60  # un token valido resta in cache al massimo fino alla sua scadenza
+    TOKEN_CACHE_NEGATIVE_TTL_SECONDS: int = 5  # per quanto si ricordano i token non validi
+
+    #### LIMITI LOGIN       # noqa: E266
+    LOGIN_LIMIT_ENABLED: bool = True  # 429 su login e registrazione oltre i limiti, prima dell'hash della password
+    LOGIN_LIMIT_IP_PER_MINUTE: float = 30  # tentativi al minuto per IP client (0 = nessun limite)
+    LOGIN_LIMIT_IP_BURST: int = 30
+    LOGIN_LIMIT_EMAIL_PER_MINUTE: float = 5  # tentativi al minuto per email (0 = nessun limite)
+    LOGIN_LIMIT_EMAIL_BURST: int = 10
+    LOGIN_LIMIT_GLOBAL_PER_SECOND: float = 0  # hash al secondo per tutti i worker insieme (0 = nessun limite)
+    LOGIN_LIMIT_GLOBAL_BURST: int = 50
+    LOGIN_LIMIT_SQLITE_PATH: str = ""  # es. "/dev/shm/gateway-login-limits.db": limiti condivisi tra i worker
+
+    #### ARCHIVIO SESSIONI  # noqa: E266
+    # "sql": tabelle del DB (default); "memory": dizionario del processo (test, un solo worker);
+    # "redis": server compatibile col protocollo Redis, scadenza con TTL nativi. Con "memory" e "redis"
+    # si conserva solo la coppia di token corrente di ogni sessione, come TOKEN_STORAGE="family"
+    SESSION_STORE: str = "sql"
+    SESSION_STORE_REDIS_URL: str = "redis://localhost:6379/0"
+    SESSION_STORE_REDIS_PREFIX: str = "gateway:"  # prefisso di tutte le chiavi
+    SESSION_STORE_REDIS_POOL_SIZE: int = 10  # connessioni per worker
+    SESSION_STORE_REDIS_TIMEOUT: float = 1.0  # secondi per comando (o pipeline)
+
+    #### REVOCA SESSIONI    # noqa: E266
+    SESSION_REVOCATION_BROADCAST: bool = True  # comunica logout e blocchi agli altri worker tramite RabbitMQ
+    SESSION_REVOCATION_EXCHANGE: str = "sessions.revoked"  # exchange fanout, una coda esclusiva per processo
+    # broker non raggiungibile: ogni quanti secondi riprovare la sottoscrizione e ricaricare le revoche dall'archivio
+    SESSION_REVOCATION_RETRY_SECONDS: float = 10
+
+    #### HASHING PASSWORD   # noqa: E266
+    HASH_WORKERS: int = 4  # thread dedicati ad argon2 (operazioni in esecuzione contemporaneamente)
+    HASH_MAX_QUEUE: int = 64  # richieste in attesa oltre le quali si risponde 503
+    HASH_QUEUE_TIMEOUT_SECONDS: float = 2.0  # attesa massima in coda prima del 503
+    ARGON2_TIME_COST: int = 3  # parametri argon2id (default di passlib), vedi benchmarks/argon2_params.py
+    ARGON2_MEMORY_COST: int = 65536  # KiB per hash
+    ARGON2_PARALLELISM: int = 4
+
+    #### PULIZIA SESSIONI E TOKEN  # noqa: E266
+    SWEEPER_ENABLED: bool = True
+    SWEEPER_INTERVAL_SECONDS: float = 300  # pausa tra due giri di pulizia
+    SWEEPER_BATCH_SIZE: int = 1000  # righe eliminate per transazione
+    SWEEPER_MAX_ROWS_PER_SECOND: float = 5000  # ritmo massimo di eliminazione, 0 = nessun limite
+    SWEEPER_RETENTION_DAYS: int = 30  # per quanto si tengono token scaduti e sessioni chiuse (riconoscimento riuso)
 
     #### ROUTES              # noqa: E266
     TOKEN_SERVICE_URL: str = "http://token:8002"
     USERS_SERVICE_URL: str = "http://users:8003"
     SCHOOL_SERVICE_URL: str = "http://school:8004"
 
+    #### HTTP CLIENT         # noqa: E266
+    HTTP_TIMEOUT: float = 5.0  # secondi per connect/read/write/pool
+    HTTP_MAX_CONNECTIONS: int = 100  # connessioni massime per ogni servizio
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20  # connessioni tenute aperte in attesa di riuso
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # secondi dopo cui una connessione inattiva viene chiusa
+    # Protocollo verso ogni servizio: "1.1"; "2" (HTTP/2 negoziato con ALPN su https, altrimenti 1.1);
+    # "h2c" (HTTP/2 in chiaro con prior knowledge, il servizio deve accettarlo). Con HTTP/2 le richieste
+    # contemporanee condividono poche connessioni (stream multiplexati) invece di aprirne una ciascuna.
+    # Altri valori vengono rifiutati all'avvio
+    TOKEN_SERVICE_HTTP_VERSION: HttpVersion = "1.1"
+    USERS_SERVICE_HTTP_VERSION: HttpVersion = "1.1"
+    SCHOOL_SERVICE_HTTP_VERSION: HttpVersion = "1.1"
+    # GET identiche contemporanee verso un servizio: ne parte una sola e la risposta viene condivisa
+    SINGLEFLIGHT_ENABLED: bool = True
+
+    #### BULKHEAD            # noqa: E266
+    # Richieste contemporanee verso ogni servizio (0 = nessun limite) e richieste in attesa oltre il limite:
+    # a coda piena, o dopo BULKHEAD_QUEUE_TIMEOUT_SECONDS di attesa, si risponde subito 503
+    TOKEN_SERVICE_MAX_CONCURRENCY: int = 0  # login, refresh e verifiche: nessun limite oltre il pool
+    TOKEN_SERVICE_MAX_QUEUE: int = 100
+    USERS_SERVICE_MAX_CONCURRENCY: int = 50
+    USERS_SERVICE_MAX_QUEUE: int = 100
+    SCHOOL_SERVICE_MAX_CONCURRENCY: int = 30
+    SCHOOL_SERVICE_MAX_QUEUE: int = 50
+    BULKHEAD_QUEUE_TIMEOUT_SECONDS: float = 1.0
+
+    #### CIRCUIT BREAKER     # noqa: E266
+    # Un circuito per servizio: aperto, le richieste falliscono subito con 503 invece di attendere HTTP_TIMEOUT
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_BREAKER_WINDOW_SECONDS: float = 30  # finestra su cui si calcolano errori e lentezza
+    CIRCUIT_BREAKER_MIN_CALLS: int = 20  # chiamate minime nella finestra prima di poter aprire il circuito
+    CIRCUIT_BREAKER_FAILURE_RATE: float = 0.5  # quota di errori (connessione, timeout, 5xx) che apre il circuito
+    CIRCUIT_BREAKER_SLOW_CALL_SECONDS: float = 2.0  # una chiamata più lunga di così è "lenta"
+    CIRCUIT_BREAKER_SLOW_CALL_RATE: float = 0.8  # quota di chiamate lente che apre il circuito
+    CIRCUIT_BREAKER_OPEN_SECONDS: float = 15  # durata dello stato aperto prima delle chiamate di prova
+    CIRCUIT_BREAKER_HALF_OPEN_CALLS: int = 3  # chiamate di prova (tutte riuscite per richiudere il circuito)
+
+    #### RETRY               # noqa: E266
+    # Errori di connessione: si ripetono le richieste non arrivate al servizio e quelle dei metodi idempotenti
+    HTTP_RETRY_ATTEMPTS: int = 2  # tentativi aggiuntivi (0 = nessun retry)
+    HTTP_RETRY_BACKOFF_SECONDS: float = 0.05  # attesa base, raddoppia a ogni tentativo (con jitter)
+    HTTP_RETRY_BACKOFF_MAX_SECONDS: float = 1.0
+    # Retry budget per servizio (token bucket): ogni richiesta aggiunge RETRY_BUDGET_RATIO token, ogni retry
+    # o richiesta hedged ne consuma uno. Se il servizio è giù i retry finiscono presto invece di moltiplicarne il carico
+    RETRY_BUDGET_RATIO: float = 0.1
+    RETRY_BUDGET_MIN_PER_SECOND: float = 1.0  # token aggiunti comunque ogni secondo (servizi con poco traffico)
+    RETRY_BUDGET_MAX_TOKENS: float = 20
+    # Hedging delle GET: se la risposta tarda oltre il percentile HEDGE_PERCENTILE delle latenze recenti,
+    # si invia una seconda richiesta identica e si usa la prima risposta che arriva
+    TOKEN_SERVICE_HEDGE_ENABLED: bool = False
+    USERS_SERVICE_HEDGE_ENABLED: bool = False
+    SCHOOL_SERVICE_HEDGE_ENABLED: bool = False
+    HEDGE_PERCENTILE: float = 0.95
+    HEDGE_MIN_SAMPLES: int = 50  # latenze registrate prima di attivare l'hedging
+    HEDGE_MIN_DELAY_SECONDS: float = 0.01
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_prefix="GATEWAY_"  # Prefisso di tutte le variabili (es. GATEWAY_DATABASE_URL)
@@ -0,0 +1,23 @@
+from typing import Callable
+
+# Registro minimale delle metriche: ogni componente registra una funzione che restituisce le proprie statistiche
+_providers: dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, provider: Callable[[], dict]) -> None:
+    """Registra un fornitore di metriche.
+
+    Args:
+        name (str): Nome della sezione nelle metriche (es. "token_cache").
+        provider (Callable[[], dict]): Funzione che restituisce le statistiche correnti.
+    """
+    _providers[name] = provider
+
+
+def snapshot() -> dict:
+    """Restituisce le statistiche correnti di tutti i componenti registrati.
+
+    Returns:
+        dict: Dizionario nome -> statistiche.
+    """
+    return {name: provider() for name, provider in _providers.items()}
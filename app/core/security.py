@@ -0,0 +1,18 @@
+import hashlib
+
+# Lunghezza del digest esadecimale SHA-256 usato come chiave di ricerca dei token
+TOKEN_DIGEST_LENGTH = 64
+
+
+def token_digest(token: str) -> str:
+    """Calcola il digest SHA-256 (esadecimale) di un token.
+
+    I token vengono cercati nel DB e nelle cache per digest: una chiave a lunghezza fissa di 64 caratteri
+    invece del JWT intero, lungo alcune centinaia di byte.
+
+    Args:
+        token (str): Token JWT.
+    Returns:
+        str: Digest esadecimale del token.
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
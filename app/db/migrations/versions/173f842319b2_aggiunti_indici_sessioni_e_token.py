@@ -0,0 +1,34 @@
+"""aggiunti indici sessioni e token
+
+Revision ID: 173f842319b2
+Revises: 748c51f69ad4
+Create Date: 2026-10-17 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '173f842319b2'
+down_revision: Union[str, Sequence[str], None] = '748c51f69ad4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Su Postgres gli indici dei token sono parziali (solo token non scaduti)
+    op.create_index('ix_accessTokens_session_id_is_expired', 'accessTokens', ['session_id', 'is_expired'],
+                    unique=False, postgresql_where=sa.text('NOT is_expired'))
+    op.create_index('ix_refreshTokens_session_id_is_expired', 'refreshTokens', ['session_id', 'is_expired'],
+                    unique=False, postgresql_where=sa.text('NOT is_expired'))
+    op.create_index('ix_sessions_user_id_is_active', 'sessions', ['user_id', 'is_active'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_sessions_user_id_is_active', table_name='sessions')
+    op.drop_index('ix_refreshTokens_session_id_is_expired', table_name='refreshTokens')
+    op.drop_index('ix_accessTokens_session_id_is_expired', table_name='accessTokens')
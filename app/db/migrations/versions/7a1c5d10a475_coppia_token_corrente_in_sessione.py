@@ -0,0 +1,42 @@
+"""coppia token corrente in sessione
+
+Revision ID: 7a1c5d10a475
+Revises: db3d744ed621
+Create Date: 2026-10-17 14:26:09.557310
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '7a1c5d10a475'
+down_revision: Union[str, Sequence[str], None] = 'db3d744ed621'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('sessions', sa.Column('access_token_hash', sa.String(length=64), nullable=True))
+    op.add_column('sessions', sa.Column('refresh_token_hash', sa.String(length=64), nullable=True))
+    op.add_column('sessions', sa.Column('token_generation', sa.Integer(), server_default='0', nullable=False))
+    # Copio sulla sessione la coppia corrente (token non scaduti più recenti); la generazione parte
+    # dal numero di rotazioni già fatte (refresh token scaduti)
+    op.execute(
+        'UPDATE sessions SET '
+        'refresh_token_hash = (SELECT r.token_hash FROM "refreshTokens" r '
+        'WHERE r.session_id = sessions.id AND NOT r.is_expired ORDER BY r.id DESC LIMIT 1), '
+        'access_token_hash = (SELECT a.token_hash FROM "accessTokens" a '
+        'WHERE a.session_id = sessions.id AND NOT a.is_expired ORDER BY a.id DESC LIMIT 1), '
+        'token_generation = (SELECT count(*) FROM "refreshTokens" r WHERE r.session_id = sessions.id AND r.is_expired)'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_column('token_generation')
+        batch_op.drop_column('refresh_token_hash')
+        batch_op.drop_column('access_token_hash')
@@ -0,0 +1,73 @@
+"""aggiunto digest token
+
+Revision ID: db3d744ed621
+Revises: 173f842319b2
+Create Date: 2026-10-17 11:04:52.381927
+
+"""
+import hashlib
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'db3d744ed621'
+down_revision: Union[str, Sequence[str], None] = '173f842319b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('accessTokens', 'refreshTokens')
+BATCH_SIZE = 10000
+
+
+def unique_token_constraint(table: str) -> str:
+    # Il vincolo UNIQUE su token è stato creato senza nome: Postgres lo chiama <tabella>_token_key,
+    # su SQLite il nome viene assegnato dalla naming convention passata a batch_alter_table
+    if op.get_bind().dialect.name == 'postgresql':
+        return f'{table}_token_key'
+    return f'uq_{table}_token'
+
+
+def backfill(table: str) -> None:
+    """Calcola il digest SHA-256 dei token già presenti, a blocchi di BATCH_SIZE righe."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute(f'UPDATE "{table}" SET token_hash = encode(sha256(convert_to(token, \'UTF8\')), \'hex\')')
+        return
+
+    tokens = sa.table(table, sa.column('id', sa.Integer), sa.column('token', sa.String),
+                      sa.column('token_hash', sa.String))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(tokens.c.id, tokens.c.token).where(tokens.c.id > last_id).order_by(tokens.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            tokens.update().where(tokens.c.id == sa.bindparam('row_id')).values(token_hash=sa.bindparam('digest')),
+            [{'row_id': row.id, 'digest': hashlib.sha256(row.token.encode('utf-8')).hexdigest()} for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    naming_convention = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+    for table in TABLES:
+        op.add_column(table, sa.Column('token_hash', sa.String(length=64), nullable=True))
+        backfill(table)
+        with op.batch_alter_table(table, naming_convention=naming_convention) as batch_op:
+            batch_op.alter_column('token_hash', existing_type=sa.String(length=64), nullable=False)
+            batch_op.drop_constraint(unique_token_constraint(table), type_='unique')
+            batch_op.create_index(f'ix_{table}_token_hash', ['token_hash'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_index(f'ix_{table}_token_hash')
+            batch_op.create_unique_constraint(unique_token_constraint(table), ['token'])
+            batch_op.drop_column('token_hash')
@@ -1,24 +1,172 @@
-from typing import Generator
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
 
+from app.core import metrics
 from app.core.config import settings
+from app.core.logging import get_logger
 
-engine = create_engine(settings.DATABASE_URL,
-   pool_size=1000,  # connessioni permanenti
-   max_overflow=2000,  # connessioni extra temporanee
-   pool_timeout=5,  # secondi prima di dare errore se pool pieno
-   pool_recycle=1800,  # ricrea connessioni vecchie ogni 30 minuti
-   pool_pre_ping=True,  # verifica connessione prima di riutilizzarla
-)
+logger = get_logger(__name__)
+
+# Driver asincroni equivalenti a quelli sincroni dell'URL configurato
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def async_database_url(url: str) -> str:
+    """Converte l'URL del database nel driver asincrono equivalente (es. postgresql -> postgresql+asyncpg).
+
+    Args:
+        url (str): URL del database (sincrono).
+    Returns:
+        str: URL con driver asincrono.
+    """
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None or parsed.get_driver_name() in ("aiosqlite", "asyncpg"):
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def worker_count() -> int:
+    """Numero di worker (processi gunicorn) che condividono il budget di connessioni al DB."""
+    if settings.DB_WORKERS > 0:
+        return settings.DB_WORKERS
+    return max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+
+
+def engine_options(url: str, max_connections: int | None = None) -> dict:
+    """Sceglie le opzioni dell'engine in base al dialetto.
+
+    - SQLite in memoria: StaticPool (una sola connessione condivisa, altrimenti ogni connessione vedrebbe un DB vuoto).
+    - SQLite su file: NullPool, aprire il file costa poco e non si tengono lock tra le richieste.
+    - Altri (Postgres): pool dimensionato dividendo DB_MAX_CONNECTIONS tra i worker, e su asyncpg
+      una cache dei prepared statement per connessione.
+
+    Args:
+        url (str): URL del database.
+        max_connections (int | None): Connessioni massime dell'engine; None per la quota del worker
+            (DB_MAX_CONNECTIONS diviso per il numero di worker).
+    Returns:
+        dict: Argomenti per create_engine / create_async_engine.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        if parsed.database in (None, "", ":memory:") or "mode=memory" in str(parsed):
+            return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+        return {"poolclass": NullPool}
+
+    per_worker = max_connections or max(1, settings.DB_MAX_CONNECTIONS // worker_count())
+    pool_size = max(1, per_worker * 3 // 4)
+    options = dict(
+        pool_size=pool_size,  # connessioni permanenti
+        max_overflow=per_worker - pool_size,  # connessioni extra temporanee, entro il budget del worker
+        pool_timeout=settings.DB_POOL_TIMEOUT,  # secondi prima di dare errore se pool pieno
+        pool_recycle=settings.DB_POOL_RECYCLE,  # ricrea connessioni vecchie
+        pool_pre_ping=True,  # verifica connessione prima di riutilizzarla
+    )
+    if parsed.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+def configure_sqlite(target_engine: Engine) -> None:
+    """Imposta WAL e synchronous=NORMAL su ogni nuova connessione SQLite: letture e scritture non si bloccano
+    a vicenda e i commit non attendono un fsync ciascuno.
+    """
+    if target_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(target_engine, "connect")
+    def _set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.DB_POOL_TIMEOUT * 1000}")
+        cursor.close()
+
+
+# Engine sincrono: usato fuori dal ciclo delle richieste (script, migrazioni); apre connessioni solo se usato.
+# Ha una sola connessione, così non consuma la quota del worker destinata all'engine asincrono
+engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL, max_connections=1))
+configure_sqlite(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine asincrono: usato da tutte le richieste e dai consumer RabbitMQ
+ASYNC_DATABASE_URL = settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL)
+async_engine_options = engine_options(ASYNC_DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **async_engine_options)
+configure_sqlite(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """Apre una sessione DB per una singola unità di lavoro (richiesta HTTP o messaggio RabbitMQ).
+
+    In caso di errore la transazione viene annullata; all'uscita la sessione viene sempre chiusa
+    e la connessione restituita al pool.
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+
+# Contatori del pool di connessioni, per verificare che le connessioni in uso seguano le richieste in corso
+pool_counters = {"checkouts": 0, "checkins": 0, "connects": 0}
+
+
+@event.listens_for(async_engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_counters["checkouts"] += 1
+
+
+@event.listens_for(async_engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    pool_counters["checkins"] += 1
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_counters["connects"] += 1
+
+
+def pool_limits() -> dict:
+    """Restituisce i limiti configurati per il pool dell'engine asincrono."""
+    pool = async_engine.pool
+    limits = {"dialect": async_engine.dialect.name, "pool": type(pool).__name__, "workers": worker_count()}
+    if "pool_size" in async_engine_options:
+        limits["pool_size"] = async_engine_options["pool_size"]
+        limits["max_overflow"] = async_engine_options["max_overflow"]
+        limits["budget"] = settings.DB_MAX_CONNECTIONS
+    return limits
+
+
+def log_pool_limits() -> None:
+    logger.info(f"Database pool limits: {pool_limits()}")
+
+
+def pool_stats() -> dict:
+    """Restituisce lo stato del pool dell'engine asincrono (connessioni in uso, overflow, totali)."""
+    pool = async_engine.pool
+    stats = dict(pool_counters)
+    stats["limits"] = pool_limits()
+    stats["in_use"] = pool_counters["checkouts"] - pool_counters["checkins"]
+    for name in ("size", "checkedout", "checkedin", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
+
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+metrics.register("db_pool", pool_stats)
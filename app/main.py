@@ -10,10 +10,17 @@ from fastapi.responses import ORJSONResponse
 from app.api.v1.routes import auth, users
 from app.api.v1.routes import auth
 from app.api.v1.routes import school
+from app.core import metrics
 from app.core.config import settings
 from app.core.logging import setup_logging, get_logger
 from app.db.base import import_models
-from app.services import broker, users as users_service
+from app.db.session import async_engine, log_pool_limits
+from app.services import broker, http_client, users as users_service
+from app.services.hashing import hasher
+from app.services.jwt_verifier import local_verifier
+from app.services.revocation import revoked_sessions
+from app.services.session_store import session_store
+from app.services.sweeper import sweeper
 
 import_models()  # Importo i modelli perché siano disponibili per le relazioni SQLAlchemy
 
@@ -25,6 +32,9 @@ sentry_sdk.init(
 
 logger = None
 
+docs_url = "/docs" if settings.ENVIRONMENT == "development" else None
+redoc_url = "/redoc" if settings.ENVIRONMENT == "development" else None
+
 
 # RabbitMQ Broker
 
@@ -35,7 +45,22 @@ exchanges = {
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     setup_logging()
-    yield
+    log_pool_limits()
+    await http_client.clients.start()  # pool di connessioni condiviso verso i servizi
+    if settings.TOKEN_VERIFY_MODE == "local":
+        await local_verifier.refresh_keys()  # chiavi per la verifica locale dei JWT
+    await revoked_sessions.start()  # sessioni revocate in memoria, aggiornate dagli altri worker
+    if settings.SWEEPER_ENABLED:
+        sweeper.start()  # pulizia periodica di sessioni e token scaduti
+    try:
+        yield
+    finally:
+        await sweeper.stop()
+        await revoked_sessions.stop()
+        await session_store.close()
+        await http_client.clients.close()
+        hasher.shutdown()
+        await async_engine.dispose()
 
 
 app = FastAPI(
@@ -47,6 +72,21 @@ app = FastAPI(
     redoc_url=redoc_url,
 )
 
+# Richieste in corso, da confrontare con le connessioni DB in uso (metrica db_pool)
+http_stats = {"in_flight": 0, "total": 0}
+metrics.register("http", lambda: dict(http_stats))
+
+
+@app.middleware("http")
+async def count_in_flight_requests(request, call_next):
+    http_stats["in_flight"] += 1
+    http_stats["total"] += 1
+    try:
+        return await call_next(request)
+    finally:
+        http_stats["in_flight"] -= 1
+
+
 # Routers
 current_router = APIRouter()
 
@@ -73,3 +113,8 @@ app.include_router(current_router, prefix="/api/v1")
 @app.get("/health", tags=["health"])
 def health():
     return {"status": "ok", "service": settings.SERVICE_NAME}
+
+
+@app.get("/metrics", tags=["health"])
+def get_metrics():
+    return metrics.snapshot()
@@ -2,18 +2,29 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from sqlalchemy import String, DateTime, Integer, func, ForeignKey
+from sqlalchemy import String, DateTime, Integer, Index, func, ForeignKey, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from app.core.security import TOKEN_DIGEST_LENGTH, token_digest
 from app.db.base import Base
 
 
 class RefreshToken(Base):
     __tablename__ = "refreshTokens"
+    __table_args__ = (
+        # Su Postgres l'indice è parziale: contiene solo i token ancora validi, gli unici che vengono aggiornati
+        Index("ix_refreshTokens_session_id_is_expired", "session_id", "is_expired",
+              postgresql_where=text("NOT is_expired")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     session_id: Mapped[int] = mapped_column(ForeignKey("sessions.id"))
-    token: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    token: Mapped[str] = mapped_column(String, nullable=False)
+    # Chiave di ricerca del token: digest SHA-256, calcolato all'inserimento se non impostato
+    token_hash: Mapped[str] = mapped_column(
+        String(TOKEN_DIGEST_LENGTH), nullable=False, unique=True, index=True,
+        default=lambda context: token_digest(context.get_current_parameters()["token"])
+    )
     accessToken_id: Mapped[int] = mapped_column(ForeignKey("accessTokens.id"))
     is_expired: Mapped[bool] = mapped_column(default=False, nullable=False)
     created_at: Mapped[datetime] = mapped_column(
@@ -3,20 +3,29 @@ from __future__ import annotations
 from datetime import datetime
 from typing import List
 
-from sqlalchemy import DateTime, Integer, func, ForeignKey
+from sqlalchemy import DateTime, Integer, Index, String, func, ForeignKey
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from app.core.security import TOKEN_DIGEST_LENGTH
 from app.db.base import Base
 
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        Index("ix_sessions_user_id_is_active", "user_id", "is_active"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     is_active: Mapped[bool] = mapped_column(default=True, nullable=False)
     is_blocked: Mapped[bool] = mapped_column(default=False, nullable=False)
     expires_at: Mapped[datetime] = mapped_column(nullable=False)
+    # Coppia di token corrente (digest) e numero di rotazioni: con TOKEN_STORAGE="family" sono gli unici dati
+    # dei token salvati, la rotazione è un UPDATE condizionato su token_generation
+    access_token_hash: Mapped[str | None] = mapped_column(String(TOKEN_DIGEST_LENGTH), nullable=True)
+    refresh_token_hash: Mapped[str | None] = mapped_column(String(TOKEN_DIGEST_LENGTH), nullable=True)
+    token_generation: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
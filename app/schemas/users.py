@@ -1,5 +1,8 @@
 from __future__ import annotations
-from pydantic import BaseModel
+
+from datetime import datetime
+
+from pydantic import BaseModel, Field
 
 
 class ChangePasswordRequest(BaseModel):
@@ -19,4 +22,28 @@ class UpdateUserResponse(BaseModel):
     message: str = "User updated successfully"
     
 class DeleteUserResponse(BaseModel):
-    message: str = "User deleted successfully"
\ No newline at end of file
+    message: str = "User deleted successfully"
+
+
+class SessionOut(BaseModel):
+    id: int
+    created_at: datetime
+    updated_at: datetime
+    expires_at: datetime
+    current: bool = False
+
+
+class SessionListResponse(BaseModel):
+    sessions: list[SessionOut]
+    next_cursor: int | None = None
+
+
+class RevokeSessionsRequest(BaseModel):
+    session_ids: list[int] | None = Field(default=None, max_length=1000)
+    keep_current: bool = True
+    created_before: datetime | None = None
+
+
+class RevokeSessionsResponse(BaseModel):
+    message: str = "Sessions revoked successfully"
+    revoked: list[int]
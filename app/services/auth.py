@@ -1,22 +1,25 @@
+import asyncio
 from datetime import datetime, timedelta
 
 from fastapi import HTTPException
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.logging import get_logger
-from app.db.session import get_db
-from app.models.accessToken import AccessToken
-from app.models.refreshToken import RefreshToken
-from app.models.session import Session
 from app.models.user import User
 from app.schemas.auth import UserLogin, TokenResponse, TokenRequest, UserRegistration
+from app.services.hashing import hasher, pwd_context
 from app.services.http_client import HttpClientException, HttpMethod, HttpUrl, HttpParams, send_request
+from app.services.jwt_verifier import local_verifier
+from app.services.revocation import revoked_sessions
+from app.services.session_store import RotationRejected, SessionRecord, session_store
+from app.services.token_cache import token_cache
+from app.services.users import update_password_hash
+from app.services.verify_batcher import verify_batcher
 
 logger = get_logger(__name__)
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-
 
 # Custom exception per invalid credentials
 class InvalidCredentialsException(HttpClientException):
@@ -137,6 +140,83 @@ async def create_new_user(data: dict) -> dict:
 
 
 async def verify_token(token: str) -> dict:
+    """Verifica un token, localmente se TOKEN_VERIFY_MODE è "local", altrimenti tramite il servizio token.
+
+    La verifica locale ripiega su quella remota quando la chiave non è nota o è stata ruotata.
+    I risultati (anche negativi) passano dalla token_cache, indicizzata per digest del token.
+
+    Args:
+        token (str): Il token da verificare.
+
+    Raises:
+        HttpClientException: Eccezione sollevata in caso di errore nella richiesta HTTP.
+
+    Returns:
+        dict: Payload del token con i campi "verified" ed "expired".
+    """
+    cached = token_cache.get(token)
+    if isinstance(cached, dict):
+        return cached
+    if cached is not None:
+        raise HttpClientException(*cached)
+
+    try:
+        payload = None
+        if settings.TOKEN_VERIFY_MODE == "local":
+            payload = await local_verifier.verify(token)
+        if payload is None:
+            payload = await verify_token_remote(token)
+    except HttpClientException as e:
+        if 400 <= e.status_code < 500:
+            token_cache.put_error(token, e)
+        raise
+    token_cache.put(token, payload)
+    return payload
+
+
+async def authenticate(token: str) -> dict:
+    """Verifica un access token presentato a una route protetta, senza accedere al DB.
+
+    Usa la via più veloce disponibile: token_cache, poi verifica locale o servizio token (verify_token),
+    e l'insieme in memoria delle sessioni revocate.
+
+    Args:
+        token (str): Access token (senza prefisso "Bearer").
+
+    Raises:
+        InvalidTokenException: Se il token non è valido, è scaduto o la sessione è stata revocata.
+        HttpClientException: Eccezione sollevata in caso di errore nella richiesta HTTP.
+
+    Returns:
+        dict: Payload del token.
+    """
+    payload = await verify_token(token)
+    if not payload or not payload["verified"]:
+        raise InvalidTokenException("Invalid access token")
+    if payload["expired"]:
+        raise InvalidTokenException("Access token expired")
+    if payload.get("session_id") in revoked_sessions:
+        raise InvalidTokenException("Session is inactive or blocked")
+    return payload
+
+
+async def verify_token_remote(token: str) -> dict:
+    """Verifica un token tramite il servizio token esterno (POST /token/verify).
+
+    Se TOKEN_VERIFY_BATCH_ENDPOINT è configurato, le verifiche concorrenti vengono raggruppate
+    in un'unica richiesta (vedi VerifyBatcher).
+
+    Args:
+        token (str): Il token da verificare.
+
+    Raises:
+        HttpClientException: Eccezione sollevata in caso di errore nella richiesta HTTP.
+
+    Returns:
+        dict: Payload del token restituito dal servizio.
+    """
+    if verify_batcher.endpoint:
+        return await verify_batcher.verify(token)
     try:
         params = HttpParams({"token": token})
         response = await send_request(
@@ -150,60 +230,84 @@ async def verify_token(token: str) -> dict:
         raise e
 
 
-def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
-
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verifica la password e, se l'hash usa parametri argon2 diversi da quelli attuali (needs_update),
+    restituisce anche il nuovo hash, calcolato nella stessa operazione sul pool di hashing.
 
-async def create_user_session_and_tokens(user: User) -> TokenResponse:
+    Returns:
+        tuple[bool, str | None]: Esito della verifica e nuovo hash (None se non serve aggiornarlo).
     """
-    Crea una sessione per l'utente, genera access e refresh token, li salva nel DB
-    e restituisce un TokenResponse.
+    return await hasher.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+async def create_token_pair(data: dict, refresh_expire_days: int = settings.REFRESH_TOKEN_EXPIRE_DAYS) -> tuple[str, str]:
+    """Crea access e refresh token con un solo round trip verso il servizio token.
+
+    Se TOKEN_PAIR_ENDPOINT è configurato usa l'endpoint che emette la coppia in una sola chiamata,
+    altrimenti crea i due token in parallelo.
+
+    Args:
+        data (dict): Dati da includere nel payload dei token.
+        refresh_expire_days (int, optional): Scadenza del refresh token in giorni.
+            Defaults to settings.REFRESH_TOKEN_EXPIRE_DAYS.
+
+    Raises:
+        HttpClientException: Eccezione sollevata in caso di errore nella richiesta HTTP.
+
+    Returns:
+        tuple[str, str]: Access token e refresh token.
     """
-    db = next(get_db())
-    db_session = Session(
-        user_id=user.id,
-        expires_at=datetime.now() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    )
-    db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    if settings.TOKEN_PAIR_ENDPOINT:
+        params = HttpParams(data)
+        params.add_param("access_expires_in", settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        if refresh_expire_days:
+            params.add_param("refresh_expires_in", refresh_expire_days * 24 * 60)  # Converti giorni in minuti
+        response = await send_request(
+            url=HttpUrl.TOKEN_SERVICE,
+            method=HttpMethod.POST,
+            endpoint=settings.TOKEN_PAIR_ENDPOINT,
+            _params=params
+        )
+        return response.data["access_token"], response.data["refresh_token"]
 
-    access_token_response = await create_access_token(
-        data={"username": user.username, "user_id": user.id, "session_id": db_session.id}
+    access_token_response, refresh_token_response = await asyncio.gather(
+        create_access_token(data),
+        create_refresh_token(data, expire_days=refresh_expire_days),
     )
-    access_token = access_token_response["token"]
+    return access_token_response["token"], refresh_token_response["token"]
 
-    refresh_token_response = await create_refresh_token(
-        data={"username": user.username, "user_id": user.id, "session_id": db_session.id}
-    )
-    refresh_token = refresh_token_response["token"]
 
-    db_access_token = AccessToken(
-        session_id=db_session.id,
-        token=access_token
-    )
-    db.add(db_access_token)
-    db.commit()
-    db.refresh(db_access_token)
-
-    db_refresh_token = RefreshToken(
-        session_id=db_session.id,
-        token=refresh_token,
-        accessToken_id=db_access_token.id
-    )
-    db.add(db_refresh_token)
-    db.commit()
-    db.refresh(db_refresh_token)
+async def create_user_session_and_tokens(user: User) -> TokenResponse:
+    """
+    Crea una sessione per l'utente nell'archivio delle sessioni, genera access e refresh token
+    e restituisce un TokenResponse.
+    """
+    async def issue(session_id: int, expires_at: datetime) -> tuple[str, str]:
+        return await create_token_pair(data={"username": user.username, "user_id": user.id, "session_id": session_id})
 
+    access_token, refresh_token = await session_store.create(
+        user.id, datetime.now() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS), issue)
     return TokenResponse(access_token=access_token, refresh_token=refresh_token)
 
 
-async def login(user_login: UserLogin):
-    db = next(get_db())
+async def login(user_login: UserLogin, db: AsyncSession):
     try:
-        user = db.query(User).filter(User.email == user_login.email).first()
-        if not user or not verify_password(user_login.password, user.hashed_password):
+        result = await db.execute(select(User).where(User.email == user_login.email))
+        user = result.scalars().first()
+        await db.commit()  # chiudo la transazione di lettura: la connessione torna al pool durante argon2
+        if not user:
             raise InvalidCredentialsException("Invalid Credentials")
+        valid, new_hash = await verify_and_update_password(user_login.password, user.hashed_password)
+        if not valid:
+            raise InvalidCredentialsException("Invalid Credentials")
+        if new_hash:
+            # parametri argon2 cambiati: il nuovo hash va salvato sul servizio utenti, che aggiorna anche la replica
+            # locale (scriverlo solo qui verrebbe sovrascritto dal messaggio UPDATE successivo). Un errore non
+            # blocca il login: l'hash verrà aggiornato a uno dei prossimi
+            try:
+                await update_password_hash(user.id, new_hash)
+            except HttpClientException as e:
+                logger.warning(f"Failed to store rehashed password for user {user.id}: {e.server_message}")
         return await create_user_session_and_tokens(user)
     except InvalidCredentialsException as e:
         raise e
@@ -216,69 +320,35 @@ async def login(user_login: UserLogin):
 
 
 async def refresh_token(refresh_token: TokenRequest) -> TokenResponse:
+    """Ruota la coppia di token della sessione.
+
+    Un refresh token già usato (o usato da due richieste contemporanee) blocca la sessione: il blocco
+    viene comunicato a tutti i worker, che rimuovono dalla cache i token della sessione.
+
+    Raises:
+        InvalidTokenException: Se il token non è valido, la sessione non è utilizzabile o il token è stato riusato.
+    """
     payload = await verify_token(refresh_token.token)
     if not payload or not payload["verified"]:
         raise InvalidTokenException("Invalid refresh token")
+    if payload.get("session_id") in revoked_sessions:
+        raise InvalidTokenException("Session is inactive or does not exist")
 
-    db = next(get_db())
-    db_old_refresh_token = db.query(RefreshToken).filter(RefreshToken.token == refresh_token.token).join(
-        AccessToken).first()
-    if not db_old_refresh_token:
-        raise InvalidTokenException("Refresh token not found")
+    async def issue(session_id: int, expires_at: datetime) -> tuple[str, str]:
+        return await create_token_pair(
+            {"username": payload["username"], "user_id": payload["user_id"], "session_id": session_id},
+            refresh_expire_days=(expires_at - datetime.now()).days)
 
-    session = db.query(Session).filter(Session.id == db_old_refresh_token.session_id).first()
-    if not session or not session.is_active:
-        raise InvalidTokenException("Session is inactive or does not exist")
-    if session.is_blocked:
-        raise InvalidTokenException("Session is blocked")
-    if session.expires_at < datetime.now():
-        raise InvalidTokenException("Session expired")
-
-    if db_old_refresh_token.is_expired:
-        # segno la sessione come non attiva e bloccata, perché è stato riusato un token già usato
-        session.is_active = False
-        session.is_blocked = True
-        db.commit()
-        db.refresh(session)
-        # segno tutti i token associati alla sessione come scaduti
-        db.query(AccessToken).filter(AccessToken.session_id == session.id).update({"is_expired": True})
-        db.query(RefreshToken).filter(RefreshToken.session_id == session.id).update({"is_expired": True})
-        db.commit()
-
-        raise InvalidTokenException("Refresh token expired, Session blocked")
-
-    access_token_response = await create_access_token(
-        {"username": payload["username"], "user_id": payload["user_id"], "session_id": session.id})
-    refresh_token_response = await create_refresh_token(
-        {"username": payload["username"], "user_id": payload["user_id"], "session_id": session.id},
-        expire_days=(
-                session.expires_at - datetime.now()).days)
-    access_token = access_token_response["token"]
-    refresh_token = refresh_token_response["token"]
-    # Segno i vecchi token come scaduti
-    db_old_refresh_token.is_expired = True
-    db.commit()
-    db.refresh(db_old_refresh_token)
-    db_old_refresh_token.accessToken.is_expired = True
-
-    # Creo nuovi token
-    db_access_token = AccessToken(
-        session_id=session.id,
-        token=access_token,
-    )
-    db.add(db_access_token)
-    db.commit()
-    db.refresh(db_access_token)
-    db_refresh_token = RefreshToken(
-        session_id=session.id,
-        token=refresh_token,
-        accessToken_id=db_access_token.id
-    )
-    db.add(db_refresh_token)
-    db.commit()
-    db.refresh(db_refresh_token)
+    try:
+        access_token, new_refresh_token = await session_store.rotate(refresh_token.token, payload.get("session_id"),
+                                                                     payload.get("user_id"), issue)
+    except RotationRejected as e:
+        if e.blocked:
+            await revoked_sessions.revoke(e.session_id)
+        raise InvalidTokenException(e.message)
+    token_cache.invalidate(refresh_token.token)
 
-    return TokenResponse(access_token=access_token, refresh_token=refresh_token)
+    return TokenResponse(access_token=access_token, refresh_token=new_refresh_token)
 
 
 async def logout(access_token: TokenRequest):
@@ -289,30 +359,63 @@ async def logout(access_token: TokenRequest):
     if payload["expired"]:
         raise InvalidTokenException("Access token expired")
 
-    db = next(get_db())
-    session = db.query(Session).filter(Session.id == payload["session_id"]).first()
-    if not session:
+    if payload["session_id"] in revoked_sessions:
+        # sessione già chiusa o bloccata: non serve scrivere sull'archivio delle sessioni
+        return {"detail": "Logout successful"}
+
+    # Segno la sessione come non attiva e tutti i token associati come scaduti
+    if not await session_store.deactivate(payload["session_id"]):
         raise InvalidSessionException("Session does not exist")
+    await revoked_sessions.revoke(payload["session_id"])
 
-    # Segno la sessione come non attiva
-    session.is_active = False
-    db.commit()
-    db.refresh(session)
+    return {"detail": "Logout successful"}
 
-    # Segno tutti i token associati alla sessione come scaduti
-    db.query(AccessToken).filter(AccessToken.session_id == session.id).update({"is_expired": True})
-    db.query(RefreshToken).filter(RefreshToken.session_id == session.id).update({"is_expired": True})
-    db.commit()
 
-    return {"detail": "Logout successful"}
+async def list_user_sessions(user_id: int, before: int | None = None,
+                             limit: int = 50) -> tuple[list[SessionRecord], int | None]:
+    """Restituisce le sessioni attive dell'utente, dalla più recente, con paginazione keyset sull'id.
+
+    Args:
+        user_id (int): Id dell'utente.
+        before (int | None): Cursore: solo le sessioni con id minore (il next_cursor della pagina precedente).
+        limit (int): Numero massimo di sessioni per pagina.
+    Returns:
+        tuple[list[SessionRecord], int | None]: Le sessioni della pagina e il cursore della pagina successiva
+            (None se è l'ultima).
+    """
+    sessions = await session_store.list_active(user_id, before, limit + 1)
+    if len(sessions) > limit:
+        return sessions[:limit], sessions[limit - 1].id
+    return sessions, None
+
+
+async def revoke_user_sessions(user_id: int, session_ids: list[int] | None = None,
+                               keep_session_id: int | None = None,
+                               created_before: datetime | None = None) -> list[int]:
+    """Revoca in blocco le sessioni attive dell'utente (tutte o quelle che rispettano i filtri).
+
+    L'archivio chiude le sessioni con operazioni a insieme, indipendenti dal numero di sessioni
+    (sul DB: tre UPDATE in un'unica transazione); la revoca viene comunicata agli altri worker con un solo messaggio.
+
+    Args:
+        user_id (int): Id dell'utente.
+        session_ids (list[int] | None): Revoca solo queste sessioni (None = tutte).
+        keep_session_id (int | None): Sessione da non revocare (es. quella della richiesta corrente).
+        created_before (datetime | None): Revoca solo le sessioni create prima di questo istante.
+    Returns:
+        list[int]: Id delle sessioni revocate.
+    """
+    revoked = await session_store.revoke_user(user_id, session_ids, keep_session_id, created_before)
+    await revoked_sessions.revoke_many(revoked)
+    return revoked
 
 
-async def register(user: UserRegistration) -> TokenResponse:
-    hashed_password = pwd_context.hash(user.password)
+async def register(user: UserRegistration, db: AsyncSession) -> TokenResponse:
+    hashed_password = await hasher.run(pwd_context.hash, user.password)
 
     create_user_response = await create_new_user(
         data={"username": user.username, "name": user.name, "surname": user.surname, "email": user.email,
-              "hashed_password": user.password})
+              "hashed_password": hashed_password})
     if not create_user_response or "id" not in create_user_response:
         raise HttpClientException("Internal Server Error", server_message="User creation failed", status_code=500,
                                   url="/auth/register")
@@ -320,7 +423,6 @@ async def register(user: UserRegistration) -> TokenResponse:
     # Login automatico dopo la registrazione
     # return await login(UserLogin(username=user.username, password=user.password))
     # richiamo direttamente la creazione della sessione e dei token, senza leggere l'utente dal DB
-    db = next(get_db())
     user = User(
         id=create_user_response["id"],
         username=user.username,
@@ -330,12 +432,10 @@ async def register(user: UserRegistration) -> TokenResponse:
         updated_at=create_user_response["updated_at"]
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
     return await create_user_session_and_tokens(user)
 
 
-# TODO: Aggiungere job per pulizia sessioni e token scaduti
 async def validate_session(access_token: str) -> None:
     """Controlla se il token di accesso è valido e la sessione associata è attiva.
 
@@ -355,19 +455,16 @@ async def validate_session(access_token: str) -> None:
         if not payload or not payload["verified"]:
             raise InvalidTokenException("Invalid access token")
 
-        db = next(get_db())
+        if payload.get("session_id") in revoked_sessions:
+            raise InvalidTokenException("Session is inactive or blocked")
 
         if payload["expired"]:
-            # Segna il token come scaduto
-            session = db.query(Session).filter(Session.id == payload["session_id"]).first()
-            if session:
-                # Segna il token access come scaduto
-                db.query(AccessToken).filter(AccessToken.session_id == session.id).update({"is_expired": True})
-                db.commit()
+            # la scadenza dell'access token è nel token stesso: resta solo da distinguere la sessione scaduta
+            if await session_store.get(payload["session_id"]):
                 raise InvalidTokenException("Access token expired")
             else:
                 raise InvalidTokenException("Access token is of an expired session")
-    except HTTPException:
+    except (HTTPException, HttpClientException):
         raise
     except Exception as e:
         logger.error(f"Unexpected error during session validation: {str(e)}")
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import json
 import asyncio
+import uuid
+
 import aio_pika
 
 from app.core.config import settings
@@ -31,6 +33,9 @@ class AsyncBrokerSingleton:
         Args:
             service_name (str): Nome del servizio che utilizza il broker.
         """
+        if getattr(self, "_initialized", False):
+            return  # istanza condivisa già inizializzata: non azzero connessione e sottoscrizioni degli altri
+        self._initialized = True
         self.service_name = service_name
         self.connection = None
         self.channel = None
@@ -38,7 +43,9 @@ class AsyncBrokerSingleton:
         self.tasks = {}
 
     async def connect(self):
-        """Stabilisce una connessione asincrona a RabbitMQ."""
+        """Stabilisce una connessione asincrona a RabbitMQ (riusa quella già aperta)."""
+        if self.connection is not None and not self.connection.is_closed:
+            return True
         try:
             self.connection = await aio_pika.connect_robust(
                 host=settings.RABBITMQ_HOST,
@@ -54,7 +61,7 @@ class AsyncBrokerSingleton:
             logger.error(f"Failed to connect to RabbitMQ: {e}")
             return False
 
-    async def subscribe(self, exchange_name, callback, ex_type="direct", routing_key=""):
+    async def subscribe(self, exchange_name, callback, ex_type="direct", routing_key="", exclusive=False):
         """Sottoscrive a un exchange RabbitMQ con una callback specifica (asincrono).
 
         Args:
@@ -62,18 +69,26 @@ class AsyncBrokerSingleton:
             callback (callable): Funzione di callback da chiamare quando arriva un messaggio.
             ex_type (str): Tipo di exchange (default: "direct").
             routing_key (str): Chiave di routing per il binding della coda (default: ""). Se vuota, si sottoscrive a tutti i messaggi dell'exchange.
+            exclusive (bool): Se True usa una coda esclusiva di questo processo, eliminata alla disconnessione,
+                così ogni worker riceve tutti i messaggi (default: False, coda condivisa tra i worker del servizio).
         """
         exchange = await self.channel.declare_exchange(exchange_name, ex_type)
-        if routing_key:
+        if exclusive:
+            queue_name = f"{self.service_name}.{exchange_name}.{uuid.uuid4().hex}"
+        elif routing_key:
             queue_name = f"{self.service_name}.{exchange_name}.{routing_key}"
         else:
             queue_name = f"{self.service_name}.{exchange_name}.all"
-        queue = await self.channel.declare_queue(queue_name, durable=True)
+        if exclusive:
+            queue = await self.channel.declare_queue(queue_name, exclusive=True, auto_delete=True)
+        else:
+            queue = await self.channel.declare_queue(queue_name, durable=True)
         await queue.bind(exchange, routing_key=routing_key)
         task = asyncio.create_task(queue.consume(callback))
         self.queues[queue_name] = queue
         self.tasks[queue_name] = task
         logger.info(f"Subscribed to exchange {exchange_name} with queue '{queue_name}' and routing key '{routing_key}' (aio-pika)")
+        return queue_name
 
     async def unsubscribe(self, queue_name):
         """Annulla la sottoscrizione a una coda RabbitMQ (asincrono).
@@ -81,25 +96,31 @@ class AsyncBrokerSingleton:
         Args:
             queue_name (str): Nome della coda da cui annullare la sottoscrizione.
         """
-        if queue_name in self.tasks:
-            self.tasks[queue_name].cancel()
-            await asyncio.sleep(0)
-            del self.tasks[queue_name]
-        if queue_name in self.queues:
-            await self.queues[queue_name].unbind()
-            await self.queues[queue_name].delete()
-            del self.queues[queue_name]
+        task = self.tasks.pop(queue_name, None)
+        queue = self.queues.pop(queue_name, None)
+        if task is not None:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                # il task ha già registrato il consumer: lo annullo con il suo consumer tag
+                if queue is not None:
+                    await queue.cancel(task.result())
+            else:
+                task.cancel()
+                await asyncio.sleep(0)
+        if queue is not None and not queue.auto_delete:
+            # le code auto_delete vengono eliminate dal broker quando non hanno più consumer
+            await queue.delete()
         logger.info(f"Unsubscribed from queue '{queue_name}' (aio-pika)")
 
-    async def publish_message(self, exchange_name, msg_type, data, routing_key=""):
+    async def publish_message(self, exchange_name, msg_type, data, routing_key="", ex_type="direct"):
         """Pubblica un messaggio su un exchange RabbitMQ (asincrono).
         Args:
             exchange_name (str): Nome dell'exchange su cui pubblicare il messaggio.
             msg_type (str): Tipo di messaggio.
             data (dict): Dati del messaggio.
             routing_key (str): Chiave di routing per il messaggio (default: ""). Se vuota, il messaggio viene inviato a tutti i consumatori dell'exchange.
+            ex_type (str): Tipo di exchange (default: "direct").
         """
-        exchange = await self.channel.declare_exchange(exchange_name, "direct")
+        exchange = await self.channel.declare_exchange(exchange_name, ex_type)
         message = aio_pika.Message(
             body=json.dumps({"type": msg_type, "data": data}).encode("utf-8"),
             content_type="application/json",
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import asyncio
+
+
+# Richiesta rifiutata dal bulkhead (coda piena o attesa troppo lunga)
+class BulkheadFull(Exception):
+    pass
+
+
+class Bulkhead():
+    """Limita le richieste contemporanee verso un servizio, con una coda d'attesa limitata.
+
+    Al massimo `max_concurrent` richieste sono in corso e al massimo `max_queue` attendono il loro turno:
+    oltre questo limite la richiesta viene rifiutata subito, e dopo `queue_timeout` secondi di attesa viene
+    rifiutata comunque. Così un servizio lento occupa al più i propri posti, senza rallentare le route
+    che dipendono dagli altri servizi. Con max_concurrent = 0 non c'è limite (solo conteggio).
+
+    Uso:
+        async with bulkhead:
+            ...  # richiesta al servizio
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+
+    async def __aenter__(self) -> Bulkhead:
+        if self.semaphore is None:
+            pass
+        elif not self.semaphore.locked():
+            await self.semaphore.acquire()
+        else:
+            if self.queued >= self.max_queue:
+                self.rejected["queue_full"] += 1
+                raise BulkheadFull(f"{self.name}: {self.queued} requests already waiting")
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected["queue_timeout"] += 1
+                raise BulkheadFull(f"{self.name}: waited more than {self.queue_timeout}s")
+            finally:
+                self.queued -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.in_flight -= 1
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "rejected": dict(self.rejected),
+        }
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass(slots=True, frozen=True)
+class Permit():
+    """Chiamata ammessa da CircuitBreaker.allow(), da restituire a record() con il suo esito.
+
+    Attributes:
+        generation (int): Generazione del breaker (cambia a ogni transizione di stato) in cui la chiamata è partita.
+        probe (bool): True se è una chiamata di prova dello stato semi-aperto.
+    """
+    generation: int
+    probe: bool = False
+
+
+class CircuitBreaker():
+    """Circuit breaker di un servizio a valle, con stati chiuso / aperto / semi-aperto.
+
+    Da chiuso si apre quando, tra le chiamate degli ultimi `window` secondi (almeno `min_calls`), la quota di
+    errori supera `failure_rate` o quella di chiamate lente (durata >= `slow_call_seconds`) supera `slow_call_rate`.
+    Da aperto rifiuta subito ogni chiamata per `open_seconds`, poi passa a semi-aperto: lascia passare al massimo
+    `half_open_calls` chiamate di prova contemporanee; se tutte riescono (e non sono lente) si richiude,
+    al primo errore si riapre. Gli esiti delle chiamate partite prima dell'ultima transizione di stato vengono
+    ignorati: una chiamata avviata a circuito chiuso che termina mentre è semi-aperto non conta come prova.
+    Attributes:
+        calls (deque): Esiti delle chiamate nella finestra: (istante, errore, lenta).
+    """
+
+    def __init__(self, name: str, window: float, min_calls: int, failure_rate: float, slow_call_seconds: float,
+                 slow_call_rate: float, open_seconds: float, half_open_calls: int, enabled: bool = True,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.enabled = enabled
+        self.clock = clock
+        self.state = CLOSED
+        self.generation = 0
+        self.calls: deque[tuple[float, bool, bool]] = deque()
+        self.failures = 0
+        self.slow_calls = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_successes = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def _transition(self, state: str) -> None:
+        logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        self.generation += 1
+        self.probes = 0
+        self.probe_successes = 0
+        if state == OPEN:
+            self.opened_at = self.clock()
+            self.opened += 1
+        if state == CLOSED:
+            self.calls.clear()
+            self.failures = self.slow_calls = 0
+
+    def retry_after(self) -> float:
+        """Secondi prima che il circuito aperto lasci passare le chiamate di prova."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_seconds - self.clock())
+
+    def allow(self) -> Permit | None:
+        """Decide se la chiamata può partire: None se va rifiutata, altrimenti il permesso da passare a record()."""
+        if not self.enabled:
+            return Permit(self.generation)
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self.rejected += 1
+                return None
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.probes >= self.half_open_calls:
+                self.rejected += 1
+                return None
+            self.probes += 1
+            return Permit(self.generation, probe=True)
+        return Permit(self.generation)
+
+    def record(self, permit: Permit, failed: bool | None, duration: float) -> None:
+        """Registra l'esito di una chiamata ammessa da allow().
+
+        Args:
+            permit (Permit): Il permesso restituito da allow() per questa chiamata.
+            failed (bool | None): True per errori del servizio (connessione, timeout, 5xx); None se la chiamata
+                non dice nulla sul servizio (es. cancellata): libera solo il posto di prova.
+            duration (float): Durata della chiamata in secondi.
+        """
+        if not self.enabled or permit.generation != self.generation:
+            # chiamata partita prima dell'ultima transizione: non dice nulla sullo stato attuale
+            return
+        slow = duration >= self.slow_call_seconds
+        if permit.probe:
+            self.probes = max(0, self.probes - 1)
+            if failed is None:
+                return
+            if failed or slow:
+                self._transition(OPEN)
+                return
+            self.probe_successes += 1
+            if self.probe_successes >= self.half_open_calls:
+                self._transition(CLOSED)
+            return
+        if failed is None:
+            return
+
+        now = self.clock()
+        self.calls.append((now, failed, slow))
+        self.failures += failed
+        self.slow_calls += slow
+        while self.calls and self.calls[0][0] < now - self.window:
+            _, old_failed, old_slow = self.calls.popleft()
+            self.failures -= old_failed
+            self.slow_calls -= old_slow
+        total = len(self.calls)
+        if total >= self.min_calls and (self.failures / total >= self.failure_rate
+                                        or self.slow_calls / total >= self.slow_call_rate):
+            self._transition(OPEN)
+
+    def stats(self) -> dict:
+        total = len(self.calls)
+        return {
+            "state": self.state if self.enabled else "disabled",
+            "retry_after": round(self.retry_after(), 2),
+            "calls_in_window": total,
+            "failure_rate": round(self.failures / total, 3) if total else 0.0,
+            "slow_call_rate": round(self.slow_calls / total, 3) if total else 0.0,
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from passlib.context import CryptContext
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.http_client import HttpClientException
+
+logger = get_logger(__name__)
+
+
+def build_password_context(time_cost: int, memory_cost: int, parallelism: int) -> CryptContext:
+    """Crea il CryptContext argon2id con i parametri indicati.
+
+    Gli hash creati con parametri diversi restano verificabili, ma needs_update li segnala come da aggiornare
+    (vedi auth.login, che li ricalcola al primo login riuscito).
+
+    Args:
+        time_cost (int): Numero di passate sulla memoria.
+        memory_cost (int): Memoria usata per ogni hash, in KiB.
+        parallelism (int): Thread (lane) usati per ogni hash.
+    Returns:
+        CryptContext: Contesto per hash e verifica delle password.
+    """
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__time_cost=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism,
+    )
+
+
+# Contesto condiviso da auth e users: i parametri si scelgono con python -m benchmarks.argon2_params
+pwd_context = build_password_context(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST,
+    parallelism=settings.ARGON2_PARALLELISM,
+)
+
+
+# Custom exception per coda di hashing piena
+class HashingOverloadedException(HttpClientException):
+    def __init__(self, message: str):
+        super().__init__("Service Unavailable", message, 503, "/auth")
+
+
+class HashExecutor():
+    """Esegue hash e verifiche argon2 fuori dall'event loop, su un pool di thread dedicato.
+
+    argon2-cffi rilascia il GIL durante il calcolo, quindi un pool di thread basta a non bloccare l'event loop.
+    Al massimo `workers` operazioni sono in esecuzione e al massimo `max_queue` attendono il loro turno:
+    oltre questo limite, o dopo `queue_timeout` secondi di attesa, la richiesta viene rifiutata con 503
+    invece di rallentare tutte le altre route del worker.
+    """
+
+    def __init__(self, workers: int, max_queue: int, queue_timeout: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.executor: ThreadPoolExecutor | None = None
+        self.semaphore = asyncio.Semaphore(workers)
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="argon2")
+        return self.executor
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Esegue fn(*args) sul pool di hashing, rispettando il limite di concorrenza e di coda.
+
+        Args:
+            fn (Callable): Funzione bloccante da eseguire (es. pwd_context.hash).
+        Raises:
+            HashingOverloadedException: Se la coda è piena o l'attesa supera queue_timeout.
+        Returns:
+            Any: Il risultato di fn.
+        """
+        if not self.semaphore.locked():
+            await self.semaphore.acquire()
+        else:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise HashingOverloadedException("Too many concurrent authentication requests, retry later")
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise HashingOverloadedException("Authentication queue timeout, retry later")
+            finally:
+                self.queued -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    def shutdown(self):
+        """Chiude il pool di thread (allo spegnimento dell'applicazione)."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+
+hasher = HashExecutor(
+    workers=settings.HASH_WORKERS,
+    max_queue=settings.HASH_MAX_QUEUE,
+    queue_timeout=settings.HASH_QUEUE_TIMEOUT_SECONDS,
+)
+metrics.register("hashing", hasher.stats)
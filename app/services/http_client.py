@@ -1,11 +1,21 @@
 from __future__ import annotations
 
+import asyncio
+import copy
+import math
+import time
 from enum import Enum
 
+import httpcore
 import httpx
 
+from app.core import metrics
 from app.core.config import settings
 from app.core.logging import get_logger
+from app.services.bulkhead import Bulkhead, BulkheadFull
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.retry import LatencyWindow, RetryBudget, backoff
+from app.services.singleflight import SingleFlight
 
 logger = get_logger(__name__)
 
@@ -21,12 +31,172 @@ class HttpMethod(str, Enum):
     PATCH = "PATCH"
 
 
+# Metodi che si possono ripetere senza effetti diversi da una singola esecuzione
+IDEMPOTENT_METHODS = {HttpMethod.GET, HttpMethod.PUT, HttpMethod.DELETE}
+
+
 class HttpUrl(str, Enum):
     TOKEN_SERVICE = settings.TOKEN_SERVICE_URL
     USERS_SERVICE = settings.USERS_SERVICE_URL
     SCHOOL_SERVICE = settings.SCHOOL_SERVICE_URL
 
 
+def http_version(url: HttpUrl) -> str:
+    """Protocollo configurato per il servizio (es. TOKEN_SERVICE -> settings.TOKEN_SERVICE_HTTP_VERSION)."""
+    return getattr(settings, f"{url.name}_HTTP_VERSION", "1.1")
+
+
+class HttpClientRegistry():
+    """Registro dei client httpx condivisi, uno per ogni servizio (HttpUrl).
+
+    I client mantengono un pool di connessioni keep-alive, evitando un nuovo handshake TCP/TLS per ogni richiesta.
+    Vengono creati all'avvio dell'applicazione (lifespan) e chiusi allo spegnimento.
+    Ogni servizio può usare HTTP/2 (<SERVIZIO>_HTTP_VERSION): le richieste contemporanee diventano stream
+    della stessa connessione, e una nuova connessione si apre solo quando gli stream ammessi dal server sono esauriti.
+    Attributes:
+        clients (dict): Dizionario HttpUrl -> httpx.AsyncClient.
+    """
+
+    def __init__(self):
+        self.clients: dict[HttpUrl, httpx.AsyncClient] = {}
+
+    @staticmethod
+    def _build_client(url: HttpUrl) -> httpx.AsyncClient:
+        """Crea un client httpx con i limiti del pool e il protocollo definiti nei Settings.
+
+        Args:
+            url (HttpUrl): Servizio a cui il client è dedicato.
+        """
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        version = http_version(url)
+        # "h2c": senza HTTP/1.1 httpx parla HTTP/2 direttamente anche su http:// (prior knowledge)
+        return httpx.AsyncClient(timeout=settings.HTTP_TIMEOUT, limits=limits,
+                                 http1=version != "h2c", http2=version in ("2", "h2c"))
+
+    async def start(self):
+        """Crea un client per ogni servizio definito in HttpUrl."""
+        for url in HttpUrl:
+            if url not in self.clients:
+                self.clients[url] = self._build_client(url)
+        logger.info(f"HTTP client pool started for {len(self.clients)} services")
+
+    def get(self, url: HttpUrl) -> httpx.AsyncClient:
+        """Restituisce il client dedicato al servizio, creandolo se non esiste (es. fuori dal lifespan).
+
+        Args:
+            url (HttpUrl): Servizio di destinazione.
+        Returns:
+            httpx.AsyncClient: Client condiviso per il servizio.
+        """
+        client = self.clients.get(url)
+        if client is None or client.is_closed:
+            client = self._build_client(url)
+            self.clients[url] = client
+        return client
+
+    async def close(self):
+        """Chiude tutti i client e le relative connessioni."""
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+        logger.info("HTTP client pool closed")
+
+    @staticmethod
+    def _pool_stats(client: httpx.AsyncClient) -> dict:
+        """Connessioni aperte e stream attivi del pool del client.
+
+        Legge lo stato del pool di httpcore (non esposto da httpx): con un transport diverso
+        (es. nei test) restituisce un dizionario vuoto.
+        """
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        if not isinstance(pool, httpcore.AsyncConnectionPool):
+            return {}
+        connections = pool.connections
+        http2 = [c._connection for c in connections
+                 if isinstance(getattr(c, "_connection", None), httpcore.AsyncHTTP2Connection)]
+        streams = [len(getattr(c, "_events", ())) for c in http2]
+        return {
+            "connections": len(connections),
+            "idle_connections": sum(c.is_idle() for c in connections),
+            "http2_connections": len(http2),
+            "active_streams": sum(streams),
+            "max_streams_per_connection": max(streams, default=0),
+            "streams_per_connection": round(sum(streams) / len(http2), 2) if http2 else 0.0,
+        }
+
+    def stats(self) -> dict:
+        return {url.name.lower(): {"http_version": http_version(url), **self._pool_stats(client)}
+                for url, client in self.clients.items()}
+
+
+clients = HttpClientRegistry()
+metrics.register("http_clients", clients.stats)
+
+
+def build_breaker(url: HttpUrl) -> CircuitBreaker:
+    return CircuitBreaker(
+        name=url.name.lower(),
+        window=settings.CIRCUIT_BREAKER_WINDOW_SECONDS,
+        min_calls=settings.CIRCUIT_BREAKER_MIN_CALLS,
+        failure_rate=settings.CIRCUIT_BREAKER_FAILURE_RATE,
+        slow_call_seconds=settings.CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+        slow_call_rate=settings.CIRCUIT_BREAKER_SLOW_CALL_RATE,
+        open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+        half_open_calls=settings.CIRCUIT_BREAKER_HALF_OPEN_CALLS,
+        enabled=settings.CIRCUIT_BREAKER_ENABLED,
+    )
+
+
+# Un circuit breaker per ogni servizio, condiviso da tutte le richieste del processo
+breakers: dict[HttpUrl, CircuitBreaker] = {url: build_breaker(url) for url in HttpUrl}
+metrics.register("circuit_breakers", lambda: {breaker.name: breaker.stats() for breaker in breakers.values()})
+
+
+def build_bulkhead(url: HttpUrl) -> Bulkhead:
+    return Bulkhead(
+        name=url.name.lower(),
+        max_concurrent=getattr(settings, f"{url.name}_MAX_CONCURRENCY", 0),
+        max_queue=getattr(settings, f"{url.name}_MAX_QUEUE", 0),
+        queue_timeout=settings.BULKHEAD_QUEUE_TIMEOUT_SECONDS,
+    )
+
+
+# Limite di richieste contemporanee per ogni servizio (isolamento tra servizi)
+bulkheads: dict[HttpUrl, Bulkhead] = {url: build_bulkhead(url) for url in HttpUrl}
+metrics.register("bulkheads", lambda: {bulkhead.name: bulkhead.stats() for bulkhead in bulkheads.values()})
+
+
+def build_retry_budget(url: HttpUrl) -> RetryBudget:
+    return RetryBudget(
+        name=url.name.lower(),
+        ratio=settings.RETRY_BUDGET_RATIO,
+        min_per_second=settings.RETRY_BUDGET_MIN_PER_SECOND,
+        capacity=settings.RETRY_BUDGET_MAX_TOKENS,
+    )
+
+
+# Budget dei tentativi aggiuntivi (retry e hedging) e latenze recenti di ogni servizio
+retry_budgets: dict[HttpUrl, RetryBudget] = {url: build_retry_budget(url) for url in HttpUrl}
+latencies: dict[HttpUrl, LatencyWindow] = {url: LatencyWindow() for url in HttpUrl}
+hedges_won: dict[HttpUrl, int] = {url: 0 for url in HttpUrl}
+metrics.register("retries", lambda: {
+    url.name.lower(): {
+        **retry_budgets[url].stats(),
+        "hedge_enabled": getattr(settings, f"{url.name}_HEDGE_ENABLED", False),
+        "hedges_won": hedges_won[url],
+        "latency_p95": latencies[url].percentile(0.95),
+    } for url in HttpUrl
+})
+
+# GET identiche in corso nello stesso momento: una sola richiesta al servizio, il risultato è condiviso
+singleflight = SingleFlight()
+metrics.register("singleflight", singleflight.stats)
+
+
 class HttpParams():
     """Rappresenta i parametri di una richiesta HTTP.
     Attributes:
@@ -107,6 +277,61 @@ class HttpClientException(Exception):
         self.url = url
 
 
+# Custom exception per servizio non disponibile (circuit breaker aperto): la richiesta non viene inviata
+class CircuitOpenException(HttpClientException):
+    def __init__(self, service: str, retry_after: float, url: str):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__("Service Unavailable",
+                         f"{service} is unavailable, retry in {self.retry_after}s", 503, url)
+
+
+def retry_after_headers(e: HttpClientException) -> dict | None:
+    """Header Retry-After per le eccezioni che indicano quando riprovare (es. circuit breaker aperto), altrimenti None.
+
+    Args:
+        e (HttpClientException): Eccezione da convertire in risposta HTTP.
+    """
+    retry_after = getattr(e, "retry_after", None)
+    return {"Retry-After": str(retry_after)} if retry_after is not None else None
+
+
+# Custom exception per troppe richieste in corso verso il servizio (bulkhead pieno): la richiesta non viene inviata
+class UpstreamOverloadedException(HttpClientException):
+    def __init__(self, service: str, url: str):
+        super().__init__("Service Unavailable", f"{service} is overloaded, retry later", 503, url)
+
+
+# Custom exception per errori di connessione con il servizio (connessione rifiutata o caduta, timeout):
+# 503 se la richiesta non è arrivata al servizio, 502 se è partita ma non è arrivata una risposta
+class UpstreamConnectionException(HttpClientException):
+    def __init__(self, service: str, url: str, cause: str, sent: bool, timeout: bool):
+        if sent:
+            super().__init__("Bad Gateway", f"{service} connection failed: {cause}", 502, url)
+        else:
+            super().__init__("Service Unavailable", f"{service} is unreachable: {cause}", 503, url)
+        self.sent = sent
+        self.timeout = timeout
+
+    def retryable(self, method: HttpMethod) -> bool:
+        """Se ha senso ripetere la richiesta: sempre se non è arrivata al servizio (connessione non riuscita),
+        altrimenti solo per i metodi idempotenti, e non dopo un timeout (il servizio è lento: ripetere
+        raddoppierebbe l'attesa)."""
+        if not self.sent:
+            return True
+        return method in IDEMPOTENT_METHODS and not self.timeout
+
+
+def http_error(service: str, url: str, e: httpx.HTTPError) -> HttpClientException:
+    """Eccezione da sollevare per un errore di httpx: UpstreamConnectionException per gli errori di connessione."""
+    if not isinstance(e, httpx.TransportError):
+        return HttpClientException("Internal Server Error", server_message="Swiggity Swoggity, U won't find my log",
+                                   url=url, status_code=500)
+    # ConnectError / ConnectTimeout / PoolTimeout (nessuna connessione libera nel pool): la richiesta non è partita
+    not_sent = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+    return UpstreamConnectionException(service, url, type(e).__name__, sent=not not_sent,
+                                       timeout=isinstance(e, httpx.TimeoutException) and not not_sent)
+
+
 class HttpClientResponse():
     """Rappresenta la risposta di un client HTTP.
     Attributes:
@@ -119,12 +344,35 @@ class HttpClientResponse():
         self.data = data
 
 
+def request_key(url: HttpUrl, method: HttpMethod, endpoint: str, params: dict, headers: dict) -> tuple:
+    """Chiave che identifica le richieste equivalenti: stesso servizio, metodo, endpoint, parametri e headers.
+
+    Parametri e headers vengono ordinati (e i nomi degli headers portati in minuscolo), così l'ordine in cui
+    sono stati aggiunti non conta. Gli headers fanno parte della chiave perché la risposta può dipendere da
+    chi la chiede (es. Authorization).
+    """
+    return (
+        url.name, method.value, endpoint,
+        tuple(sorted((str(k), repr(v)) for k, v in params.items())),
+        tuple(sorted((str(k).lower(), str(v)) for k, v in headers.items())),
+    )
+
+
+def _share_response(response: HttpClientResponse) -> HttpClientResponse:
+    # ogni chiamante riceve la propria copia dei dati, che può modificare senza toccare quelli degli altri
+    return HttpClientResponse(status_code=response.status_code, data=copy.deepcopy(response.data))
+
+
 async def send_request(url: HttpUrl, method: HttpMethod, endpoint: str, _params: HttpParams = None,
-                       _headers: HttpHeaders = None) -> HttpClientResponse:
+                       _headers: HttpHeaders = None, coalesce: bool = True) -> HttpClientResponse:
     """Gestisce la risposta della richiesta HTTP.
 
     Ritorna HttpClientResponse o solleva HttpClientException in caso di errore.
-    Utilizza httpx.AsyncClient per le richieste asincrone.
+    Le GET identiche (vedi request_key) già in corso vengono unite: parte una sola richiesta al servizio e tutti
+    i chiamanti ricevono la sua risposta, o il suo errore. Si disattiva con coalesce=False (es. quando serve
+    una lettura successiva a una scrittura) o globalmente con SINGLEFLIGHT_ENABLED.
+    Gli errori di connessione vengono ripetuti entro il retry budget del servizio, e le GET verso i servizi
+    con hedging attivo inviano una seconda richiesta se la prima supera il p95 delle latenze recenti.
 
     Args:
         url (HttpUrl): Base URL del servizio.
@@ -132,18 +380,126 @@ async def send_request(url: HttpUrl, method: HttpMethod, endpoint: str, _params:
         endpoint (str): Endpoint specifico del servizio.
         _params (HttpParams, optional): Parametri della query. Defaults to None.
         _headers (HttpHeaders, optional): Headers della richiesta. Defaults to None.
+        coalesce (bool, optional): Se unire la richiesta a una identica già in corso. Defaults to True.
 
     Raises:
+        CircuitOpenException: Se il circuit breaker del servizio è aperto.
+        UpstreamOverloadedException: Se il bulkhead del servizio rifiuta la richiesta.
+        UpstreamConnectionException: Se la connessione con il servizio fallisce anche dopo i retry.
         HttpClientException: In caso di errore nella richiesta HTTP.
     Returns:
         HttpClientResponse: Risposta della richiesta HTTP.
     """
+    if not (coalesce and method == HttpMethod.GET and settings.SINGLEFLIGHT_ENABLED):
+        return await _send(url, method, endpoint, _params, _headers)
+    params = _params.to_dict() if _params else {}
+    headers = _headers.to_dict() if _headers else HttpHeaders().to_dict()
+    key = request_key(url, method, endpoint, params, headers)
+    return await singleflight.do(key, lambda: _send(url, method, endpoint, _params, _headers),
+                                 share=_share_response)
+
+
+def hedge_delay(url: HttpUrl, method: HttpMethod) -> float | None:
+    """Dopo quanti secondi inviare la seconda richiesta (hedging), None se non va inviata.
+
+    Solo per le GET verso i servizi con <SERVIZIO>_HEDGE_ENABLED, e solo quando ci sono abbastanza latenze
+    registrate per stimarne il percentile HEDGE_PERCENTILE.
+    """
+    if method != HttpMethod.GET or not getattr(settings, f"{url.name}_HEDGE_ENABLED", False):
+        return None
+    delay = latencies[url].percentile(settings.HEDGE_PERCENTILE, settings.HEDGE_MIN_SAMPLES)
+    return None if delay is None else max(delay, settings.HEDGE_MIN_DELAY_SECONDS)
+
+
+async def _send(url: HttpUrl, method: HttpMethod, endpoint: str, _params: HttpParams = None,
+                _headers: HttpHeaders = None) -> HttpClientResponse:
+    """Invia la richiesta con retry e, per le GET che lo prevedono, con hedging (vedi hedge_delay)."""
+    retry_budgets[url].deposit()
+    delay = hedge_delay(url, method)
+    if delay is None:
+        return await _send_with_retries(url, method, endpoint, _params, _headers)
+    return await _send_hedged(url, method, endpoint, _params, _headers, delay)
 
-    url = f"{url.value}{API_PREFIX}{endpoint}"
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        headers = _headers.to_dict() if _headers else HttpHeaders().to_dict()
-        params = _params.to_dict() if _params else {}
+
+async def _send_hedged(url: HttpUrl, method: HttpMethod, endpoint: str, _params: HttpParams | None,
+                       _headers: HttpHeaders | None, delay: float) -> HttpClientResponse:
+    """Invia la richiesta e, se dopo `delay` secondi non ha ancora risposto, ne invia una seconda identica.
+
+    Vince la prima risposta, l'altra richiesta viene cancellata. Se una delle due fallisce per un errore del
+    servizio (5xx, connessione) si attende l'altra. La seconda richiesta consuma un token del retry budget:
+    a budget esaurito si attende solo la prima.
+    """
+    attempts = [asyncio.ensure_future(_send_with_retries(url, method, endpoint, _params, _headers))]
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done and retry_budgets[url].withdraw("hedge"):
+            attempts.append(asyncio.ensure_future(_send_with_retries(url, method, endpoint, _params, _headers)))
+        pending, error = set(attempts), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                e = task.exception()
+                if e is None:
+                    if task is not attempts[0]:
+                        hedges_won[url] += 1
+                    return task.result()
+                if not isinstance(e, HttpClientException) or e.status_code < 500:
+                    raise e  # risposta definitiva del servizio (es. 404): l'altra richiesta non la cambierebbe
+                error = error or e
+        raise error
+    finally:
+        for task in attempts:
+            task.cancel()
+
+
+async def _send_with_retries(url: HttpUrl, method: HttpMethod, endpoint: str, _params: HttpParams | None,
+                             _headers: HttpHeaders | None) -> HttpClientResponse:
+    """Invia la richiesta, ripetendola in caso di errore di connessione (vedi UpstreamConnectionException.retryable).
+
+    Al massimo HTTP_RETRY_ATTEMPTS tentativi aggiuntivi, con backoff esponenziale e jitter, ognuno dei quali
+    consuma un token del retry budget del servizio: a budget esaurito l'errore viene restituito subito.
+    """
+    attempt = 0
+    while True:
         try:
+            return await _send_request(url, method, endpoint, _params, _headers)
+        except UpstreamConnectionException as e:
+            if (attempt >= settings.HTTP_RETRY_ATTEMPTS or not e.retryable(method)
+                    or not retry_budgets[url].withdraw("retry")):
+                raise
+            attempt += 1
+            delay = backoff(attempt, settings.HTTP_RETRY_BACKOFF_SECONDS, settings.HTTP_RETRY_BACKOFF_MAX_SECONDS)
+            logger.warning(f"Retrying {method.value} {e.url} in {delay:.3f}s (retry {attempt})")
+            await asyncio.sleep(delay)
+
+
+async def _send_request(url: HttpUrl, method: HttpMethod, endpoint: str, _params: HttpParams = None,
+                        _headers: HttpHeaders = None) -> HttpClientResponse:
+    """Invia la richiesta al servizio (senza unirla ad altre, vedi send_request).
+
+    Utilizza il client httpx condiviso del servizio (vedi HttpClientRegistry), riusando le connessioni del pool.
+    Prima dell'invio la richiesta passa dal circuit breaker del servizio (503 immediato se aperto) e dal suo
+    bulkhead (503 immediato se troppe richieste sono già in corso o in attesa).
+
+    Raises:
+        CircuitOpenException: Se il circuit breaker del servizio è aperto.
+        UpstreamOverloadedException: Se il bulkhead del servizio rifiuta la richiesta.
+        HttpClientException: In caso di errore nella richiesta HTTP.
+    """
+
+    client = clients.get(url)
+    breaker = breakers[url]
+    service, url = url, f"{url.value}{API_PREFIX}{endpoint}"
+    permit = breaker.allow()
+    if permit is None:
+        raise CircuitOpenException(service.name.lower(), breaker.retry_after(), url)
+    headers = _headers.to_dict() if _headers else HttpHeaders().to_dict()
+    params = _params.to_dict() if _params else {}
+    failed = None  # esito per il circuit breaker: None se la richiesta non arriva a una risposta o a un errore di rete
+    started = time.monotonic()
+    try:
+        async with bulkheads[service]:
+            started = time.monotonic()  # l'attesa in coda non conta come lentezza del servizio
             match method:
                 case HttpMethod.GET:
                     resp = await client.get(url, headers=headers, params=params)
@@ -157,27 +513,36 @@ async def send_request(url: HttpUrl, method: HttpMethod, endpoint: str, _params:
                     resp = await client.patch(url, headers=headers, json=params)
                 case _:
                     raise ValueError(f"Unsupported HTTP method: {method}")
-        except httpx.HTTPError as e:
-            logger.error(f"HTTP request to {url} failed: {str(e)}")
-            raise HttpClientException("Internal Server Error", server_message="Swiggity Swoggity, U won't find my log",
-                                      url=url, status_code=500)
-        except Exception as e:
-            logger.error(f"Unexpected error during HTTP request to {url}: {str(e)}")
-            raise HttpClientException("Internal Server Error", server_message="Swiggity Swoggity, U won't find my log",
-                                      url=url, status_code=500)
-
-        if resp.status_code >= 400:
-            json = resp.json()
-            if json["detail"]:
-                server_message = json["detail"]
-            else:
-                server_message = resp.text
-            raise HttpClientException(f"HTTP Error {resp.status_code}", server_message=server_message,
-                                      url=url, status_code=resp.status_code)
-
-        json_data = None
-        try:
-            json_data = resp.json()
-        except Exception:
-            pass
-        return HttpClientResponse(status_code=resp.status_code, data=json_data)
+        failed = resp.status_code >= 500
+    except BulkheadFull as e:
+        logger.warning(f"HTTP request to {url} rejected: {str(e)}")
+        raise UpstreamOverloadedException(service.name.lower(), url)
+    except httpx.HTTPError as e:
+        failed = True
+        logger.error(f"HTTP request to {url} failed: {str(e)}")
+        raise http_error(service.name.lower(), url, e)
+    except Exception as e:
+        logger.error(f"Unexpected error during HTTP request to {url}: {str(e)}")
+        raise HttpClientException("Internal Server Error", server_message="Swiggity Swoggity, U won't find my log",
+                                  url=url, status_code=500)
+    finally:
+        elapsed = time.monotonic() - started
+        breaker.record(permit, failed, elapsed)
+        if failed is False:
+            latencies[service].record(elapsed)
+
+    if resp.status_code >= 400:
+        json = resp.json()
+        if json["detail"]:
+            server_message = json["detail"]
+        else:
+            server_message = resp.text
+        raise HttpClientException(f"HTTP Error {resp.status_code}", server_message=server_message,
+                                  url=url, status_code=resp.status_code)
+
+    json_data = None
+    try:
+        json_data = resp.json()
+    except Exception:
+        pass
+    return HttpClientResponse(status_code=resp.status_code, data=json_data)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from jose import jwt, JWTError, ExpiredSignatureError
+from jose.exceptions import JWTClaimsError
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.http_client import HttpClientException, HttpMethod, HttpUrl, send_request
+
+logger = get_logger(__name__)
+
+
+class LocalTokenVerifier():
+    """Verifica i JWT direttamente nel gateway, senza il round trip verso /token/verify.
+
+    Controlla firma, scadenza e claims (issuer/audience se configurati) usando il segreto condiviso
+    oppure la chiave pubblica del servizio token, che viene scaricata e tenuta in cache.
+    Quando la chiave non è nota o la firma non torna (es. rotazione), verify restituisce None
+    e il chiamante ripiega sulla verifica remota.
+    Attributes:
+        keys (dict): Chiavi note, indicizzate per kid (None se il servizio non usa kid).
+        fetched_at (float): Istante (monotonic) dell'ultimo download delle chiavi.
+    """
+
+    def __init__(self):
+        self.keys: dict[str | None, str | dict] = {}
+        self.fetched_at: float = 0.0
+        self._lock = asyncio.Lock()
+
+    def _load_static_key(self) -> bool:
+        """Carica il segreto condiviso o la chiave pubblica da file, se configurati.
+
+        Returns:
+            bool: True se è stata caricata una chiave statica.
+        """
+        if settings.JWT_SECRET:
+            self.keys = {None: settings.JWT_SECRET}
+            return True
+        if settings.PUBLIC_KEY:
+            with open(settings.PUBLIC_KEY) as f:
+                self.keys = {None: f.read()}
+            return True
+        return False
+
+    async def refresh_keys(self, force: bool = False) -> None:
+        """Scarica le chiavi pubbliche dal servizio token.
+
+        Accetta sia una singola chiave ({"public_key": PEM, "kid": ...}) sia un JWKS ({"keys": [...]}).
+        I download sono limitati a uno ogni JWT_KEY_REFRESH_MIN_SECONDS, anche se forzati.
+
+        Args:
+            force (bool, optional): Riscarica anche se la cache non è scaduta. Defaults to False.
+        """
+        async with self._lock:
+            age = time.monotonic() - self.fetched_at
+            if self.keys and not force and age < settings.JWT_KEY_CACHE_SECONDS:
+                return
+            if self.fetched_at and age < settings.JWT_KEY_REFRESH_MIN_SECONDS:
+                return
+            self.fetched_at = time.monotonic()
+            if self._load_static_key():
+                return
+            try:
+                response = await send_request(
+                    url=HttpUrl.TOKEN_SERVICE,
+                    method=HttpMethod.GET,
+                    endpoint=settings.JWT_PUBLIC_KEY_ENDPOINT
+                )
+            except HttpClientException as e:
+                logger.error(f"Unable to fetch token service public key: {e.server_message}")
+                return
+            data = response.data or {}
+            if "keys" in data:
+                self.keys = {key.get("kid"): key for key in data["keys"]}
+            elif "public_key" in data:
+                self.keys = {data.get("kid"): data["public_key"]}
+            logger.info(f"Loaded {len(self.keys)} token verification keys")
+
+    async def _key_for(self, kid: str | None) -> str | dict | None:
+        """Restituisce la chiave per il kid indicato, riscaricando le chiavi se il kid è sconosciuto."""
+        await self.refresh_keys()
+        if kid not in self.keys:
+            await self.refresh_keys(force=True)
+        return self.keys.get(kid)
+
+    def _decode(self, token: str, key: str | dict, verify_exp: bool = True) -> dict:
+        options = {"verify_exp": verify_exp, "verify_aud": bool(settings.JWT_AUDIENCE),
+                   "leeway": settings.JWT_LEEWAY_SECONDS}
+        return jwt.decode(
+            token,
+            key,
+            algorithms=[settings.JWT_ALGORITHM],
+            options=options,
+            audience=settings.JWT_AUDIENCE or None,
+            issuer=settings.JWT_ISSUER or None,
+        )
+
+    async def verify(self, token: str) -> dict | None:
+        """Verifica il token localmente.
+
+        Args:
+            token (str): JWT da verificare.
+        Returns:
+            dict | None: Payload nello stesso formato di /token/verify ({"verified", "expired", ...claims}),
+                oppure None se il token non può essere verificato localmente.
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError:
+            return {"verified": False, "expired": False}
+
+        kid = header.get("kid")
+        key = await self._key_for(kid)
+        if key is None:
+            return None
+
+        payload = self._verify_with_key(token, key)
+        if payload is None:
+            # Firma non valida con la chiave in cache: potrebbe essere stata ruotata
+            await self.refresh_keys(force=True)
+            new_key = self.keys.get(kid)
+            if new_key is not None and new_key != key:
+                payload = self._verify_with_key(token, new_key)
+        return payload
+
+    def _verify_with_key(self, token: str, key: str | dict) -> dict | None:
+        """Verifica il token con una chiave specifica. Restituisce None se la firma non corrisponde."""
+        try:
+            claims = self._decode(token, key)
+            return {**claims, "verified": True, "expired": False}
+        except ExpiredSignatureError:
+            try:
+                claims = self._decode(token, key, verify_exp=False)
+            except JWTError:
+                return None
+            return {**claims, "verified": True, "expired": True}
+        except JWTClaimsError:
+            return {"verified": False, "expired": False}
+        except JWTError:
+            return None
+
+
+local_verifier = LocalTokenVerifier()
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.hashing import hasher
+from app.services.http_client import HttpClientException
+
+logger = get_logger(__name__)
+
+
+# Custom exception per richieste oltre il limite
+class RateLimitedException(HttpClientException):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__("Too Many Requests", message, 429, "/auth")
+        self.retry_after = max(1, math.ceil(retry_after))  # secondi interi per l'header Retry-After
+
+
+class MemoryBuckets():
+    """Token bucket in memoria, locali al processo. Le chiavi meno usate vengono scartate oltre max_keys."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        """Preleva un gettone dal bucket.
+
+        Args:
+            key (str): Chiave del bucket (es. "email:mario@example.com").
+            rate (float): Gettoni aggiunti al secondo.
+            burst (float): Capacità massima del bucket.
+            now (float): Istante corrente (time.time()).
+        Returns:
+            float: 0 se il gettone è stato prelevato, altrimenti i secondi da attendere.
+        """
+        return self.take_all([(key, rate, burst)], now)[0]
+
+    def take_all(self, buckets: list[tuple[str, float, float]], now: float) -> list[float]:
+        """Preleva un gettone da ciascun bucket, solo se tutti ne hanno almeno uno (altrimenti da nessuno).
+
+        Args:
+            buckets (list): Bucket come (chiave, gettoni al secondo, capacità).
+            now (float): Istante corrente (time.time()).
+        Returns:
+            list[float]: Per ogni bucket 0, o i secondi da attendere se è vuoto.
+        """
+        current = []
+        for key, rate, burst in buckets:
+            tokens, updated = self.buckets.pop(key, (burst, now))
+            current.append(min(burst, tokens + (now - updated) * rate))
+        waits = [0.0 if tokens >= 1 else (1 - tokens) / rate for tokens, (_, rate, _) in zip(current, buckets)]
+        spent = 0 if any(waits) else 1
+        for tokens, (key, _, _) in zip(current, buckets):
+            self.buckets[key] = (tokens - spent, now)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return waits
+
+
+class SqliteBuckets():
+    """Token bucket in un file SQLite condiviso dai worker della stessa macchina (es. in /dev/shm).
+
+    Controllo e prelievo da tutti i bucket della richiesta avvengono in un'unica transazione (BEGIN IMMEDIATE):
+    ogni bucket viene ricaricato e decrementato solo se contiene almeno un gettone. Le chiamate possono attendere
+    il lock di un altro worker (fino a 1 s), quindi vengono eseguite su un thread dedicato (executor),
+    non nell'event loop.
+    """
+
+    TAKE = (
+        "INSERT INTO buckets (key, tokens, updated) VALUES (:key, :burst - 1, :now) "
+        "ON CONFLICT(key) DO UPDATE SET tokens = MIN(:burst, tokens + (:now - updated) * :rate) - 1, updated = :now "
+        "WHERE MIN(:burst, tokens + (:now - updated) * :rate) >= 1 "
+        "RETURNING tokens"
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        # un solo thread usa la connessione: le operazioni sono serializzate senza lock
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="login-limit")
+        self.connection = sqlite3.connect(path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=OFF")  # i limiti non devono sopravvivere a un crash
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        return self.take_all([(key, rate, burst)], now)[0]
+
+    def take_all(self, buckets: list[tuple[str, float, float]], now: float) -> list[float]:
+        """Come MemoryBuckets.take_all, in una transazione condivisa con gli altri worker."""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            waits = []
+            for key, rate, burst in buckets:
+                row = self.connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = min(burst, row[0] + (now - row[1]) * rate) if row else burst
+                waits.append(0.0 if tokens >= 1 else (1 - tokens) / rate)
+            if not any(waits):
+                for key, rate, burst in buckets:
+                    self.connection.execute(self.TAKE, {"key": key, "rate": rate, "burst": burst, "now": now})
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return waits
+
+
+class LoginLimiter():
+    """Controllo di ammissione di login e registrazione, prima di qualsiasi hash argon2.
+
+    Ogni richiesta preleva un gettone dal bucket del proprio IP, da quello dell'email e da quello globale
+    (hash al secondo per tutti i worker); se uno è vuoto risponde 429 con Retry-After, senza consumare
+    i gettoni degli altri. Rifiuta inoltre quando la coda del pool di hashing di questo worker è già piena,
+    invece di rispondere 503 dopo l'attesa.
+    I limiti sono espressi in richieste al minuto (IP, email) e al secondo (globale); 0 disattiva il limite.
+    """
+
+    def __init__(self, store: MemoryBuckets | SqliteBuckets, enabled: bool = True):
+        self.store = store
+        self.enabled = enabled
+        self.allowed = 0
+        self.rejected = {"ip": 0, "email": 0, "global": 0, "hash_queue": 0}
+
+    def _limits(self, ip: str | None, email: str | None) -> list[tuple[str, str, float, float]]:
+        limits = []
+        if ip and settings.LOGIN_LIMIT_IP_PER_MINUTE > 0:
+            limits.append(("ip", f"ip:{ip}", settings.LOGIN_LIMIT_IP_PER_MINUTE / 60, settings.LOGIN_LIMIT_IP_BURST))
+        if email and settings.LOGIN_LIMIT_EMAIL_PER_MINUTE > 0:
+            limits.append(("email", f"email:{email.strip().lower()}", settings.LOGIN_LIMIT_EMAIL_PER_MINUTE / 60,
+                           settings.LOGIN_LIMIT_EMAIL_BURST))
+        if settings.LOGIN_LIMIT_GLOBAL_PER_SECOND > 0:
+            limits.append(("global", "global", settings.LOGIN_LIMIT_GLOBAL_PER_SECOND,
+                           settings.LOGIN_LIMIT_GLOBAL_BURST))
+        return limits
+
+    async def check(self, ip: str | None, email: str | None) -> None:
+        """Ammette o rifiuta una richiesta di login/registrazione.
+
+        Args:
+            ip (str | None): Indirizzo del client.
+            email (str | None): Email indicata nella richiesta.
+        Raises:
+            RateLimitedException: Se un limite è superato (429, con i secondi da attendere).
+        """
+        if not self.enabled:
+            return
+        if hasher.queued >= hasher.max_queue:
+            self.rejected["hash_queue"] += 1
+            raise RateLimitedException("Too many concurrent authentication requests, retry later",
+                                       hasher.queue_timeout)
+
+        limits = self._limits(ip, email)
+        buckets = [(key, rate, burst) for _, key, rate, burst in limits]
+        now = time.time()
+        try:
+            if isinstance(self.store, SqliteBuckets):
+                waits = await asyncio.get_running_loop().run_in_executor(self.store.executor, self.store.take_all,
+                                                                         buckets, now)
+            else:
+                waits = self.store.take_all(buckets, now)
+        except sqlite3.Error as e:
+            # il limite è una protezione: se il backend non risponde la richiesta passa
+            logger.error(f"Login rate limit backend error: {e}")
+            waits = []
+        for (name, *_), retry_after in zip(limits, waits):
+            if retry_after > 0:
+                self.rejected[name] += 1
+                raise RateLimitedException("Too many authentication attempts, retry later", max(waits))
+        self.allowed += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.store).__name__,
+            "allowed": self.allowed,
+            "rejected": dict(self.rejected),
+        }
+
+
+def build_store() -> MemoryBuckets | SqliteBuckets:
+    if settings.LOGIN_LIMIT_SQLITE_PATH:
+        return SqliteBuckets(settings.LOGIN_LIMIT_SQLITE_PATH)
+    return MemoryBuckets()
+
+
+login_limiter = LoginLimiter(store=build_store(), enabled=settings.LOGIN_LIMIT_ENABLED)
+metrics.register("login_limiter", login_limiter.stats)
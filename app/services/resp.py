@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import asyncio
+from urllib.parse import unquote, urlparse
+
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Errore restituito dal server (risposta "-ERR ...")
+class RespError(Exception):
+    pass
+
+
+def encode_command(*args) -> bytes:
+    """Codifica un comando come array RESP di bulk string (es. ("GET", "k") -> b"*2\\r\\n$3\\r\\nGET\\r\\n$1\\r\\nk\\r\\n")."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Legge una risposta RESP2. Gli errori vengono restituiti come RespError (non sollevati), così in una
+    pipeline si leggono comunque tutte le risposte e la connessione resta allineata."""
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the server")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        return RespError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2].decode()
+    if kind == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise ConnectionError(f"Unexpected reply from the server: {line[:32]!r}")
+
+
+def raise_errors(reply):
+    """Solleva il primo errore contenuto nella risposta (anche dentro l'array di EXEC)."""
+    if isinstance(reply, RespError):
+        raise reply
+    if isinstance(reply, list):
+        for item in reply:
+            raise_errors(item)
+    return reply
+
+
+class RespClient():
+    """Client minimo per il protocollo Redis (RESP2), con un pool di connessioni.
+
+    Funziona con qualsiasi server compatibile (Redis, Valkey, KeyDB, Dragonfly...). Supporta solo quello che
+    serve al gateway: comandi singoli e pipeline (più comandi in un solo round trip, atomici se racchiusi
+    tra MULTI ed EXEC). URL nel formato redis://[:password@]host[:port][/db].
+    """
+
+    def __init__(self, url: str, pool_size: int = 10, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(pool_size)
+        self.idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self.commands = 0
+        self.connections = 0
+        self.errors = 0
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            writer.write(b"".join(encode_command(*command) for command in setup))
+            await writer.drain()
+            for _ in setup:
+                raise_errors(await read_reply(reader))
+        self.connections += 1
+        return reader, writer
+
+    async def pipeline(self, commands: list[tuple]) -> list:
+        """Invia più comandi con un solo round trip e restituisce le risposte nello stesso ordine.
+
+        Raises:
+            RespError: Se il server risponde con un errore a uno dei comandi.
+            ConnectionError | TimeoutError: Se la connessione cade o il server non risponde entro il timeout.
+        """
+        async with self.slots:
+            connection = self.idle.pop() if self.idle else None
+            try:
+                async with asyncio.timeout(self.timeout):
+                    if connection is None:
+                        connection = await self._connect()
+                    reader, writer = connection
+                    writer.write(b"".join(encode_command(*command) for command in commands))
+                    await writer.drain()
+                    replies = [await read_reply(reader) for _ in commands]
+            except BaseException:
+                # connessione in uno stato sconosciuto (risposte non lette): non torna nel pool
+                self.errors += 1
+                if connection is not None:
+                    connection[1].close()
+                raise
+            self.idle.append(connection)
+        self.commands += len(commands)
+        for reply in replies:
+            raise_errors(reply)
+        return replies
+
+    async def execute(self, *args):
+        """Esegue un singolo comando e restituisce la risposta."""
+        return (await self.pipeline([args]))[0]
+
+    async def close(self) -> None:
+        idle, self.idle = self.idle, []
+        for _, writer in idle:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception as e:
+                logger.debug(f"Error closing RESP connection: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "address": f"{self.host}:{self.port}/{self.db}",
+            "idle_connections": len(self.idle),
+            "connections_opened": self.connections,
+            "commands": self.commands,
+            "errors": self.errors,
+        }
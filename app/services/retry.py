@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import random
+import time
+from collections import deque
+from typing import Callable
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Attesa prima del tentativo `attempt` (1, 2, ...): backoff esponenziale con jitter completo.
+
+    Un valore casuale tra 0 e min(cap, base * 2^(attempt-1)): i client che hanno perso la connessione nello
+    stesso momento non riprovano tutti insieme.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class RetryBudget():
+    """Token bucket che limita i tentativi aggiuntivi (retry e richieste hedged) verso un servizio.
+
+    Ogni richiesta originale aggiunge `ratio` token, e in più se ne aggiungono `min_per_second` al secondo;
+    ogni tentativo aggiuntivo ne consuma uno. Così i tentativi aggiuntivi restano circa una quota `ratio`
+    del traffico: se il servizio è giù, i retry finiscono presto invece di moltiplicare il carico.
+    Il bucket contiene al massimo `capacity` token (parte pieno).
+    """
+
+    def __init__(self, name: str, ratio: float, min_per_second: float, capacity: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.spent = {"retry": 0, "hedge": 0}
+        self.exhausted = 0
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self) -> None:
+        """Da chiamare una volta per ogni richiesta originale."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self, reason: str) -> bool:
+        """Consuma un token per un tentativo aggiuntivo; False se il budget è esaurito.
+
+        Args:
+            reason (str): "retry" o "hedge", solo per le statistiche.
+        """
+        self._refill()
+        if self.tokens < 1:
+            self.exhausted += 1
+            return False
+        self.tokens -= 1
+        self.spent[reason] += 1
+        return True
+
+    def stats(self) -> dict:
+        self._refill()
+        return {
+            "tokens": round(self.tokens, 2),
+            "retries": self.spent["retry"],
+            "hedges": self.spent["hedge"],
+            "exhausted": self.exhausted,
+        }
+
+
+class LatencyWindow():
+    """Durate delle ultime `size` chiamate riuscite verso un servizio, per calcolarne i percentili."""
+
+    def __init__(self, size: int = 500):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def record(self, duration: float) -> None:
+        self.samples.append(duration)
+
+    def percentile(self, q: float, min_samples: int = 1) -> float | None:
+        """Percentile q (0..1) delle durate registrate; None se i campioni sono meno di min_samples."""
+        if len(self.samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.broker import AsyncBrokerSingleton
+from app.services.session_store import SessionStore, session_store
+from app.services.token_cache import token_cache
+
+logger = get_logger(__name__)
+
+RABBIT_REVOKE_TYPE = "REVOKE"
+
+
+class RevokedSessions():
+    """Insieme in memoria delle sessioni revocate (logout o bloccate per riuso del refresh token).
+
+    Gli id delle sessioni sono interi progressivi, quindi l'insieme è una bitmap: un bit per id, esatta
+    (nessun falso positivo) e compatta (1 milione di sessioni = 125 KB). La bitmap parte dall'id più basso
+    revocato (`base`), così anche id che partono da un valore alto (MemorySessionStore) occupano poco. Viene popolata all'avvio dalle
+    sessioni revocate non ancora scadute e aggiornata dai messaggi dell'exchange fanout di revoca, così
+    ogni worker e ogni replica rifiuta le sessioni revocate senza interrogare l'archivio delle sessioni.
+    Se il broker non è raggiungibile, un task in background riprova la sottoscrizione ogni `retry_interval`
+    secondi e nel frattempo ricarica la bitmap dall'archivio; le revoche fatte dal processo in quel periodo
+    vengono pubblicate appena la sottoscrizione riesce.
+    Attributes:
+        bits (bytearray): Bitmap degli id revocati, a partire da base.
+        base (int): Id corrispondente al primo bit (multiplo di 8).
+        count (int): Numero di sessioni revocate nella bitmap.
+    """
+
+    def __init__(self, exchange: str, store: SessionStore = session_store, retry_interval: float = 10.0):
+        self.exchange = exchange
+        self.store = store
+        self.retry_interval = retry_interval
+        self.bits = bytearray()
+        self.base = 0
+        self.count = 0
+        self.broker: AsyncBrokerSingleton | None = None
+        self.queue_name: str | None = None
+        self.task: asyncio.Task | None = None
+        self.unpublished: list[int] = []
+        self.published = 0
+        self.received = 0
+        self.publish_errors = 0
+
+    def __contains__(self, session_id: int) -> bool:
+        if not isinstance(session_id, int) or session_id < self.base:
+            return False
+        index = (session_id - self.base) >> 3
+        return index < len(self.bits) and bool(self.bits[index] & (1 << (session_id & 7)))
+
+    def add(self, session_id: int) -> None:
+        """Segna la sessione come revocata in questo processo e rimuove i suoi token dalla cache."""
+        if session_id < 0 or session_id in self:
+            return
+        if not self.bits:
+            self.base = session_id & ~7
+        elif session_id < self.base:
+            # id più basso della base: sposto l'inizio della bitmap (raro, gli id crescono)
+            base = session_id & ~7
+            self.bits[0:0] = bytes((self.base - base) >> 3)
+            self.base = base
+        index = (session_id - self.base) >> 3
+        if index >= len(self.bits):
+            # cresce a blocchi raddoppiando, per non riallocare ad ogni nuova sessione
+            self.bits.extend(bytes(max(index + 1, 2 * len(self.bits)) - len(self.bits)))
+        self.bits[index] |= 1 << (session_id & 7)
+        self.count += 1
+        token_cache.invalidate_session(session_id)
+
+    async def hydrate(self) -> None:
+        """Carica dall'archivio le sessioni revocate i cui token possono ancora essere presentati (non scadute).
+
+        Un errore non blocca l'avvio: le revoche restano comunque salvate nell'archivio e controllate da refresh
+        e logout.
+        """
+        try:
+            async for session_id in self.store.revoked():
+                self.add(session_id)
+            logger.info(f"Loaded {self.count} revoked sessions")
+        except Exception as e:
+            logger.error(f"Failed to load revoked sessions: {e}")
+
+    async def _subscribe(self) -> bool:
+        """Si sottoscrive all'exchange di revoca con la connessione condivisa del broker del processo."""
+        broker = AsyncBrokerSingleton()
+        try:
+            if not await broker.connect():
+                return False
+            self.queue_name = await broker.subscribe(self.exchange, self.on_message, ex_type="fanout", exclusive=True)
+        except Exception as e:
+            logger.error(f"Failed to subscribe to {self.exchange}: {e}")
+            return False
+        self.broker = broker
+        return True
+
+    async def _resubscribe(self) -> None:
+        """Finché la sottoscrizione non riesce ricarica le revoche dall'archivio ogni retry_interval secondi:
+        le revoche degli altri worker arrivano comunque, con al più retry_interval di ritardo."""
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            subscribed = await self._subscribe()
+            # anche dopo la sottoscrizione: le revoche fatte prima che la coda esistesse non arrivano come messaggi
+            await self.hydrate()
+            if subscribed:
+                logger.info(f"Subscribed to {self.exchange}, revocations are broadcast again")
+                self.task = None
+                await self._publish([])
+                return
+
+    async def start(self) -> None:
+        """Si sottoscrive all'exchange di revoca (una coda esclusiva per processo) e carica le sessioni revocate.
+
+        La sottoscrizione avviene prima del caricamento, così le revoche fatte nel frattempo non vanno perse.
+        Usa la connessione condivisa del broker del processo (aperta qui se non lo è già). Se il broker non
+        è raggiungibile l'avvio prosegue e la sottoscrizione viene ritentata in background.
+        """
+        if settings.SESSION_REVOCATION_BROADCAST and not await self._subscribe():
+            logger.warning(f"Revocation broadcast unavailable, retrying every {self.retry_interval}s "
+                           f"and reloading revoked sessions from the store meanwhile")
+            self.task = asyncio.create_task(self._resubscribe(), name="revocation-subscribe")
+        await self.hydrate()
+
+    async def stop(self) -> None:
+        """Ferma i tentativi di sottoscrizione e annulla la propria sottoscrizione (allo spegnimento).
+
+        La connessione al broker è condivisa con gli altri consumer del processo e non viene chiusa qui.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.broker is not None and self.queue_name is not None:
+            try:
+                await self.broker.unsubscribe(self.queue_name)
+            except Exception as e:
+                logger.warning(f"Failed to unsubscribe from {self.exchange}: {e}")
+        self.broker = None
+        self.queue_name = None
+
+    async def _publish(self, session_ids: list[int]) -> None:
+        """Comunica le revoche agli altri worker, insieme a quelle che non è stato possibile pubblicare prima.
+
+        Un errore di pubblicazione non fa fallire la richiesta: la revoca è già salvata nell'archivio delle sessioni,
+        e gli id restano da pubblicare al tentativo successivo.
+        """
+        if self.broker is None:
+            if self.task is not None:
+                self.unpublished += session_ids
+            return
+        session_ids = self.unpublished + session_ids
+        if not session_ids:
+            return
+        data = {"session_id": session_ids[0]} if len(session_ids) == 1 else {"session_ids": session_ids}
+        try:
+            await self.broker.publish_message(self.exchange, RABBIT_REVOKE_TYPE, data, ex_type="fanout")
+            self.unpublished = []
+            self.published += 1
+        except Exception as e:
+            self.unpublished = session_ids
+            self.publish_errors += 1
+            logger.error(f"Failed to broadcast {len(session_ids)} revoked sessions: {e}")
+
+    async def revoke(self, session_id: int) -> None:
+        """Revoca la sessione in questo processo e la comunica agli altri worker."""
+        self.add(session_id)
+        await self._publish([session_id])
+
+    async def revoke_many(self, session_ids: list[int]) -> None:
+        """Come revoke, per più sessioni: un solo messaggio con tutti gli id (es. "esci da tutti i dispositivi")."""
+        if not session_ids:
+            return
+        for session_id in session_ids:
+            self.add(session_id)
+        await self._publish(session_ids)
+
+    async def on_message(self, message):
+        async with message.process():
+            try:
+                json_response = json.loads(message.body.decode())
+                if json_response["type"] == RABBIT_REVOKE_TYPE:
+                    data = json_response["data"]
+                    for session_id in data.get("session_ids") or [data["session_id"]]:
+                        self.add(int(session_id))
+                    self.received += 1
+                else:
+                    logger.error(f"Unsupported message type: {json_response['type']}")
+            except Exception as e:
+                logger.error(f"Unexpected error during revoked session update: {e}")
+
+    def clear(self) -> None:
+        self.bits = bytearray()
+        self.base = 0
+        self.count = 0
+
+    def stats(self) -> dict:
+        return {
+            "revoked": self.count,
+            "bitmap_bytes": len(self.bits),
+            "broadcast": self.broker is not None,
+            "resubscribing": self.task is not None,
+            "unpublished": len(self.unpublished),
+            "published": self.published,
+            "received": self.received,
+            "publish_errors": self.publish_errors,
+        }
+
+
+revoked_sessions = RevokedSessions(exchange=settings.SESSION_REVOCATION_EXCHANGE,
+                                   retry_interval=settings.SESSION_REVOCATION_RETRY_SECONDS)
+metrics.register("revoked_sessions", revoked_sessions.stats)
@@ -0,0 +1,667 @@
+from __future__ import annotations
+
+import itertools
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncContextManager, AsyncIterator, Awaitable, Callable, NoReturn, Protocol
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.security import token_digest
+from app.db.session import session_scope
+from app.models.accessToken import AccessToken
+from app.models.refreshToken import RefreshToken
+from app.models.session import Session
+from app.services.resp import RespClient
+
+logger = get_logger(__name__)
+
+# Emette la coppia (access, refresh) per la sessione indicata; riceve id e scadenza della sessione
+TokenIssuer = Callable[[int, datetime], Awaitable[tuple[str, str]]]
+
+
+@dataclass(slots=True)
+class SessionRecord():
+    """Stato di una sessione, indipendente dal backend."""
+    id: int
+    user_id: int
+    is_active: bool
+    is_blocked: bool
+    expires_at: datetime
+    created_at: datetime
+    updated_at: datetime
+    access_token_hash: str | None = None
+    refresh_token_hash: str | None = None
+    token_generation: int = 0
+
+
+# Rotazione del refresh token rifiutata; blocked=True se la sessione è stata bloccata per riuso del token
+class RotationRejected(Exception):
+    def __init__(self, message: str, session_id: int | None = None, blocked: bool = False):
+        super().__init__(message)
+        self.message = message
+        self.session_id = session_id
+        self.blocked = blocked
+
+
+class SessionStore(Protocol):
+    """Backend dello stato di sessioni e token usato da login, refresh, logout e gestione sessioni.
+
+    Implementazioni: SqlSessionStore (default, tabelle in app/models), MemorySessionStore (test e singolo
+    processo), RedisSessionStore (qualsiasi server compatibile col protocollo Redis, scadenza con TTL nativi).
+    Gli id delle sessioni sono interi progressivi (usati dalla bitmap di revoked_sessions).
+    """
+
+    async def create(self, user_id: int, expires_at: datetime, issue: TokenIssuer) -> tuple[str, str]:
+        """Crea la sessione, emette la prima coppia di token con `issue` e salva i loro digest."""
+        ...
+
+    async def rotate(self, refresh_token: str, session_id: int, user_id: int, issue: TokenIssuer) -> tuple[str, str]:
+        """Sostituisce la coppia corrente se `refresh_token` è il refresh token corrente della sessione.
+
+        `session_id` e `user_id` sono i claim del token: se la sessione è di un altro utente il token
+        viene rifiutato senza bloccarla.
+
+        Raises:
+            RotationRejected: Token sconosciuto, sessione non utilizzabile o token riusato (sessione bloccata).
+        """
+        ...
+
+    async def get(self, session_id: int) -> SessionRecord | None:
+        ...
+
+    async def deactivate(self, session_id: int) -> bool:
+        """Chiude la sessione (logout). Restituisce False se la sessione non esiste."""
+        ...
+
+    async def list_active(self, user_id: int, before: int | None, limit: int) -> list[SessionRecord]:
+        """Sessioni attive dell'utente con id minore di `before`, in ordine di id decrescente."""
+        ...
+
+    async def revoke_user(self, user_id: int, session_ids: list[int] | None, keep_session_id: int | None,
+                          created_before: datetime | None) -> list[int]:
+        """Chiude le sessioni attive dell'utente che rispettano i filtri e ne restituisce gli id."""
+        ...
+
+    def revoked(self) -> AsyncIterator[int]:
+        """Id delle sessioni chiuse o bloccate non ancora scadute (per popolare revoked_sessions)."""
+        ...
+
+    async def close(self) -> None:
+        ...
+
+    def stats(self) -> dict:
+        ...
+
+
+def check_usable(session: SessionRecord | Session | None, user_id: int | None = None) -> None:
+    """Controlla che la sessione esista, appartenga all'utente del token, sia attiva, non bloccata e non scaduta.
+
+    Args:
+        session (SessionRecord | Session | None): Sessione indicata dal refresh token.
+        user_id (int | None): Utente indicato dal refresh token. Un token di un altro utente (es. emesso prima
+            di un riavvio dell'archivio in memoria, con gli stessi id) viene rifiutato senza bloccare la sessione.
+    Raises:
+        RotationRejected: Se la sessione non è utilizzabile per un refresh.
+    """
+    if not session or not session.is_active or (user_id is not None and session.user_id != user_id):
+        raise RotationRejected("Session is inactive or does not exist")
+    if session.is_blocked:
+        raise RotationRejected("Session is blocked")
+    if session.expires_at < datetime.now():
+        raise RotationRejected("Session expired")
+
+
+def reuse_detected(session_id: int) -> NoReturn:
+    raise RotationRejected("Refresh token expired, Session blocked", session_id=session_id, blocked=True)
+
+
+def naive(value: datetime) -> datetime:
+    """Converte un datetime con fuso nell'ora locale senza fuso, come le scadenze salvate dal gateway."""
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+
+def utc(value: datetime) -> datetime:
+    """Converte un datetime in UTC, come created_at e updated_at salvati dal DB (senza fuso = ora locale)."""
+    return value.astimezone(timezone.utc)
+
+
+async def expire_session_tokens(db: AsyncSession, session_id: int) -> None:
+    """Segna come scaduti tutti gli access e refresh token della sessione (senza commit).
+
+    Args:
+        db (AsyncSession): Sessione DB della transazione corrente.
+        session_id (int): Id della sessione.
+    """
+    # il filtro su is_expired usa gli indici (session_id, is_expired) e non riscrive i token già scaduti
+    await db.execute(update(AccessToken).where(AccessToken.session_id == session_id, ~AccessToken.is_expired)
+                     .values(is_expired=True))
+    await db.execute(update(RefreshToken).where(RefreshToken.session_id == session_id, ~RefreshToken.is_expired)
+                     .values(is_expired=True))
+
+
+class SqlSessionStore():
+    """Sessioni e token nelle tabelle SQL. Con TOKEN_STORAGE="rows" salva anche una riga per ogni token emesso."""
+
+    def __init__(self, session_factory: Callable[[], AsyncContextManager[AsyncSession]] = session_scope):
+        self.session_factory = session_factory
+
+    @staticmethod
+    def token_rows() -> bool:
+        return settings.TOKEN_STORAGE != "family"
+
+    @staticmethod
+    def _record(session: Session) -> SessionRecord:
+        return SessionRecord(id=session.id, user_id=session.user_id, is_active=session.is_active,
+                             is_blocked=session.is_blocked, expires_at=session.expires_at,
+                             created_at=session.created_at, updated_at=session.updated_at,
+                             access_token_hash=session.access_token_hash,
+                             refresh_token_hash=session.refresh_token_hash,
+                             token_generation=session.token_generation)
+
+    async def create(self, user_id: int, expires_at: datetime, issue: TokenIssuer) -> tuple[str, str]:
+        """Tre passi brevi, senza transazioni aperte durante la chiamata al servizio token: inserimento della
+        sessione (per avere l'id da mettere nei token), emissione dei token, salvataggio dei loro digest.
+
+        Finché i digest non sono salvati la sessione non ha token utilizzabili; se l'emissione fallisce
+        la sessione viene eliminata.
+        """
+        async with self.session_factory() as db:
+            db_session = Session(user_id=user_id, expires_at=expires_at)
+            db.add(db_session)
+            await db.commit()
+            session_id = db_session.id
+
+        try:
+            access_token, refresh_token = await issue(session_id, expires_at)
+        except BaseException:
+            async with self.session_factory() as db:
+                await db.execute(delete(Session).where(Session.id == session_id))
+                await db.commit()
+            raise
+
+        async with self.session_factory() as db:
+            await db.execute(
+                update(Session).where(Session.id == session_id)
+                .values(access_token_hash=token_digest(access_token), refresh_token_hash=token_digest(refresh_token))
+            )
+            if self.token_rows():
+                db_access_token = AccessToken(session_id=session_id, token=access_token)
+                db_refresh_token = RefreshToken(session_id=session_id, token=refresh_token,
+                                                accessToken=db_access_token)
+                db.add_all([db_access_token, db_refresh_token])
+            await db.commit()
+        return access_token, refresh_token
+
+    async def rotate(self, refresh_token: str, session_id: int, user_id: int, issue: TokenIssuer) -> tuple[str, str]:
+        if self.token_rows():
+            return await self._rotate_rows(refresh_token, user_id, issue)
+        return await self._rotate_family(refresh_token, session_id, user_id, issue)
+
+    async def _rotate_rows(self, token: str, user_id: int, issue: TokenIssuer) -> tuple[str, str]:
+        """Rotazione con TOKEN_STORAGE="rows": il vecchio refresh token viene segnato come scaduto
+        e la nuova coppia viene inserita come due nuove righe.
+
+        Il refresh token viene "reclamato" con un solo UPDATE ... RETURNING, che lo segna come scaduto solo se non
+        lo è già e la sessione è utilizzabile, e restituisce la scadenza della sessione: di due refresh concorrenti
+        con lo stesso token solo uno lo reclama, l'altro lo trova scaduto e viene trattato come riuso.
+        Il reclamo viene confermato subito, così nessun lock resta aperto durante la chiamata al servizio token;
+        se l'emissione fallisce il token torna valido e il client può riprovare.
+        """
+        session_expires_at = select(Session.expires_at).where(Session.id == RefreshToken.session_id).scalar_subquery()
+        usable_sessions = select(Session.id).where(Session.user_id == user_id, Session.is_active, ~Session.is_blocked,
+                                                   Session.expires_at >= datetime.now())
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(RefreshToken)
+                .where(RefreshToken.token_hash == token_digest(token), ~RefreshToken.is_expired,
+                       RefreshToken.session_id.in_(usable_sessions))
+                .values(is_expired=True)
+                .returning(RefreshToken.id, RefreshToken.session_id, RefreshToken.accessToken_id, session_expires_at)
+            )
+            claimed = result.first()
+            if claimed is None:
+                await self._reject(db, token, user_id)
+            await db.commit()
+        refresh_token_id, session_id, access_token_id, expires_at = claimed
+
+        try:
+            access_token, refresh_token = await issue(session_id, expires_at)
+        except BaseException:
+            async with self.session_factory() as db:
+                await db.execute(update(RefreshToken).where(RefreshToken.id == refresh_token_id)
+                                 .values(is_expired=False))
+                await db.commit()
+            raise
+
+        async with self.session_factory() as db:
+            # Segno come scaduto il vecchio access token e salvo la nuova coppia con un solo commit
+            await db.execute(update(AccessToken).where(AccessToken.id == access_token_id).values(is_expired=True))
+            # tengo aggiornata anche la coppia corrente sulla sessione, per poter passare a TOKEN_STORAGE="family"
+            await db.execute(
+                update(Session).where(Session.id == session_id)
+                .values(access_token_hash=token_digest(access_token), refresh_token_hash=token_digest(refresh_token),
+                        token_generation=Session.token_generation + 1)
+            )
+            db_access_token = AccessToken(session_id=session_id, token=access_token)
+            db_refresh_token = RefreshToken(session_id=session_id, token=refresh_token, accessToken=db_access_token)
+            db.add_all([db_access_token, db_refresh_token])
+            await db.commit()
+        return access_token, refresh_token
+
+    async def _reject(self, db: AsyncSession, token: str, user_id: int) -> NoReturn:
+        """Spiega perché un refresh token non è stato reclamato, e blocca la sessione se è stato riusato.
+
+        Eseguita solo quando la rotazione fallisce, per restituire gli stessi errori di prima.
+        """
+        result = await db.execute(select(RefreshToken).where(RefreshToken.token_hash == token_digest(token)))
+        db_old_refresh_token = result.scalars().first()
+        if not db_old_refresh_token:
+            raise RotationRejected("Refresh token not found")
+
+        session = await db.get(Session, db_old_refresh_token.session_id)
+        check_usable(session, user_id)
+
+        if db_old_refresh_token.is_expired:
+            # segno la sessione come non attiva e bloccata, perché è stato riusato un token già usato
+            await self._block(db, session.id)
+            reuse_detected(session.id)
+        raise RotationRejected("Invalid refresh token")
+
+    async def _rotate_family(self, token: str, session_id: int, user_id: int, issue: TokenIssuer) -> tuple[str, str]:
+        """Rotazione con TOKEN_STORAGE="family": la sessione contiene solo i digest della coppia corrente.
+
+        La rotazione è un unico UPDATE condizionato su generazione e digest del refresh token presentato:
+        se un'altra richiesta ha già ruotato la coppia, o il token presentato non è quello corrente,
+        nessuna riga viene aggiornata e il token viene trattato come riusato. Lettura e UPDATE sono due
+        transazioni separate: nessuna resta aperta durante la chiamata al servizio token.
+        """
+        digest = token_digest(token)
+        async with self.session_factory() as db:
+            session = await db.get(Session, session_id)
+            check_usable(session, user_id)
+            if session.refresh_token_hash != digest:
+                # refresh token valido della sessione ma non più corrente: è stato riusato
+                await self._block(db, session.id)
+                reuse_detected(session.id)
+            expected_generation, expires_at = session.token_generation, session.expires_at
+            await db.commit()
+
+        access_token, refresh_token = await issue(session_id, expires_at)
+
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(Session)
+                .where(Session.id == session_id, Session.token_generation == expected_generation,
+                       Session.refresh_token_hash == digest, Session.is_active, ~Session.is_blocked)
+                .values(access_token_hash=token_digest(access_token), refresh_token_hash=token_digest(refresh_token),
+                        token_generation=expected_generation + 1)
+            )
+            if result.rowcount != 1:
+                # un'altra rotazione con lo stesso token è arrivata prima: stesso trattamento del riuso
+                await self._block(db, session_id)
+                reuse_detected(session_id)
+            await db.commit()
+        return access_token, refresh_token
+
+    @staticmethod
+    async def _block(db: AsyncSession, session_id: int) -> None:
+        await db.execute(update(Session).where(Session.id == session_id).values(is_active=False, is_blocked=True))
+        await expire_session_tokens(db, session_id)
+        await db.commit()
+
+    async def get(self, session_id: int) -> SessionRecord | None:
+        async with self.session_factory() as db:
+            session = await db.get(Session, session_id)
+            return self._record(session) if session else None
+
+    async def deactivate(self, session_id: int) -> bool:
+        async with self.session_factory() as db:
+            result = await db.execute(update(Session).where(Session.id == session_id).values(is_active=False))
+            if result.rowcount == 0:
+                return False
+            await expire_session_tokens(db, session_id)
+            await db.commit()
+        return True
+
+    async def list_active(self, user_id: int, before: int | None, limit: int) -> list[SessionRecord]:
+        query = (select(Session)
+                 .where(Session.user_id == user_id, Session.is_active, ~Session.is_blocked,
+                        Session.expires_at > datetime.now())
+                 .order_by(Session.id.desc())
+                 .limit(limit))
+        if before is not None:
+            query = query.where(Session.id < before)
+        async with self.session_factory() as db:
+            return [self._record(session) for session in (await db.execute(query)).scalars()]
+
+    async def revoke_user(self, user_id: int, session_ids: list[int] | None, keep_session_id: int | None,
+                          created_before: datetime | None) -> list[int]:
+        """Tre UPDATE a insieme in un'unica transazione, indipendenti dal numero di sessioni: scadenza di access
+        e refresh token delle sessioni selezionate, poi disattivazione delle sessioni con RETURNING degli id."""
+        conditions = [Session.user_id == user_id, Session.is_active]
+        if session_ids is not None:
+            conditions.append(Session.id.in_(session_ids))
+        if keep_session_id is not None:
+            conditions.append(Session.id != keep_session_id)
+        if created_before is not None:
+            conditions.append(Session.created_at < utc(created_before))
+
+        selected = select(Session.id).where(*conditions)
+        async with self.session_factory() as db:
+            await db.execute(update(AccessToken).where(AccessToken.session_id.in_(selected), ~AccessToken.is_expired)
+                             .values(is_expired=True))
+            await db.execute(update(RefreshToken).where(RefreshToken.session_id.in_(selected), ~RefreshToken.is_expired)
+                             .values(is_expired=True))
+            result = await db.execute(update(Session).where(*conditions).values(is_active=False).returning(Session.id))
+            revoked = list(result.scalars())
+            await db.commit()
+        return revoked
+
+    async def revoked(self) -> AsyncIterator[int]:
+        async with self.session_factory() as db:
+            result = await db.stream_scalars(
+                select(Session.id).where(~Session.is_active | Session.is_blocked, Session.expires_at > datetime.now())
+            )
+            async for session_id in result:
+                yield session_id
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "sql", "token_storage": "rows" if self.token_rows() else "family"}
+
+
+class MemorySessionStore():
+    """Sessioni in un dizionario del processo: per i test e per le installazioni con un solo worker.
+
+    Conserva solo la coppia corrente di ogni sessione (come TOKEN_STORAGE="family"). Le sessioni scadute
+    vengono eliminate ogni `purge_every` sessioni create. Gli id partono dall'istante di avvio in millisecondi
+    (`first_id`, se non indicato), così non si ripetono tra un avvio e l'altro: un refresh token ancora valido
+    di un avvio precedente non indica una sessione di questo.
+    """
+
+    def __init__(self, purge_every: int = 1024, first_id: int | None = None):
+        self.sessions: dict[int, SessionRecord] = {}
+        self.ids = itertools.count(first_id if first_id is not None else time.time_ns() // 1_000_000)
+        self.purge_every = purge_every
+        self.created = 0
+
+    def _get(self, session_id: int) -> SessionRecord | None:
+        session = self.sessions.get(session_id)
+        if session is not None and session.expires_at <= datetime.now():
+            del self.sessions[session_id]
+            return None
+        return session
+
+    def _purge(self) -> None:
+        now = datetime.now()
+        for session_id in [s.id for s in self.sessions.values() if s.expires_at <= now]:
+            del self.sessions[session_id]
+
+    async def create(self, user_id: int, expires_at: datetime, issue: TokenIssuer) -> tuple[str, str]:
+        session_id = next(self.ids)
+        access_token, refresh_token = await issue(session_id, expires_at)
+        now = datetime.now()
+        self.sessions[session_id] = SessionRecord(
+            id=session_id, user_id=user_id, is_active=True, is_blocked=False, expires_at=expires_at,
+            created_at=now, updated_at=now, access_token_hash=token_digest(access_token),
+            refresh_token_hash=token_digest(refresh_token))
+        self.created += 1
+        if self.created % self.purge_every == 0:
+            self._purge()
+        return access_token, refresh_token
+
+    def _block(self, session: SessionRecord) -> NoReturn:
+        session.is_active, session.is_blocked, session.updated_at = False, True, datetime.now()
+        reuse_detected(session.id)
+
+    async def rotate(self, refresh_token: str, session_id: int, user_id: int, issue: TokenIssuer) -> tuple[str, str]:
+        digest = token_digest(refresh_token)
+        session = self._get(session_id)
+        check_usable(session, user_id)
+        if session.refresh_token_hash != digest:
+            self._block(session)
+
+        expected_generation = session.token_generation
+        access_token, new_refresh_token = await issue(session.id, session.expires_at)
+        # durante l'emissione un'altra rotazione può aver già sostituito la coppia
+        if (session.token_generation != expected_generation or session.refresh_token_hash != digest
+                or not session.is_active):
+            self._block(session)
+        session.access_token_hash = token_digest(access_token)
+        session.refresh_token_hash = token_digest(new_refresh_token)
+        session.token_generation += 1
+        session.updated_at = datetime.now()
+        return access_token, new_refresh_token
+
+    async def get(self, session_id: int) -> SessionRecord | None:
+        return self._get(session_id)
+
+    async def deactivate(self, session_id: int) -> bool:
+        session = self._get(session_id)
+        if session is None:
+            return False
+        session.is_active, session.updated_at = False, datetime.now()
+        return True
+
+    async def list_active(self, user_id: int, before: int | None, limit: int) -> list[SessionRecord]:
+        now = datetime.now()
+        sessions = [s for s in self.sessions.values()
+                    if s.user_id == user_id and s.is_active and not s.is_blocked and s.expires_at > now
+                    and (before is None or s.id < before)]
+        return sorted(sessions, key=lambda s: s.id, reverse=True)[:limit]
+
+    async def revoke_user(self, user_id: int, session_ids: list[int] | None, keep_session_id: int | None,
+                          created_before: datetime | None) -> list[int]:
+        selected = set(session_ids) if session_ids is not None else None
+        created_before = naive(created_before) if created_before else None
+        revoked = []
+        for session in await self.list_active(user_id, None, len(self.sessions)):
+            if ((selected is None or session.id in selected) and session.id != keep_session_id
+                    and (created_before is None or session.created_at < created_before)):
+                session.is_active, session.updated_at = False, datetime.now()
+                revoked.append(session.id)
+        return revoked
+
+    async def revoked(self) -> AsyncIterator[int]:
+        now = datetime.now()
+        for session in list(self.sessions.values()):
+            if (not session.is_active or session.is_blocked) and session.expires_at > now:
+                yield session.id
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "sessions": len(self.sessions)}
+
+
+class RedisSessionStore():
+    """Sessioni su un server compatibile col protocollo Redis, con la scadenza affidata ai TTL nativi.
+
+    Chiavi (con il prefisso SESSION_STORE_REDIS_PREFIX):
+        session:{id}          hash con lo stato della sessione, EXPIREAT alla scadenza della sessione
+        user:{user_id}:sessions  sorted set degli id delle sessioni attive dell'utente (score = id)
+        sessions:next_id      contatore degli id
+        sessions:revoked      sorted set delle sessioni chiuse o bloccate (score = scadenza), per revoked()
+    Rotazione e chiusura sono script Lua (EVAL), quindi atomiche sul server. Conserva solo la coppia corrente
+    di ogni sessione (come TOKEN_STORAGE="family").
+    """
+
+    # KEYS: sessione. ARGV: generazione attesa, digest atteso, nuovi digest, nuova generazione, updated_at
+    ROTATE = """
+if redis.call('HGET', KEYS[1], 'active') ~= '1' or redis.call('HGET', KEYS[1], 'blocked') ~= '0'
+   or redis.call('HGET', KEYS[1], 'generation') ~= ARGV[1]
+   or redis.call('HGET', KEYS[1], 'refresh_hash') ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'access_hash', ARGV[3], 'refresh_hash', ARGV[4], 'generation', ARGV[5],
+           'updated_at', ARGV[6])
+return 1
+"""
+
+    # KEYS: sessione, sorted set delle revocate. ARGV: id, bloccata (0/1), prefisso, updated_at
+    DEACTIVATE = """
+local user_id = redis.call('HGET', KEYS[1], 'user_id')
+if not user_id then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'active', '0', 'updated_at', ARGV[4])
+if ARGV[2] == '1' then
+    redis.call('HSET', KEYS[1], 'blocked', '1')
+end
+redis.call('ZREM', ARGV[3] .. 'user:' .. user_id .. ':sessions', ARGV[1])
+redis.call('ZADD', KEYS[2], redis.call('HGET', KEYS[1], 'expires_at'), ARGV[1])
+return 1
+"""
+
+    def __init__(self, client: RespClient, prefix: str = "gateway:"):
+        self.client = client
+        self.prefix = prefix
+        self.revoked_key = f"{prefix}sessions:revoked"
+
+    def _key(self, session_id: int) -> str:
+        return f"{self.prefix}session:{session_id}"
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.prefix}user:{user_id}:sessions"
+
+    @staticmethod
+    def _record(session_id: int, fields: list | None) -> SessionRecord | None:
+        if not fields:
+            return None
+        data = dict(zip(fields[::2], fields[1::2]))
+        return SessionRecord(
+            id=session_id, user_id=int(data["user_id"]), is_active=data["active"] == "1",
+            is_blocked=data["blocked"] == "1", expires_at=datetime.fromtimestamp(float(data["expires_at"])),
+            created_at=datetime.fromtimestamp(float(data["created_at"])),
+            updated_at=datetime.fromtimestamp(float(data["updated_at"])),
+            access_token_hash=data.get("access_hash"), refresh_token_hash=data.get("refresh_hash"),
+            token_generation=int(data.get("generation", 0)))
+
+    async def create(self, user_id: int, expires_at: datetime, issue: TokenIssuer) -> tuple[str, str]:
+        session_id = await self.client.execute("INCR", f"{self.prefix}sessions:next_id")
+        access_token, refresh_token = await issue(session_id, expires_at)
+        now = datetime.now().timestamp()
+        key = self._key(session_id)
+        await self.client.pipeline([
+            ("MULTI",),
+            ("HSET", key, "user_id", user_id, "active", "1", "blocked", "0", "expires_at", expires_at.timestamp(),
+             "created_at", now, "updated_at", now, "access_hash", token_digest(access_token),
+             "refresh_hash", token_digest(refresh_token), "generation", 0),
+            ("EXPIREAT", key, int(expires_at.timestamp()) + 1),
+            ("ZADD", self._user_key(user_id), session_id, session_id),
+            ("EXEC",),
+        ])
+        return access_token, refresh_token
+
+    async def _deactivate(self, session_ids: list[int], blocked: bool = False) -> list[int]:
+        now = datetime.now().timestamp()
+        replies = await self.client.pipeline([
+            ("EVAL", self.DEACTIVATE, 2, self._key(session_id), self.revoked_key, session_id, int(blocked),
+             self.prefix, now) for session_id in session_ids
+        ])
+        return [session_id for session_id, reply in zip(session_ids, replies) if reply == 1]
+
+    async def _block(self, session_id: int) -> NoReturn:
+        await self._deactivate([session_id], blocked=True)
+        reuse_detected(session_id)
+
+    async def rotate(self, refresh_token: str, session_id: int, user_id: int, issue: TokenIssuer) -> tuple[str, str]:
+        digest = token_digest(refresh_token)
+        session = await self.get(session_id)
+        check_usable(session, user_id)
+        if session.refresh_token_hash != digest:
+            await self._block(session.id)
+
+        access_token, new_refresh_token = await issue(session.id, session.expires_at)
+        rotated = await self.client.execute(
+            "EVAL", self.ROTATE, 1, self._key(session.id), session.token_generation, digest,
+            token_digest(access_token), token_digest(new_refresh_token), session.token_generation + 1,
+            datetime.now().timestamp())
+        if rotated != 1:
+            # un'altra rotazione con lo stesso token è arrivata prima: stesso trattamento del riuso
+            await self._block(session.id)
+        return access_token, new_refresh_token
+
+    async def get(self, session_id: int) -> SessionRecord | None:
+        return self._record(session_id, await self.client.execute("HGETALL", self._key(session_id)))
+
+    async def deactivate(self, session_id: int) -> bool:
+        return bool(await self._deactivate([session_id]))
+
+    async def _active(self, user_id: int, before: int | None, limit: int | None) -> list[SessionRecord]:
+        """Sessioni attive dell'utente in ordine di id decrescente, al massimo `limit` (None = tutte).
+
+        L'indice dell'utente può contenere id di sessioni già scadute (hash rimosso dal TTL) o chiuse: vengono
+        scartate e si continua a leggere l'indice finché la pagina non è piena, così una pagina corta
+        significa davvero che non ci sono altre sessioni.
+        """
+        now = datetime.now()
+        start = f"({before}" if before is not None else "+inf"
+        active: list[SessionRecord] = []
+        while limit is None or len(active) < limit:
+            command = ["ZREVRANGEBYSCORE", self._user_key(user_id), start, "-inf"]
+            wanted = None if limit is None else limit - len(active)
+            if wanted is not None:
+                command += ["LIMIT", 0, wanted]
+            session_ids = [int(session_id) for session_id in await self.client.execute(*command)]
+            if not session_ids:
+                break
+            replies = await self.client.pipeline([("HGETALL", self._key(session_id)) for session_id in session_ids])
+            sessions = [self._record(session_id, fields) for session_id, fields in zip(session_ids, replies)]
+            expired = [session_id for session_id, session in zip(session_ids, sessions) if session is None]
+            if expired:
+                # hash già scaduto per TTL: rimuovo l'id dall'indice dell'utente
+                await self.client.execute("ZREM", self._user_key(user_id), *expired)
+            active += [s for s in sessions
+                       if s is not None and s.is_active and not s.is_blocked and s.expires_at > now]
+            if wanted is None or len(session_ids) < wanted:
+                break
+            start = f"({session_ids[-1]}"
+        return active
+
+    async def list_active(self, user_id: int, before: int | None, limit: int) -> list[SessionRecord]:
+        return await self._active(user_id, before, limit)
+
+    async def revoke_user(self, user_id: int, session_ids: list[int] | None, keep_session_id: int | None,
+                          created_before: datetime | None) -> list[int]:
+        selected = set(session_ids) if session_ids is not None else None
+        created_before = naive(created_before) if created_before else None
+        targets = [s.id for s in await self._active(user_id, None, None)
+                   if (selected is None or s.id in selected) and s.id != keep_session_id
+                   and (created_before is None or s.created_at < created_before)]
+        return await self._deactivate(targets) if targets else []
+
+    async def revoked(self) -> AsyncIterator[int]:
+        now = datetime.now().timestamp()
+        await self.client.execute("ZREMRANGEBYSCORE", self.revoked_key, "-inf", now)
+        for session_id in await self.client.execute("ZRANGEBYSCORE", self.revoked_key, now, "+inf"):
+            yield int(session_id)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    def stats(self) -> dict:
+        return {"backend": "redis", **self.client.stats()}
+
+
+def build_session_store() -> SessionStore:
+    if settings.SESSION_STORE == "memory":
+        return MemorySessionStore()
+    if settings.SESSION_STORE == "redis":
+        client = RespClient(settings.SESSION_STORE_REDIS_URL, pool_size=settings.SESSION_STORE_REDIS_POOL_SIZE,
+                            timeout=settings.SESSION_STORE_REDIS_TIMEOUT)
+        return RedisSessionStore(client, prefix=settings.SESSION_STORE_REDIS_PREFIX)
+    return SqlSessionStore()
+
+
+session_store = build_session_store()
+metrics.register("session_store", lambda: session_store.stats())
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight():
+    """Esegue una sola volta le chiamate identiche in corso nello stesso momento.
+
+    La prima chiamata con una certa chiave avvia l'operazione in un task; le chiamate con la stessa chiave
+    che arrivano prima della sua conclusione attendono lo stesso task e ne condividono il risultato (o l'errore).
+    Il task non appartiene a nessun chiamante: se chi l'ha avviato viene cancellato (es. client disconnesso)
+    gli altri ricevono comunque il risultato. A operazione conclusa la chiave viene rimossa, quindi non è una cache.
+    Attributes:
+        pending (dict): chiave -> task dell'operazione in corso.
+    """
+
+    def __init__(self):
+        self.pending: dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.saved = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                 share: Callable[[Any], Any] | None = None) -> Any:
+        """Esegue fn() oppure attende l'esecuzione identica già in corso.
+
+        Args:
+            key (Hashable): Chiave che identifica le chiamate equivalenti.
+            fn (Callable): Operazione da eseguire.
+            share (Callable | None): Applicata al risultato per ogni chiamante che si è unito a un'esecuzione
+                già in corso (es. una copia, se il risultato può essere modificato).
+        Returns:
+            Any: Il risultato di fn().
+        """
+        task = self.pending.get(key)
+        if task is not None:
+            self.saved += 1
+            result = await asyncio.shield(task)
+            return share(result) if share else result
+
+        self.calls += 1
+        task = asyncio.ensure_future(fn())
+        self.pending[key] = task
+        # l'errore viene letto anche se tutti i chiamanti sono stati cancellati, evita warning nel log
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        task.add_done_callback(lambda t: self.pending.pop(key, None) if self.pending.get(key) is t else None)
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self.pending),
+            "calls": self.calls,
+            "saved": self.saved,
+        }
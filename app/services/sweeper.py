@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import AsyncContextManager, Callable
+
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.db.session import session_scope
+from app.models.accessToken import AccessToken
+from app.models.refreshToken import RefreshToken
+from app.models.session import Session
+
+logger = get_logger(__name__)
+
+
+class ExpirySweeper():
+    """Job in background che elimina sessioni e token non più utilizzabili.
+
+    Ad ogni giro elimina, a blocchi di batch_size righe e rispettando l'ordine delle foreign key:
+    1. i refresh token scaduti da più di retention, o appartenenti a sessioni eliminabili;
+    2. gli access token con gli stessi criteri, se nessun refresh token li referenzia ancora;
+    3. le sessioni chiuse (logout, bloccate) o scadute da più di retention, una volta rimasti senza token.
+    I token scaduti vengono tenuti per retention così un refresh token già usato viene ancora riconosciuto
+    come riuso (e blocca la sessione) invece che come token sconosciuto.
+    Ogni blocco è una transazione a sé e il ritmo è limitato a max_rows_per_second, per non competere
+    con le richieste in corso per le connessioni e i lock del DB.
+    """
+
+    def __init__(self, interval: float, batch_size: int, max_rows_per_second: float, retention: timedelta,
+                 session_factory: Callable[[], AsyncContextManager[AsyncSession]] = session_scope):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_rows_per_second = max_rows_per_second
+        self.retention = retention
+        self.session_factory = session_factory
+        self.task: asyncio.Task | None = None
+        self.runs = 0
+        self.errors = 0
+        self.deleted = {"refreshTokens": 0, "accessTokens": 0, "sessions": 0}
+        self.backlog = 0
+        self.last_run_rows = 0
+        self.last_run_seconds = 0.0
+        self.last_run_at: datetime | None = None
+
+    def _dead_session(self):
+        """Sessioni chiuse o scadute da più di retention."""
+        # updated_at è salvato dal DB (UTC), expires_at dal gateway (ora locale, come in auth.py)
+        return ((~Session.is_active & (Session.updated_at < datetime.now(timezone.utc) - self.retention))
+                | (Session.expires_at < datetime.now() - self.retention))
+
+    def _conditions(self) -> dict:
+        """Righe eliminabili per ogni tabella, nell'ordine in cui vanno eliminate."""
+        cutoff = datetime.now(timezone.utc) - self.retention
+        dead_sessions = select(Session.id).where(self._dead_session())
+        return {
+            RefreshToken: (RefreshToken.is_expired & (RefreshToken.updated_at < cutoff))
+            | RefreshToken.session_id.in_(dead_sessions),
+            AccessToken: (AccessToken.is_expired & (AccessToken.updated_at < cutoff))
+            | AccessToken.session_id.in_(dead_sessions),
+            Session: self._dead_session(),
+        }
+
+    @staticmethod
+    def _foreign_key_guards() -> dict:
+        """Righe ancora referenziate, da non eliminare finché esistono le righe che le referenziano."""
+        return {
+            AccessToken: exists().where(RefreshToken.accessToken_id == AccessToken.id),
+            Session: exists().where(RefreshToken.session_id == Session.id)
+            | exists().where(AccessToken.session_id == Session.id),
+        }
+
+    async def count_backlog(self) -> int:
+        """Conta le righe eliminabili al momento, comprese quelle che attendono l'eliminazione di altre."""
+        async with self.session_factory() as db:
+            total = 0
+            for model, condition in self._conditions().items():
+                total += (await db.execute(select(func.count()).select_from(model).where(condition))).scalar_one()
+            return total
+
+    async def _delete_batch(self, model, condition) -> int:
+        async with self.session_factory() as db:
+            ids = (await db.execute(select(model.id).where(condition).limit(self.batch_size))).scalars().all()
+            if ids:
+                await db.execute(delete(model).where(model.id.in_(ids)))
+                await db.commit()
+            return len(ids)
+
+    async def sweep(self) -> int:
+        """Esegue un giro completo di pulizia.
+
+        Returns:
+            int: Numero di righe eliminate.
+        """
+        started = time.monotonic()
+        self.backlog = await self.count_backlog()
+        removed = 0
+        guards = self._foreign_key_guards()
+        for model, condition in self._conditions().items():
+            if model in guards:
+                condition = condition & ~guards[model]
+            while True:
+                batch_started = time.monotonic()
+                count = await self._delete_batch(model, condition)
+                removed += count
+                self.deleted[model.__tablename__] += count
+                self.backlog = max(0, self.backlog - count)
+                if count < self.batch_size:
+                    break
+                # limito il ritmo: ogni blocco deve durare almeno count / max_rows_per_second secondi
+                if self.max_rows_per_second > 0:
+                    await asyncio.sleep(max(0.0, count / self.max_rows_per_second - (time.monotonic() - batch_started)))
+
+        self.runs += 1
+        self.last_run_rows = removed
+        self.last_run_seconds = time.monotonic() - started
+        self.last_run_at = datetime.now(timezone.utc)
+        if removed:
+            logger.info(f"Expiry sweeper removed {removed} rows in {self.last_run_seconds:.2f}s")
+        return removed
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Expiry sweeper failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Avvia il job in background (all'avvio dell'applicazione)."""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run(), name="expiry-sweeper")
+
+    async def stop(self):
+        """Ferma il job in background (allo spegnimento dell'applicazione)."""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self.task is not None,
+            "runs": self.runs,
+            "errors": self.errors,
+            "deleted": dict(self.deleted),
+            "backlog": self.backlog,
+            "last_run_rows": self.last_run_rows,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+            "rows_per_second": round(self.last_run_rows / self.last_run_seconds, 1) if self.last_run_seconds else 0.0,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
+
+
+sweeper = ExpirySweeper(
+    interval=settings.SWEEPER_INTERVAL_SECONDS,
+    batch_size=settings.SWEEPER_BATCH_SIZE,
+    max_rows_per_second=settings.SWEEPER_MAX_ROWS_PER_SECOND,
+    retention=timedelta(days=settings.SWEEPER_RETENTION_DAYS),
+)
+metrics.register("sweeper", sweeper.stats)
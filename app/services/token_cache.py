@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.security import token_digest
+from app.services.http_client import HttpClientException
+
+
+class TokenCache():
+    """Cache LRU in memoria dei token già verificati, indicizzata per digest SHA-256 del token.
+
+    Un payload valido resta in cache fino alla scadenza del token (claim "exp"), e comunque non oltre max_ttl.
+    I token non validi vengono tenuti per negative_ttl secondi, così una raffica di retry con lo stesso
+    token non valido non arriva al servizio token.
+    La cache è locale al processo: logout e blocco sessione la invalidano tramite invalidate_session.
+    Attributes:
+        entries (OrderedDict): digest -> (scadenza monotonic, payload o errore), in ordine LRU.
+        sessions (dict): session_id -> digest dei token in cache per quella sessione.
+    """
+
+    def __init__(self, max_entries: int, max_ttl: float, negative_ttl: float):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.entries: OrderedDict[str, tuple[float, dict | tuple]] = OrderedDict()
+        self.sessions: dict[int, set[str]] = {}
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def digest(token: str) -> str:
+        # stesso digest usato come chiave dei token nel DB
+        return token_digest(token)
+
+    def get(self, token: str) -> dict | tuple | None:
+        """Restituisce il payload (o l'errore) in cache per il token, se presente e non scaduto.
+
+        Args:
+            token (str): Token da cercare.
+        Returns:
+            dict | tuple | None: Payload verificato, argomenti di HttpClientException (negative cache) oppure None.
+        """
+        key = self.digest(token)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        if isinstance(value, dict):
+            self.hits += 1
+            return dict(value)
+        self.negative_hits += 1
+        return value
+
+    def put(self, token: str, payload: dict) -> None:
+        """Memorizza il payload restituito dalla verifica.
+
+        I token validi restano fino a min(exp, max_ttl); quelli non validi o scaduti per negative_ttl.
+        Un token valido con exp già passato (leeway, differenze di orologio) non viene memorizzato.
+        """
+        ttl = self.negative_ttl
+        if payload and payload.get("verified") and not payload.get("expired"):
+            ttl = self.max_ttl
+            if payload.get("exp"):
+                ttl = min(ttl, payload["exp"] - time.time())
+        self._store(token, payload, ttl)
+
+    def put_error(self, token: str, error: HttpClientException) -> None:
+        """Memorizza un errore definitivo del servizio token (es. 401) per negative_ttl secondi.
+
+        Si salvano solo i dati dell'errore, così ogni hit solleva un'eccezione nuova.
+        """
+        self._store(token, (error.message, error.server_message, error.status_code, error.url), self.negative_ttl)
+
+    def _store(self, token: str, value: dict | tuple, ttl: float) -> None:
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        key = self.digest(token)
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.monotonic() + ttl, value)
+        if isinstance(value, dict) and value.get("session_id") is not None:
+            self.sessions.setdefault(value["session_id"], set()).add(key)
+        while len(self.entries) > self.max_entries:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, value = self.entries.pop(key)
+        if isinstance(value, dict) and value.get("session_id") is not None:
+            keys = self.sessions.get(value["session_id"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.sessions[value["session_id"]]
+
+    def invalidate(self, token: str) -> None:
+        """Rimuove un token dalla cache."""
+        key = self.digest(token)
+        if key in self.entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_session(self, session_id: int) -> None:
+        """Rimuove dalla cache tutti i token appartenenti alla sessione (logout, sessione bloccata)."""
+        for key in list(self.sessions.get(session_id, ())):
+            self._remove(key)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.sessions.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+token_cache = TokenCache(
+    max_entries=settings.TOKEN_CACHE_MAX_ENTRIES if settings.TOKEN_CACHE_ENABLED else 0,
+    max_ttl=settings.TOKEN_CACHE_MAX_TTL_SECONDS,
+    negative_ttl=settings.TOKEN_CACHE_NEGATIVE_TTL_SECONDS,
+)
+metrics.register("token_cache", token_cache.stats)
@@ -1,26 +1,26 @@
+import asyncio
 import json
 
-from passlib.context import CryptContext
-
 from app.core.logging import get_logger
 from app.schemas.users import ChangePasswordRequest, ChangePasswordResponse, UpdateUserRequest, UpdateUserResponse, DeleteUserResponse
+from app.services.hashing import hasher, pwd_context
 from app.services.http_client import HttpClientException, HttpMethod, HttpUrl, HttpParams, send_request
-from app.db.session import get_db
+from app.db.session import session_scope
 from app.models.user import User
 from datetime import datetime
 
 logger = get_logger(__name__)
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-
 RABBIT_DELETE_TYPE = "DELETE"
 RABBIT_UPDATE_TYPE = "UPDATE"
 RABBIT_CREATE_TYPE = "CREATE"
 
 async def change_password(passwords: ChangePasswordRequest, user_id: int) -> ChangePasswordResponse:
     try:
-        old_password_hashed = pwd_context.hash(passwords.old_password)
-        new_password_hashed = pwd_context.hash(passwords.new_password)
+        old_password_hashed, new_password_hashed = await asyncio.gather(
+            hasher.run(pwd_context.hash, passwords.old_password),
+            hasher.run(pwd_context.hash, passwords.new_password),
+        )
         logger.info(f"Old: {old_password_hashed}")
         logger.info(f"New: {new_password_hashed}")
         params = HttpParams()
@@ -43,6 +43,22 @@ async def change_password(passwords: ChangePasswordRequest, user_id: int) -> Cha
                                   "users/change_password")
 
 
+async def update_password_hash(user_id: int, hashed_password: str) -> None:
+    """Salva sul servizio utenti (la fonte dei dati utente) un nuovo hash della stessa password.
+
+    Usato al login quando i parametri argon2 sono cambiati: la replica locale viene aggiornata
+    dal messaggio UPDATE del servizio utenti.
+    """
+    params = HttpParams()
+    params.add_param("hashed_password", hashed_password)
+    await send_request(
+        method=HttpMethod.PATCH,
+        url=HttpUrl.USERS_SERVICE,
+        endpoint=f"/users/{user_id}",
+        _params=params
+    )
+
+
 async def update_user(user_id: int, new_data: UpdateUserRequest) -> UpdateUserResponse:
     try:
         params = HttpParams()
@@ -82,50 +98,50 @@ async def delete_user(user_id: int) -> DeleteUserResponse:
 async def update_from_rabbitMQ(message):
     async with message.process():
         try:
-            db = next(get_db())
-            response = message.body.decode()
-            json_response = json.loads(response)
-            msg_type = json_response["type"]
-            data = json_response["data"]
-
-            logger.info(f"Received message from RabbitMQ: {msg_type} - {data}")
-
-            user = db.query(User).filter(User.id == data["id"]).first()
-            if msg_type == RABBIT_UPDATE_TYPE:
-                if user is None:
-                    user = User(
-                        id=data["id"],
-                        username=data["username"],
-                        email=data["email"],
-                        name=data["name"],
-                        surname=data["surname"],
-                        hashed_password=data["hashed_password"],
-                        created_at=datetime.fromisoformat(data["created_at"]),
-                        updated_at=datetime.fromisoformat(data["updated_at"])
-                    )
-                    db.add(user)
-                    db.commit()
-                    logger.error(f"User with id {data['id']} not found during update. Created new user.")
-                    return
-                user.username = data["username"]
-                user.email = data["email"]
-                user.name = data["name"]
-                user.surname = data["surname"]
-                user.hashed_password = data["hashed_password"]
-                user.updated_at = datetime.fromisoformat(data["updated_at"])
-                db.commit()
-
-            elif msg_type == RABBIT_DELETE_TYPE:
-                if user:
-                    db.delete(user)
-                    db.commit()
-                else:
-                    logger.error(f"User with id {data['id']} not found during delete.")
+            async with session_scope() as db:
+                response = message.body.decode()
+                json_response = json.loads(response)
+                msg_type = json_response["type"]
+                data = json_response["data"]
+
+                logger.info(f"Received message from RabbitMQ: {msg_type} - {data}")
+
+                user = await db.get(User, data["id"])
+                if msg_type == RABBIT_UPDATE_TYPE:
+                    if user is None:
+                        user = User(
+                            id=data["id"],
+                            username=data["username"],
+                            email=data["email"],
+                            name=data["name"],
+                            surname=data["surname"],
+                            hashed_password=data["hashed_password"],
+                            created_at=datetime.fromisoformat(data["created_at"]),
+                            updated_at=datetime.fromisoformat(data["updated_at"])
+                        )
+                        db.add(user)
+                        await db.commit()
+                        logger.error(f"User with id {data['id']} not found during update. Created new user.")
+                        return
+                    user.username = data["username"]
+                    user.email = data["email"]
+                    user.name = data["name"]
+                    user.surname = data["surname"]
+                    user.hashed_password = data["hashed_password"]
+                    user.updated_at = datetime.fromisoformat(data["updated_at"])
+                    await db.commit()
 
-            elif msg_type == RABBIT_CREATE_TYPE:
-                pass
-            else:
-                logger.error(f"Unsupported message type: {type}")
+                elif msg_type == RABBIT_DELETE_TYPE:
+                    if user:
+                        await db.delete(user)
+                        await db.commit()
+                    else:
+                        logger.error(f"User with id {data['id']} not found during delete.")
+
+                elif msg_type == RABBIT_CREATE_TYPE:
+                    pass
+                else:
+                    logger.error(f"Unsupported message type: {type}")
         except HttpClientException as e:
             logger.error(f"Errore update_from_rabbitMQ: {e}")
         except Exception as e:
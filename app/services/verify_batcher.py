@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.http_client import HttpClientException, HttpMethod, HttpParams, HttpUrl, send_request
+
+logger = get_logger(__name__)
+
+
+class VerifyBatcher():
+    """Raggruppa le verifiche dei token arrivate nello stesso intervallo in un'unica richiesta al servizio token.
+
+    La prima verifica apre una finestra di `window` secondi; la richiesta parte alla chiusura della finestra
+    o appena si raggiungono `max_batch` token. Lo stesso token richiesto più volte nella finestra viene
+    inviato una volta sola. Ogni chiamante riceve il proprio risultato (o errore).
+
+    Contratto dell'endpoint (vedi benchmarks/token_service.py):
+        POST {"tokens": [token, ...]} -> {"results": [risultato, ...]} nello stesso ordine, dove ogni risultato
+        è il payload di /token/verify oppure {"status_code": int, "detail": str} per i token rifiutati.
+    Attributes:
+        pending (dict): token -> future dei chiamanti in attesa della finestra corrente.
+    """
+
+    def __init__(self, endpoint: str, window: float, max_batch: int):
+        self.endpoint = endpoint
+        self.window = window
+        self.max_batch = max_batch
+        self.pending: dict[str, asyncio.Future] = {}
+        self.timer: asyncio.TimerHandle | None = None
+        self.tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.tokens = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.largest_batch = 0
+
+    async def verify(self, token: str) -> dict:
+        """Verifica il token insieme agli altri della stessa finestra.
+
+        Args:
+            token (str): Token da verificare.
+        Raises:
+            HttpClientException: Se il servizio token rifiuta il token o la richiesta fallisce.
+        Returns:
+            dict: Payload del token restituito dal servizio.
+        """
+        future = self.pending.get(token)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            # l'errore viene letto anche se tutti i chiamanti sono stati cancellati, evita warning nel log
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self.pending[token] = future
+            if len(self.pending) >= self.max_batch:
+                self._flush()
+            elif self.timer is None:
+                self.timer = loop.call_later(self.window, self._flush)
+        # shield: la cancellazione di un chiamante non cancella il risultato condiviso con gli altri
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, {}
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, batch: dict[str, asyncio.Future]):
+        self.batches += 1
+        self.tokens += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        try:
+            response = await send_request(
+                url=HttpUrl.TOKEN_SERVICE,
+                method=HttpMethod.POST,
+                endpoint=self.endpoint,
+                _params=HttpParams({"tokens": list(batch)})
+            )
+            results = response.data["results"]
+            if len(results) != len(batch):
+                raise ValueError(f"expected {len(batch)} results, got {len(results)}")
+        except Exception as e:
+            self.errors += 1
+            if not isinstance(e, HttpClientException):
+                logger.error(f"Invalid response from token batch verification: {str(e)}")
+                e = HttpClientException("Internal Server Error", server_message="Swiggity Swoggity, U won't find my log",
+                                        status_code=500, url=self.endpoint)
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(batch.values(), results):
+            if future.done():
+                continue
+            if "verified" not in result and "status_code" in result:
+                future.set_exception(HttpClientException(f"HTTP Error {result['status_code']}",
+                                                         server_message=result.get("detail", ""),
+                                                         status_code=result["status_code"], url=self.endpoint))
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": bool(self.endpoint),
+            "batches": self.batches,
+            "tokens": self.tokens,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "largest_batch": self.largest_batch,
+            "avg_batch": round(self.tokens / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+verify_batcher = VerifyBatcher(
+    endpoint=settings.TOKEN_VERIFY_BATCH_ENDPOINT,
+    window=settings.TOKEN_VERIFY_BATCH_WINDOW_MS / 1000,
+    max_batch=settings.TOKEN_VERIFY_BATCH_MAX,
+)
+metrics.register("verify_batcher", verify_batcher.stats)
@@ -0,0 +1,90 @@
+"""Benchmark dei parametri argon2id: latenza di hash e verifica su questa macchina.
+
+Per ogni combinazione di memoria (KiB), passate e parallelismo misura p50 e p99 di verify (il costo di un login)
+e di hash, eseguendo `--concurrency` operazioni in parallelo come farebbe il pool di hashing (HASH_WORKERS).
+Consiglia i parametri più costosi (memoria x passate) il cui p99 di verify resta sotto `--target-ms`.
+
+Uso:
+    python -m benchmarks.argon2_params --target-ms 250 --concurrency 4
+    python -m benchmarks.argon2_params --memory 19456,65536 --time 2,3 --parallelism 1,4 --samples 50
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.hashing import build_password_context
+
+PASSWORD = "correct horse battery staple"
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def timed(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+def measure(memory_cost: int, time_cost: int, parallelism: int, samples: int, concurrency: int) -> dict:
+    """Misura hash e verify con `concurrency` operazioni contemporanee; latenze in ms."""
+    context = build_password_context(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    stored = context.hash(PASSWORD)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        verify = list(executor.map(lambda _: timed(context.verify, PASSWORD, stored), range(samples)))
+        elapsed = time.perf_counter() - started
+        hashing = list(executor.map(lambda _: timed(context.hash, PASSWORD), range(samples)))
+    return {
+        "memory_cost": memory_cost,
+        "time_cost": time_cost,
+        "parallelism": parallelism,
+        "verify_p50": statistics.median(verify),
+        "verify_p99": percentile(verify, 99),
+        "hash_p99": percentile(hashing, 99),
+        "verify_per_second": samples / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenza di argon2id al variare dei parametri")
+    parser.add_argument("--memory", default="19456,47104,65536,102400", help="memory_cost in KiB")
+    parser.add_argument("--time", default="1,2,3,4", help="time_cost (passate)")
+    parser.add_argument("--parallelism", default="1,2,4", help="lane per hash")
+    parser.add_argument("--samples", type=int, default=30, help="operazioni misurate per combinazione")
+    parser.add_argument("--concurrency", type=int, default=4, help="operazioni contemporanee (HASH_WORKERS)")
+    parser.add_argument("--target-ms", type=float, default=250, help="p99 massimo accettabile per un login")
+    args = parser.parse_args()
+
+    grid = itertools.product(*(sorted(int(v) for v in values.split(","))
+                               for values in (args.memory, args.time, args.parallelism)))
+    print(f"{'memory KiB':>10} | {'time':>4} | {'par':>3} | {'verify p50':>10} | {'verify p99':>10} | "
+          f"{'hash p99':>9} | {'verify/s':>8}")
+    results = []
+    for memory_cost, time_cost, parallelism in grid:
+        result = measure(memory_cost, time_cost, parallelism, args.samples, args.concurrency)
+        results.append(result)
+        print(f"{memory_cost:>10} | {time_cost:>4} | {parallelism:>3} | {result['verify_p50']:>8.1f}ms | "
+              f"{result['verify_p99']:>8.1f}ms | {result['hash_p99']:>7.1f}ms | {result['verify_per_second']:>8.1f}")
+
+    eligible = [r for r in results if r["verify_p99"] <= args.target_ms]
+    if not eligible:
+        print(f"\nNessuna combinazione ha p99 di verify <= {args.target_ms}ms: ridurre memoria o passate.")
+        return
+    # a parità di costo (memoria x passate) preferisco la latenza minore
+    best = max(eligible, key=lambda r: (r["memory_cost"] * r["time_cost"], -r["verify_p99"]))
+    print(f"\nParametri consigliati (p99 verify {best['verify_p99']:.1f}ms <= {args.target_ms}ms, "
+          f"{args.concurrency} operazioni contemporanee):")
+    print(f"GATEWAY_ARGON2_MEMORY_COST={best['memory_cost']}")
+    print(f"GATEWAY_ARGON2_TIME_COST={best['time_cost']}")
+    print(f"GATEWAY_ARGON2_PARALLELISM={best['parallelism']}")
+
+
+if __name__ == "__main__":
+    main()
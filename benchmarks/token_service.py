@@ -0,0 +1,103 @@
+"""Servizio token di prova, per sviluppo locale e benchmark.
+
+Firma e verifica JWT HS256 con un segreto fisso ed espone gli stessi endpoint del servizio token reale
+usati dal gateway, più l'endpoint di verifica a blocchi (TOKEN_VERIFY_BATCH_ENDPOINT):
+
+    POST /api/v1/token/verify_batch  {"tokens": ["...", ...]}
+    -> 200 {"results": [{...claims, "verified": true, "expired": false}, {"status_code": 401, "detail": "..."}, ...]}
+
+I risultati sono nello stesso ordine dei token; un token non valido non fa fallire l'intera richiesta.
+GET /stats restituisce il numero di richieste ricevute per endpoint.
+
+Uso:
+    python -m benchmarks.token_service --port 8002
+    GATEWAY_TOKEN_SERVICE_URL=http://localhost:8002 GATEWAY_TOKEN_VERIFY_BATCH_ENDPOINT=/token/verify_batch ...
+"""
+from __future__ import annotations
+
+import argparse
+import time
+import uuid
+from collections import Counter
+
+from fastapi import APIRouter, FastAPI, HTTPException
+from jose import ExpiredSignatureError, JWTError, jwt
+
+SECRET = "local-token-service-secret"
+ALGORITHM = "HS256"
+
+requests = Counter()
+router = APIRouter(prefix="/api/v1/token")
+
+
+def sign(data: dict, expires_in_minutes: int) -> str:
+    claims = {**data, "jti": uuid.uuid4().hex, "exp": int(time.time()) + expires_in_minutes * 60}
+    return jwt.encode(claims, SECRET, algorithm=ALGORITHM)
+
+
+def check(token: str) -> dict:
+    """Verifica un token come /token/verify: payload con verified/expired, oppure HTTPException 401."""
+    try:
+        return {**jwt.decode(token, SECRET, algorithms=[ALGORITHM]), "verified": True, "expired": False}
+    except ExpiredSignatureError:
+        claims = jwt.decode(token, SECRET, algorithms=[ALGORITHM], options={"verify_exp": False})
+        return {**claims, "verified": True, "expired": True}
+    except JWTError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
+
+
+@router.post("/create")
+async def create(body: dict):
+    requests["create"] += 1
+    expires_in = body.pop("expires_in", 30)
+    return {"token": sign(body, expires_in)}
+
+
+@router.post("/create_pair")
+async def create_pair(body: dict):
+    requests["create_pair"] += 1
+    access_expires_in = body.pop("access_expires_in", 30)
+    refresh_expires_in = body.pop("refresh_expires_in", 30 * 24 * 60)
+    return {"access_token": sign(body, access_expires_in), "refresh_token": sign(body, refresh_expires_in)}
+
+
+@router.post("/verify")
+async def verify(body: dict):
+    requests["verify"] += 1
+    return check(body["token"])
+
+
+@router.post("/verify_batch")
+async def verify_batch(body: dict):
+    requests["verify_batch"] += 1
+    requests["verify_batch_tokens"] += len(body["tokens"])
+    results = []
+    for token in body["tokens"]:
+        try:
+            results.append(check(token))
+        except HTTPException as e:
+            results.append({"status_code": e.status_code, "detail": e.detail})
+    return {"results": results}
+
+
+app = FastAPI(title="Token service (stub)")
+app.include_router(router)
+
+
+@app.get("/stats")
+async def stats():
+    return dict(requests)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servizio token di prova")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
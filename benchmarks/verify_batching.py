@@ -0,0 +1,60 @@
+"""Benchmark delle verifiche remote dei token, con e senza micro-batching.
+
+Invia raffiche di verifiche concorrenti (token tutti diversi, quindi senza aiuto dalla token_cache)
+al servizio token di prova (benchmarks/token_service.py, montato in-process) e conta le richieste
+ricevute dal servizio.
+
+Uso:
+    python -m benchmarks.verify_batching --burst 500 --bursts 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.services import http_client
+from app.services.auth import verify_token_remote
+from app.services.http_client import HttpUrl
+from app.services.verify_batcher import verify_batcher
+from benchmarks import token_service
+
+
+async def run_bursts(tokens: list[str], burst: int) -> float:
+    started = time.perf_counter()
+    for offset in range(0, len(tokens), burst):
+        await asyncio.gather(*(verify_token_remote(token) for token in tokens[offset:offset + burst]))
+    return time.perf_counter() - started
+
+
+async def run(burst: int, bursts: int, window_ms: float, max_batch: int) -> None:
+    transport = httpx.ASGITransport(app=token_service.app)
+    http_client.clients.clients[HttpUrl.TOKEN_SERVICE] = httpx.AsyncClient(transport=transport)
+    tokens = [token_service.sign({"user_id": n, "session_id": n}, 30) for n in range(burst * bursts)]
+
+    print(f"{'mode':>10} | {'verifications':>13} | {'upstream requests':>17} | {'seconds':>8}")
+    for mode in ("single", "batched"):
+        token_service.requests.clear()
+        verify_batcher.endpoint = "/token/verify_batch" if mode == "batched" else ""
+        verify_batcher.window = window_ms / 1000
+        verify_batcher.max_batch = max_batch
+        elapsed = await run_bursts(tokens, burst)
+        upstream = token_service.requests["verify"] + token_service.requests["verify_batch"]
+        print(f"{mode:>10} | {len(tokens):>13} | {upstream:>17} | {elapsed:>8.2f}")
+    await http_client.clients.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifiche dei token con e senza micro-batching")
+    parser.add_argument("--burst", type=int, default=500, help="verifiche concorrenti per raffica")
+    parser.add_argument("--bursts", type=int, default=20, help="numero di raffiche")
+    parser.add_argument("--window-ms", type=float, default=2.0, help="finestra del batcher")
+    parser.add_argument("--max-batch", type=int, default=64, help="token per richiesta")
+    args = parser.parse_args()
+    asyncio.run(run(args.burst, args.bursts, args.window_ms, args.max_batch))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,71 @@
+import asyncio
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
 
 from app.api.deps import get_db
+from app.core.config import settings
 from app.db.base import Base
 from app.main import app
+from app.services import http_client
+from app.services.rate_limit import MemoryBuckets, login_limiter
+from app.services.revocation import revoked_sessions
+from app.services.session_store import session_store
 
 # DB in memoria per i test
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL, poolclass=StaticPool)
+TestingSessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 
 
 # Override della dipendenza get_db per i test
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
+async def override_get_db():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 app.dependency_overrides[get_db] = override_get_db
+settings.SWEEPER_ENABLED = False  # la pulizia si testa direttamente, sul DB di test
+settings.SESSION_REVOCATION_BROADCAST = False  # nessun RabbitMQ nei test
+session_store.session_factory = TestingSessionLocal
+
+
+async def reset_database():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
 
 
 @pytest.fixture(scope="function")
 def client():
     # Ricrea le tabelle per ogni test
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    asyncio.run(reset_database())
+    revoked_sessions.clear()
+    login_limiter.store = MemoryBuckets()
     with TestClient(app) as c:
         yield c
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Sostituisce il client httpx di un servizio con uno dal transport finto, ripristinato e chiuso a fine test.
+
+    Uso: upstream(HttpUrl.SCHOOL_SERVICE, handler), con handler(request) -> httpx.Response (anche async),
+    oppure upstream(url, transport=...) con un transport qualsiasi.
+    """
+    created = []
+
+    def use(url: http_client.HttpUrl, handler=None, transport: httpx.AsyncBaseTransport | None = None):
+        mock = httpx.AsyncClient(transport=transport or httpx.MockTransport(handler))
+        monkeypatch.setitem(http_client.clients.clients, url, mock)
+        created.append(mock)
+        return mock
+
+    yield use
+    for mock in created:
+        if not mock.is_closed:
+            asyncio.run(mock.aclose())
@@ -0,0 +1,332 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from jose import jwt
+from passlib.context import CryptContext
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.core.security import token_digest
+from app.models.refreshToken import RefreshToken
+from app.models.session import Session
+from app.models.user import User
+from app.services import auth, http_client
+from app.services.hashing import build_password_context, pwd_context
+from app.services.http_client import HttpUrl
+from app.services.revocation import revoked_sessions
+from app.services.resp import RespClient
+from app.services.session_store import MemorySessionStore, RedisSessionStore, RotationRejected
+from app.services.token_cache import token_cache
+from tests.conftest import TestingSessionLocal
+
+SECRET = "test-secret"
+
+
+@pytest.fixture
+def token_service(client, upstream):
+    """Sostituisce il servizio token con un transport finto che firma e verifica JWT HS256."""
+    counter = itertools.count()
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        body = json.loads(request.content or b"{}")
+        if request.url.path.endswith("/token/create"):
+            claims = {**body, "jti": str(next(counter)), "exp": int(time.time()) + 60 * body.get("expires_in", 30)}
+            return httpx.Response(200, json={"token": jwt.encode(claims, SECRET, algorithm="HS256")})
+        if request.url.path.endswith("/token/verify"):
+            claims = jwt.decode(body["token"], SECRET, algorithms=["HS256"])
+            return httpx.Response(200, json={**claims, "verified": True, "expired": False})
+        return httpx.Response(404, json={"detail": "Not Found"})
+
+    upstream(HttpUrl.TOKEN_SERVICE, handler)
+    token_cache.clear()
+    return calls
+
+
+def create_user(email="user@example.com", password="password", context=None):
+    context = context or CryptContext(schemes=["argon2"])
+
+    async def run():
+        async with TestingSessionLocal() as db:
+            db.add(User(id=1, username="user", email=email, hashed_password=context.hash(password)))
+            await db.commit()
+    asyncio.run(run())
+
+
+def test_login_wrong_password(client, token_service):
+    create_user()
+    response = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "wrong"})
+    assert response.status_code == 401
+
+
+@pytest.fixture
+def redis_store():
+    """RedisSessionStore su un server fakeredis locale, raggiunto via TCP come un Redis vero."""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield RedisSessionStore(RespClient(f"redis://127.0.0.1:{server.server_address[1]}/0"), prefix="test:")
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["rows", "family", "memory", "redis"])
+def token_storage(request, monkeypatch):
+    """Stesso flusso con token salvati per riga, solo coppia corrente su SQL, e archivi sessioni in memoria e Redis."""
+    if request.param in ("memory", "redis"):
+        store = MemorySessionStore(first_id=1) if request.param == "memory" else request.getfixturevalue("redis_store")
+        monkeypatch.setattr(auth, "session_store", store)
+        monkeypatch.setattr(revoked_sessions, "store", store)
+    else:
+        monkeypatch.setattr(settings, "TOKEN_STORAGE", request.param)
+    return request.param
+
+
+def test_login_rehashes_password_with_new_parameters(client, token_service, upstream):
+    updates = []
+    upstream(HttpUrl.USERS_SERVICE,
+             lambda request: updates.append((request.method, request.url.path, json.loads(request.content)))
+             or httpx.Response(200, json={}))
+    create_user(context=build_password_context(time_cost=1, memory_cost=8192, parallelism=1))
+    response = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"})
+    assert response.status_code == 200
+
+    # il nuovo hash va al servizio utenti (fonte dei dati), la replica locale si aggiorna con il messaggio UPDATE
+    [(method, path, body)] = updates
+    assert (method, path) == ("PATCH", "/api/v1/users/1")
+    assert not pwd_context.needs_update(body["hashed_password"])
+    assert pwd_context.verify("password", body["hashed_password"])
+
+
+def test_register_sends_the_password_hash_to_the_users_service(client, token_service, upstream):
+    created = []
+
+    def users_service(request):
+        created.append(json.loads(request.content))
+        return httpx.Response(200, json={"id": 1, "created_at": None, "updated_at": None})
+
+    upstream(HttpUrl.USERS_SERVICE, users_service)
+    registration = {"username": "user", "name": "Mario", "surname": "Rossi", "email": "user@example.com",
+                    "password": "password"}
+    response = client.post("/api/v1/auth/register", json=registration)
+    assert response.status_code == 200
+
+    # il servizio utenti è la fonte dei dati: riceve l'hash, mai la password in chiaro
+    [body] = created
+    assert body["hashed_password"] != "password" and pwd_context.verify("password", body["hashed_password"])
+    response = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"})
+    assert response.status_code == 200
+
+
+def test_login_refresh_and_reuse_detection(client, token_service, token_storage):
+    create_user()
+    response = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"})
+    assert response.status_code == 200
+    tokens = response.json()
+
+    response = client.post("/api/v1/auth/refresh", json={"token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    new_tokens = response.json()
+
+    # il vecchio refresh token è già stato usato: la sessione viene bloccata
+    response = client.post("/api/v1/auth/refresh", json={"token": tokens["refresh_token"]})
+    assert response.status_code == 401
+    response = client.post("/api/v1/auth/refresh", json={"token": new_tokens["refresh_token"]})
+    assert response.status_code == 401
+
+
+def test_refresh_token_of_another_user_does_not_block_the_session(client, token_service, token_storage):
+    create_user()
+    tokens = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"}).json()
+
+    # token firmato dal servizio token ma di un altro utente, con lo stesso session_id (es. emesso prima di un riavvio)
+    foreign = jwt.encode({"username": "other", "user_id": 2, "session_id": 1, "exp": int(time.time()) + 60},
+                         SECRET, algorithm="HS256")
+    assert client.post("/api/v1/auth/refresh", json={"token": foreign}).status_code == 401
+    response = client.post("/api/v1/auth/refresh", json={"token": tokens["refresh_token"]})
+    assert response.status_code == 200
+
+
+def test_failed_token_issue_keeps_session_usable(client, token_service, token_storage, monkeypatch):
+    create_user()
+    create_token_pair = auth.create_token_pair
+    failures = []
+
+    async def flaky_create_token_pair(*args, **kwargs):
+        if not failures:
+            failures.append(1)
+            raise http_client.HttpClientException("Service Unavailable", "token_service is down", 503, "/token/create")
+        return await create_token_pair(*args, **kwargs)
+
+    monkeypatch.setattr(auth, "create_token_pair", flaky_create_token_pair)
+    # login fallito: nessuna sessione rimasta senza token
+    response = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"})
+    assert response.status_code == 503
+
+    tokens = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"}).json()
+    sessions = client.get("/api/v1/users/sessions",
+                          headers={"Authorization": f"Bearer {tokens['access_token']}"}).json()["sessions"]
+    assert len(sessions) == 1
+    failures.clear()
+    # refresh fallito: il refresh token resta valido e il nuovo tentativo non viene trattato come riuso
+    response = client.post("/api/v1/auth/refresh", json={"token": tokens["refresh_token"]})
+    assert response.status_code == 503
+    response = client.post("/api/v1/auth/refresh", json={"token": tokens["refresh_token"]})
+    assert response.status_code == 200
+
+
+def test_family_storage_keeps_one_row_per_session(client, token_service, monkeypatch):
+    monkeypatch.setattr(settings, "TOKEN_STORAGE", "family")
+    create_user()
+    tokens = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"}).json()
+    for _ in range(3):
+        tokens = client.post("/api/v1/auth/refresh", json={"token": tokens["refresh_token"]}).json()
+
+    async def load():
+        async with TestingSessionLocal() as db:
+            token_rows = (await db.execute(select(func.count()).select_from(RefreshToken))).scalar_one()
+            return token_rows, await db.get(Session, 1)
+    token_rows, session = asyncio.run(load())
+    assert token_rows == 0
+    assert session.token_generation == 3
+    assert session.refresh_token_hash == token_digest(tokens["refresh_token"])
+
+
+def test_logout(client, token_service, token_storage):
+    create_user()
+    tokens = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"}).json()
+    response = client.post("/api/v1/auth/logout", json={"token": tokens["access_token"]})
+    assert response.status_code == 200
+
+    response = client.post("/api/v1/auth/refresh", json={"token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+
+def test_protected_route_verifies_token_once(client, token_service, upstream):
+    users_calls = []
+    upstream(HttpUrl.USERS_SERVICE,
+             lambda request: users_calls.append(request.url.path) or httpx.Response(200, json={}))
+    create_user()
+    tokens = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"}).json()
+
+    response = client.patch("/api/v1/users/", json={"name": "Mario"})
+    assert response.status_code == 401
+
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    response = client.patch("/api/v1/users/", json={"name": "Mario"}, headers=headers)
+    assert response.status_code == 200
+    assert users_calls == ["/api/v1/users/1"]
+    # dipendenza del router e parametro della route condividono la stessa verifica
+    assert token_service.count("/api/v1/token/verify") == 1
+
+    client.post("/api/v1/auth/logout", json={"token": tokens["access_token"]})
+    response = client.patch("/api/v1/users/", json={"name": "Mario"}, headers=headers)
+    assert response.status_code == 401
+
+
+def test_list_and_revoke_sessions(client, token_service, token_storage):
+    create_user()
+    logins = [client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"}).json()
+              for _ in range(4)]
+    headers = {"Authorization": f"Bearer {logins[-1]['access_token']}"}
+
+    # paginazione keyset, dalla sessione più recente
+    page = client.get("/api/v1/users/sessions", params={"limit": 3}, headers=headers).json()
+    assert [s["id"] for s in page["sessions"]] == [4, 3, 2]
+    assert page["sessions"][0]["current"] is True
+    page = client.get("/api/v1/users/sessions", params={"limit": 3, "before": page["next_cursor"]},
+                      headers=headers).json()
+    assert [s["id"] for s in page["sessions"]] == [1] and page["next_cursor"] is None
+
+    # created_before con un fuso qualsiasi indica lo stesso istante su tutti gli archivi
+    now = datetime.now(timezone.utc)
+    earlier = (now - timedelta(minutes=1)).astimezone(timezone(timedelta(hours=10))).isoformat()
+    later = (now + timedelta(minutes=1)).astimezone(timezone(timedelta(hours=-10))).isoformat()
+    response = client.post("/api/v1/users/sessions/revoke", json={"created_before": earlier}, headers=headers)
+    assert response.status_code == 200 and response.json()["revoked"] == []
+    response = client.post("/api/v1/users/sessions/revoke", json={"created_before": later, "session_ids": [1, 4]},
+                           headers=headers)
+    assert response.json()["revoked"] == [1]
+
+    # "esci da tutti gli altri dispositivi": la sessione corrente resta attiva
+    response = client.post("/api/v1/users/sessions/revoke", json={}, headers=headers)
+    assert response.status_code == 200
+    assert sorted(response.json()["revoked"]) == [2, 3]
+    assert client.post("/api/v1/auth/refresh", json={"token": logins[0]["refresh_token"]}).status_code == 401
+    assert client.post("/api/v1/auth/refresh", json={"token": logins[-1]["refresh_token"]}).status_code == 200
+    assert [s["id"] for s in client.get("/api/v1/users/sessions", headers=headers).json()["sessions"]] == [4]
+
+
+def test_revoking_another_users_sessions_requires_admin(client, token_service):
+    create_user()
+    tokens = client.post("/api/v1/auth/login", json={"email": "user@example.com", "password": "password"}).json()
+    response = client.post("/api/v1/users/1/sessions/revoke", json={},
+                           headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert response.status_code == 403
+
+    admin_token = jwt.encode({"username": "admin", "user_id": 99, "session_id": 1, "role": "admin",
+                              "exp": int(time.time()) + 60}, SECRET, algorithm="HS256")
+    response = client.post("/api/v1/users/1/sessions/revoke", json={},
+                           headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200 and response.json()["revoked"] == [1]
+
+
+def test_redis_store_skips_sessions_expired_by_ttl(redis_store):
+    """Le sessioni scadute spariscono per TTL ma il loro id resta nell'indice dell'utente finché non viene letto."""
+    counter = itertools.count()
+
+    async def issue(session_id, expires_at):
+        n = next(counter)
+        return f"access-{n}", f"refresh-{n}"
+
+    async def run():
+        now = datetime.now()
+        for expires_at in [now + timedelta(days=1), now + timedelta(days=1), now - timedelta(seconds=1),
+                           now - timedelta(seconds=1)]:
+            await redis_store.create(7, expires_at, issue)
+        assert await redis_store.get(3) is None
+        # la pagina non resta corta per gli id scaduti: si continua a leggere l'indice
+        assert [s.id for s in await redis_store.list_active(7, None, 2)] == [2, 1]
+        assert await redis_store.client.execute("ZRANGE", "test:user:7:sessions", 0, -1) == ["1", "2"]
+        assert await redis_store.revoke_user(7, None, 2, None) == [1]
+        assert [s.id for s in await redis_store.list_active(7, None, 10)] == [2]
+        assert [session_id async for session_id in redis_store.revoked()] == [1]
+        await redis_store.close()
+    asyncio.run(run())
+
+
+def test_memory_store_rejects_tokens_from_a_previous_start():
+    counter = itertools.count()
+
+    async def issue(session_id, expires_at):
+        n = next(counter)
+        return f"access-{n}", f"refresh-{n}"
+
+    async def run():
+        expires_at = datetime.now() + timedelta(days=1)
+        previous = MemorySessionStore()
+        _, refresh = await previous.create(1, expires_at, issue)
+        [old_session] = await previous.list_active(1, None, 10)
+        await asyncio.sleep(0.01)
+
+        # riavvio: gli id non ripartono da capo, il token del vecchio avvio non indica nessuna sessione
+        store = MemorySessionStore()
+        await store.create(2, expires_at, issue)
+        [session] = await store.list_active(2, None, 10)
+        assert session.id > old_session.id
+        with pytest.raises(RotationRejected) as error:
+            await store.rotate(refresh, old_session.id, 1, issue)
+        assert not error.value.blocked
+
+        # anche se l'id coincidesse, una sessione di un altro utente non viene bloccata
+        with pytest.raises(RotationRejected) as error:
+            await store.rotate(refresh, session.id, 1, issue)
+        assert not error.value.blocked and (await store.get(session.id)).is_active
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import http_client
+from app.services.bulkhead import Bulkhead, BulkheadFull
+from app.services.http_client import HttpMethod, HttpUrl, UpstreamOverloadedException, send_request
+
+
+def test_bulkhead_queues_then_rejects():
+    async def run():
+        bulkhead = Bulkhead("school", max_concurrent=1, max_queue=1, queue_timeout=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with bulkhead:
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(bulkhead.__aenter__())
+        await asyncio.sleep(0)
+        assert bulkhead.stats()["in_flight"] == 1 and bulkhead.queued == 1
+        # coda piena: rifiuto immediato
+        with pytest.raises(BulkheadFull):
+            await bulkhead.__aenter__()
+        # attesa oltre queue_timeout: rifiuto
+        with pytest.raises(BulkheadFull):
+            await waiter
+        release.set()
+        await holder
+        assert bulkhead.stats() == {"max_concurrent": 1, "in_flight": 0, "queued": 0, "max_queued": 1,
+                                    "rejected": {"queue_full": 1, "queue_timeout": 1}}
+    asyncio.run(run())
+
+
+def test_slow_upstream_only_affects_its_own_requests(monkeypatch, upstream):
+    async def run():
+        release = asyncio.Event()
+
+        async def slow(request):
+            await release.wait()
+            return httpx.Response(200, json={})
+
+        upstream(HttpUrl.SCHOOL_SERVICE, slow)
+        upstream(HttpUrl.TOKEN_SERVICE, lambda r: httpx.Response(200, json={}))
+        monkeypatch.setitem(http_client.bulkheads, HttpUrl.SCHOOL_SERVICE,
+                            Bulkhead("school_service", max_concurrent=2, max_queue=0, queue_timeout=1))
+
+        pending = [asyncio.create_task(send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.GET, "/school/",
+                                                    coalesce=False))
+                   for _ in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(UpstreamOverloadedException) as error:
+            await send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.GET, "/school/", coalesce=False)
+        assert error.value.status_code == 503
+        assert (await send_request(HttpUrl.TOKEN_SERVICE, HttpMethod.POST, "/token/verify")).status_code == 200
+        release.set()
+        await asyncio.gather(*pending)
+    asyncio.run(run())
@@ -0,0 +1,114 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import http_client
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.http_client import CircuitOpenException, HttpClientException, HttpMethod, HttpUrl, send_request
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_breaker(clock, **overrides):
+    options = dict(name="school", window=10, min_calls=4, failure_rate=0.5, slow_call_seconds=1.0,
+                   slow_call_rate=0.8, open_seconds=5, half_open_calls=2, clock=clock)
+    return CircuitBreaker(**{**options, **overrides})
+
+
+def call(breaker, failed, duration=0.1):
+    """Una chiamata completa: ammessa da allow() e registrata subito."""
+    permit = breaker.allow()
+    assert permit is not None
+    breaker.record(permit, failed, duration)
+
+
+def test_opens_on_failure_rate_and_closes_after_probes():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for failed in (False, True, False):
+        call(breaker, failed)
+    assert breaker.state == "closed"  # meno di min_calls chiamate nella finestra
+    call(breaker, True)
+    assert breaker.state == "open" and breaker.allow() is None and breaker.rejected == 1
+
+    # dopo open_seconds passano solo half_open_calls chiamate di prova
+    clock.now = 5
+    probes = [breaker.allow(), breaker.allow()]
+    assert all(permit.probe for permit in probes) and breaker.allow() is None
+    assert breaker.state == "half_open"
+    for permit in probes:
+        breaker.record(permit, False, 0.1)
+    assert breaker.state == "closed" and breaker.stats()["calls_in_window"] == 0
+
+
+def test_slow_calls_open_and_failed_probe_reopens():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        call(breaker, False, 2.0)
+    assert breaker.state == "open"
+    clock.now = 5
+    call(breaker, True)
+    assert breaker.state == "open" and breaker.opened == 2 and breaker.retry_after() == 5
+
+    # gli esiti fuori dalla finestra non contano
+    clock.now = 100
+    breaker = make_breaker(clock)
+    for failed in (True, True, True):
+        call(breaker, failed)
+    clock.now = 111
+    call(breaker, True)
+    assert breaker.state == "closed"
+
+
+def test_calls_started_before_a_transition_are_ignored():
+    clock = FakeClock()
+    breaker = make_breaker(clock, half_open_calls=1)
+    in_flight = [breaker.allow() for _ in range(8)]
+    for permit in in_flight[:4]:
+        breaker.record(permit, True, 0.1)
+    assert breaker.state == "open"
+
+    # la prova è ancora in corso quando terminano le chiamate partite a circuito chiuso: non la sostituiscono
+    clock.now = 5
+    probe = breaker.allow()
+    assert probe.probe and breaker.allow() is None
+    for permit in in_flight[4:]:
+        breaker.record(permit, False, 0.1)
+    assert breaker.state == "half_open" and breaker.probes == 1 and breaker.allow() is None
+
+    breaker.record(probe, False, 0.1)
+    assert breaker.state == "closed"
+
+
+def test_send_request_fails_fast_when_open(monkeypatch, upstream):
+    calls = []
+    upstream(HttpUrl.SCHOOL_SERVICE,
+             lambda request: calls.append(request) or httpx.Response(503, json={"detail": "down"}))
+    monkeypatch.setitem(http_client.breakers, HttpUrl.SCHOOL_SERVICE, make_breaker(FakeClock(), min_calls=2))
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(HttpClientException) as error:
+                await send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.GET, "/school/")
+            assert error.value.status_code == 503 and error.value.server_message == "down"
+        with pytest.raises(CircuitOpenException) as error:
+            await send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.GET, "/school/")
+        assert error.value.status_code == 503 and error.value.retry_after == 5
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_open_circuit_sets_retry_after_on_the_response(client, monkeypatch):
+    breaker = make_breaker(FakeClock(), min_calls=1)
+    call(breaker, True)
+    monkeypatch.setitem(http_client.breakers, HttpUrl.TOKEN_SERVICE, breaker)
+    response = client.get("/api/v1/users/sessions", headers={"Authorization": "Bearer some-token"})
+    assert response.status_code == 503 and response.headers["Retry-After"] == "5"
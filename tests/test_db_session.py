@@ -0,0 +1,12 @@
+from app.core.config import settings
+from app.db.session import engine_options
+
+
+def test_pool_sized_from_worker_budget(monkeypatch):
+    monkeypatch.setattr(settings, "DB_MAX_CONNECTIONS", 80)
+    monkeypatch.setattr(settings, "DB_WORKERS", 4)
+    options = engine_options("postgresql+asyncpg://gateway@db/gateway")
+    assert options["pool_size"] + options["max_overflow"] == 20
+    # l'engine sincrono ha una sola connessione, fuori dalla quota del worker
+    options = engine_options("postgresql://gateway@db/gateway", max_connections=1)
+    assert (options["pool_size"], options["max_overflow"]) == (1, 0)
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+from app.core.config import Settings, settings
+from app.services.http_client import HttpClientRegistry, HttpUrl
+
+
+def test_http_version_per_upstream(monkeypatch):
+    monkeypatch.setattr(settings, "SCHOOL_SERVICE_HTTP_VERSION", "h2c")
+    monkeypatch.setattr(settings, "TOKEN_SERVICE_HTTP_VERSION", "2")
+    registry = HttpClientRegistry()
+
+    async def run():
+        await registry.start()
+        pools = {url: registry.get(url)._transport._pool for url in HttpUrl}
+        # h2c: solo HTTP/2 (prior knowledge); "2": HTTP/2 negoziato, con HTTP/1.1 come ripiego
+        assert (pools[HttpUrl.SCHOOL_SERVICE]._http1, pools[HttpUrl.SCHOOL_SERVICE]._http2) == (False, True)
+        assert (pools[HttpUrl.TOKEN_SERVICE]._http1, pools[HttpUrl.TOKEN_SERVICE]._http2) == (True, True)
+        assert (pools[HttpUrl.USERS_SERVICE]._http1, pools[HttpUrl.USERS_SERVICE]._http2) == (True, False)
+        stats = registry.stats()
+        assert stats["school_service"]["http_version"] == "h2c"
+        assert stats["school_service"]["connections"] == 0 and stats["school_service"]["active_streams"] == 0
+        await registry.close()
+    asyncio.run(run())
+
+
+def test_unknown_http_version_is_rejected():
+    with pytest.raises(ValidationError):
+        Settings(TOKEN_SERVICE_HTTP_VERSION="3")
+    with pytest.raises(ValidationError):
+        Settings(USERS_SERVICE_HTTP_VERSION="http2")
+    assert Settings(SCHOOL_SERVICE_HTTP_VERSION="h2c").SCHOOL_SERVICE_HTTP_VERSION == "h2c"
@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from jose import jwt
+
+from app.core.config import settings
+from app.services.jwt_verifier import LocalTokenVerifier
+
+SECRET = "test-secret"
+
+
+def make_verifier(monkeypatch):
+    monkeypatch.setattr(settings, "JWT_SECRET", SECRET)
+    monkeypatch.setattr(settings, "JWT_ALGORITHM", "HS256")
+    return LocalTokenVerifier()
+
+
+def test_verify_valid_token(monkeypatch):
+    verifier = make_verifier(monkeypatch)
+    token = jwt.encode({"user_id": 1, "session_id": 2, "exp": int(time.time()) + 60}, SECRET, algorithm="HS256")
+    payload = asyncio.run(verifier.verify(token))
+    assert payload["verified"] is True
+    assert payload["expired"] is False
+    assert payload["session_id"] == 2
+
+
+def test_verify_expired_token_keeps_claims(monkeypatch):
+    verifier = make_verifier(monkeypatch)
+    token = jwt.encode({"user_id": 1, "session_id": 2, "exp": int(time.time()) - 60}, SECRET, algorithm="HS256")
+    payload = asyncio.run(verifier.verify(token))
+    assert payload["verified"] is True
+    assert payload["expired"] is True
+    assert payload["user_id"] == 1
+
+
+def test_verify_wrong_signature_falls_back(monkeypatch):
+    verifier = make_verifier(monkeypatch)
+    token = jwt.encode({"user_id": 1, "exp": int(time.time()) + 60}, "another-secret", algorithm="HS256")
+    assert asyncio.run(verifier.verify(token)) is None
+
+
+def test_verify_malformed_token(monkeypatch):
+    verifier = make_verifier(monkeypatch)
+    assert asyncio.run(verifier.verify("not-a-jwt")) == {"verified": False, "expired": False}
@@ -0,0 +1,49 @@
+import pytest
+
+from app.core.config import settings
+from app.services.rate_limit import MemoryBuckets, SqliteBuckets
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SqliteBuckets(str(tmp_path / "limits.db"))
+    return MemoryBuckets()
+
+
+def test_bucket_allows_burst_then_refills(store):
+    # 1 gettone al secondo, capacità 3
+    assert [store.take("k", 1.0, 3, 100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert store.take("k", 1.0, 3, 100.0) == pytest.approx(1.0)
+    assert store.take("k", 1.0, 3, 100.5) == pytest.approx(0.5)
+    assert store.take("k", 1.0, 3, 101.0) == 0.0
+    # bucket diversi sono indipendenti
+    assert store.take("other", 1.0, 3, 101.0) == 0.0
+
+
+def test_rejected_request_consumes_no_bucket(store):
+    buckets = [("ip", 1.0, 2), ("email", 1.0, 1)]
+    assert store.take_all(buckets, 100.0) == [0.0, 0.0]
+    assert store.take_all(buckets, 100.0) == [0.0, pytest.approx(1.0)]
+    # il gettone dell'IP non è stato speso dalla richiesta rifiutata per l'email
+    assert store.take("ip", 1.0, 2, 100.0) == 0.0
+    assert store.take("ip", 1.0, 2, 100.0) > 0
+
+
+def test_sqlite_buckets_are_shared_between_connections(tmp_path):
+    path = str(tmp_path / "limits.db")
+    first, second = SqliteBuckets(path), SqliteBuckets(path)
+    assert first.take("k", 1.0, 2, 100.0) == 0.0
+    assert second.take("k", 1.0, 2, 100.0) == 0.0
+    assert first.take("k", 1.0, 2, 100.0) > 0
+
+
+def test_login_rejected_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(settings, "LOGIN_LIMIT_EMAIL_PER_MINUTE", 1)
+    monkeypatch.setattr(settings, "LOGIN_LIMIT_EMAIL_BURST", 2)
+    body = {"email": "victim@example.com", "password": "guess"}
+    assert [client.post("/api/v1/auth/login", json=body).status_code for _ in range(2)] == [401, 401]
+
+    response = client.post("/api/v1/auth/login", json=body)
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 60
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from app.services.resp import RespClient, RespError, encode_command
+
+
+def test_encode_command():
+    assert encode_command("SET", "key", 5) == b"*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$1\r\n5\r\n"
+
+
+def test_pipeline_over_a_local_stand_in():
+    """Un server RESP minimo risponde con risposte preconfezionate, una per comando ricevuto."""
+    replies = [b"+OK\r\n", b":7\r\n", b"$-1\r\n", b"*2\r\n$1\r\na\r\n$-1\r\n", b"-ERR wrong type\r\n"]
+    received = []
+
+    async def handle(reader, writer):
+        while line := await reader.readline():
+            count = int(line[1:])
+            args = []
+            for _ in range(count):
+                length = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(length + 2))[:-2].decode())
+            received.append(args)
+            writer.write(replies[len(received) - 1])
+            await writer.drain()
+
+    async def run():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = RespClient(f"redis://127.0.0.1:{port}", pool_size=2)
+        assert await client.pipeline([("SET", "k", "v"), ("INCR", "n"), ("GET", "missing"),
+                                      ("MGET", "k", "missing")]) == ["OK", 7, None, ["a", None]]
+        with pytest.raises(RespError, match="wrong type"):
+            await client.execute("LPUSH", "k", "x")
+        assert received[0] == ["SET", "k", "v"] and client.stats()["connections_opened"] == 1
+        await client.close()
+        server.close()
+        await server.wait_closed()
+    asyncio.run(run())
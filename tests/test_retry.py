@@ -0,0 +1,118 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services import http_client
+from app.services.http_client import HttpMethod, HttpUrl, UpstreamConnectionException, send_request
+from app.services.retry import LatencyWindow, RetryBudget
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def use_upstream(monkeypatch, upstream, handler, tokens: float = 10):
+    url = HttpUrl.SCHOOL_SERVICE
+    upstream(url, handler)
+    monkeypatch.setitem(http_client.breakers, url, http_client.build_breaker(url))
+    monkeypatch.setitem(http_client.retry_budgets, url,
+                        RetryBudget("school", ratio=0.1, min_per_second=0, capacity=tokens))
+    monkeypatch.setattr(settings, "HTTP_RETRY_BACKOFF_SECONDS", 0.001)
+
+
+def test_retry_budget_token_bucket():
+    clock = FakeClock()
+    budget = RetryBudget("school", ratio=0.5, min_per_second=1, capacity=2, clock=clock)
+    assert budget.withdraw("retry") and budget.withdraw("retry")
+    assert not budget.withdraw("retry")
+    budget.deposit()
+    budget.deposit()  # due richieste = un retry
+    assert budget.withdraw("hedge")
+    clock.now = 1.0  # un token al secondo anche senza traffico
+    assert budget.withdraw("retry") and not budget.withdraw("retry")
+    assert budget.stats() == {"tokens": 0.0, "retries": 3, "hedges": 1, "exhausted": 2}
+
+
+def test_connection_errors_are_retried_within_budget(monkeypatch, upstream):
+    calls = []
+
+    def flaky(request):
+        calls.append(request.method)
+        if len(calls) % 3:
+            raise httpx.ConnectError("connection refused")
+        return httpx.Response(200, json={"ok": True})
+
+    use_upstream(monkeypatch, upstream, flaky)
+    response = asyncio.run(send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.GET, "/school/"))
+    assert response.data == {"ok": True} and len(calls) == 3
+
+    # budget esaurito: l'errore arriva subito, senza retry
+    calls.clear()
+    use_upstream(monkeypatch, upstream, flaky, tokens=0)
+    with pytest.raises(UpstreamConnectionException) as error:
+        asyncio.run(send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.GET, "/school/"))
+    assert len(calls) == 1
+    assert error.value.status_code == 503
+    assert error.value.server_message == "school_service is unreachable: ConnectError"
+
+
+def test_dropped_connection_not_retried_for_post(monkeypatch, upstream):
+    calls = []
+
+    def dropped(request):
+        calls.append(request.method)
+        raise httpx.RemoteProtocolError("Server disconnected without sending a response.")
+
+    use_upstream(monkeypatch, upstream, dropped)
+    with pytest.raises(UpstreamConnectionException) as error:
+        asyncio.run(send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.POST, "/school/"))
+    assert error.value.status_code == 502 and calls == ["POST"]
+    assert error.value.server_message == "school_service connection failed: RemoteProtocolError"
+    # la stessa richiesta idempotente invece viene ripetuta
+    with pytest.raises(UpstreamConnectionException):
+        asyncio.run(send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.PUT, "/school/1"))
+    assert calls == ["POST"] + ["PUT"] * (1 + settings.HTTP_RETRY_ATTEMPTS)
+
+
+def test_slow_get_is_hedged(monkeypatch, upstream):
+    calls = []
+
+    async def first_slow(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={"attempt": len(calls)})
+
+    use_upstream(monkeypatch, upstream, first_slow)
+    window = LatencyWindow()
+    for _ in range(settings.HEDGE_MIN_SAMPLES):
+        window.record(0.02)
+    monkeypatch.setitem(http_client.latencies, HttpUrl.SCHOOL_SERVICE, window)
+    monkeypatch.setitem(http_client.hedges_won, HttpUrl.SCHOOL_SERVICE, 0)
+    monkeypatch.setattr(settings, "SCHOOL_SERVICE_HEDGE_ENABLED", True)
+
+    response = asyncio.run(asyncio.wait_for(send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.GET, "/school/"), 1))
+    assert response.data == {"attempt": 2} and len(calls) == 2
+    assert http_client.hedges_won[HttpUrl.SCHOOL_SERVICE] == 1
+    assert http_client.retry_budgets[HttpUrl.SCHOOL_SERVICE].stats()["hedges"] == 1
+
+
+def test_pool_timeout_is_retried_for_post(monkeypatch, upstream):
+    calls = []
+
+    def pool_full(request):
+        calls.append(request.method)
+        if len(calls) == 1:
+            raise httpx.PoolTimeout("no connection available")
+        return httpx.Response(200, json={"ok": True})
+
+    # nessuna connessione libera: la richiesta non è partita, si può ripetere anche una POST
+    use_upstream(monkeypatch, upstream, pool_full)
+    response = asyncio.run(send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.POST, "/school/"))
+    assert response.data == {"ok": True} and calls == ["POST", "POST"]
@@ -0,0 +1,129 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.models.session import Session
+from app.models.user import User
+from app.services.broker import AsyncBrokerSingleton
+from app.services.revocation import RevokedSessions
+from app.services.session_store import SqlSessionStore
+from tests.conftest import TestingSessionLocal, reset_database
+
+
+def test_bitmap_add_and_contains():
+    revoked = RevokedSessions(exchange="test", store=SqlSessionStore(TestingSessionLocal))
+    assert 5 not in revoked
+    for session_id in (0, 5, 1000, 123456):
+        revoked.add(session_id)
+    revoked.add(5)
+    assert revoked.count == 4
+    assert all(session_id in revoked for session_id in (0, 5, 1000, 123456))
+    assert 4 not in revoked and 1001 not in revoked and 10 ** 9 not in revoked
+    assert None not in revoked
+
+    # id alti (archivio in memoria): la bitmap parte dal più basso revocato
+    revoked = RevokedSessions(exchange="test", store=SqlSessionStore(TestingSessionLocal))
+    start = 1_700_000_000_000
+    revoked.add(start + 9)
+    revoked.add(start + 3)
+    assert len(revoked.bits) == 2 and start + 9 in revoked and start + 3 in revoked
+    assert start + 4 not in revoked and 3 not in revoked
+
+
+def test_hydrate_loads_revoked_sessions_not_expired():
+    async def run():
+        await reset_database()
+        expires_at = datetime.now() + timedelta(days=1)
+        async with TestingSessionLocal() as db:
+            db.add(User(id=1, username="user", email="user@example.com", hashed_password="x"))
+            db.add_all([
+                Session(id=1, user_id=1, expires_at=expires_at),
+                Session(id=2, user_id=1, expires_at=expires_at, is_active=False),
+                Session(id=3, user_id=1, expires_at=expires_at, is_active=False, is_blocked=True),
+                Session(id=4, user_id=1, expires_at=datetime.now() - timedelta(days=1), is_active=False),
+            ])
+            await db.commit()
+        revoked = RevokedSessions(exchange="test", store=SqlSessionStore(TestingSessionLocal))
+        await revoked.hydrate()
+        assert [session_id in revoked for session_id in (1, 2, 3, 4)] == [False, True, True, False]
+    asyncio.run(run())
+
+
+def test_start_and_stop_share_the_process_broker(monkeypatch):
+    class FakeConnection:
+        is_closed = False
+
+    broker = AsyncBrokerSingleton()
+    connection, subscribed, unsubscribed = FakeConnection(), [], []
+    monkeypatch.setattr(broker, "connection", connection)
+
+    async def subscribe(exchange, callback, ex_type="direct", routing_key="", exclusive=False):
+        subscribed.append((exchange, ex_type, exclusive))
+        return f"gateway.{exchange}.queue"
+
+    async def unsubscribe(queue_name):
+        unsubscribed.append(queue_name)
+
+    monkeypatch.setattr(broker, "subscribe", subscribe)
+    monkeypatch.setattr(broker, "unsubscribe", unsubscribe)
+    monkeypatch.setattr(settings, "SESSION_REVOCATION_BROADCAST", True)
+
+    async def run():
+        await reset_database()
+        revoked = RevokedSessions(exchange="revoke", store=SqlSessionStore(TestingSessionLocal))
+        await revoked.start()
+        # la connessione già aperta dagli altri consumer non viene azzerata né chiusa
+        assert AsyncBrokerSingleton() is broker and broker.connection is connection
+        assert subscribed == [("revoke", "fanout", True)]
+        await revoked.stop()
+        assert unsubscribed == ["gateway.revoke.queue"] and broker.connection is connection
+    asyncio.run(run())
+
+
+def test_unreachable_broker_is_retried_and_store_reloaded(monkeypatch):
+    broker = AsyncBrokerSingleton()
+    reachable, subscribed, published = [False], [], []
+
+    async def connect():
+        return reachable[0]
+
+    async def subscribe(exchange, callback, ex_type="direct", routing_key="", exclusive=False):
+        subscribed.append(exchange)
+        return f"gateway.{exchange}.queue"
+
+    async def unsubscribe(queue_name):
+        pass
+
+    async def publish_message(exchange, message_type, data, ex_type="direct"):
+        published.append(data)
+
+    for name, fake in [("connect", connect), ("subscribe", subscribe), ("unsubscribe", unsubscribe),
+                       ("publish_message", publish_message)]:
+        monkeypatch.setattr(broker, name, fake)
+    monkeypatch.setattr(settings, "SESSION_REVOCATION_BROADCAST", True)
+
+    async def run():
+        await reset_database()
+        async with TestingSessionLocal() as db:
+            db.add(User(id=1, username="user", email="user@example.com", hashed_password="x"))
+            db.add(Session(id=1, user_id=1, expires_at=datetime.now() + timedelta(days=1)))
+            await db.commit()
+        revoked = RevokedSessions(exchange="revoke", store=SqlSessionStore(TestingSessionLocal), retry_interval=0.01)
+        await revoked.start()
+        assert revoked.broker is None and revoked.stats()["resubscribing"]
+        await revoked.revoke(5)
+
+        # un altro worker chiude la sessione 1: arriva ricaricando l'archivio, senza messaggi
+        async with TestingSessionLocal() as db:
+            (await db.get(Session, 1)).is_active = False
+            await db.commit()
+        await asyncio.sleep(0.05)
+        assert 1 in revoked and subscribed == [] and published == []
+
+        # broker di nuovo raggiungibile: sottoscrizione e pubblicazione delle revoche rimaste in sospeso
+        reachable[0] = True
+        await asyncio.sleep(0.05)
+        assert subscribed == ["revoke"] and published == [{"session_id": 5}]
+        assert revoked.broker is broker and not revoked.stats()["resubscribing"]
+        await revoked.stop()
+    asyncio.run(run())
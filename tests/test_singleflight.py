@@ -0,0 +1,44 @@
+import asyncio
+
+import httpx
+
+from app.services import http_client
+from app.services.http_client import HttpMethod, HttpParams, HttpUrl, send_request
+from app.services.singleflight import SingleFlight
+
+
+def test_identical_gets_share_one_upstream_call(monkeypatch, upstream):
+    async def run():
+        calls = []
+        release = asyncio.Event()
+
+        async def slow(request):
+            calls.append(str(request.url))
+            await release.wait()
+            return httpx.Response(200, json={"schools": [{"id": 1}]})
+
+        upstream(HttpUrl.SCHOOL_SERVICE, slow)
+        monkeypatch.setattr(http_client, "singleflight", SingleFlight())
+
+        def get(params: dict, **kwargs):
+            return asyncio.create_task(send_request(HttpUrl.SCHOOL_SERVICE, HttpMethod.GET, "/schools",
+                                                    HttpParams(params), **kwargs))
+
+        # stessi parametri in ordine diverso: stessa richiesta
+        same = [get({"page": 1, "limit": 10} if i % 2 else {"limit": 10, "page": 1}) for i in range(10)]
+        other = get({"page": 2, "limit": 10})
+        opted_out = get({"page": 1, "limit": 10}, coalesce=False)
+        await asyncio.sleep(0.01)
+        assert len(calls) == 3
+        release.set()
+        responses = await asyncio.gather(*same, other, opted_out)
+        assert all(r.data == {"schools": [{"id": 1}]} for r in responses)
+        # ogni chiamante ha la propria copia dei dati
+        responses[0].data["schools"].clear()
+        assert responses[1].data == {"schools": [{"id": 1}]}
+        assert http_client.singleflight.stats() == {"in_flight": 0, "calls": 2, "saved": 9}
+
+        # a richiesta conclusa la chiave viene liberata: la successiva parte di nuovo
+        await get({"page": 1, "limit": 10})
+        assert len(calls) == 4
+    asyncio.run(run())
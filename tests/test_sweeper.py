@@ -0,0 +1,58 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from app.models.accessToken import AccessToken
+from app.models.refreshToken import RefreshToken
+from app.models.session import Session
+from app.models.user import User
+from app.services.sweeper import ExpirySweeper
+from tests.conftest import TestingSessionLocal, reset_database
+
+
+def make_sweeper():
+    return ExpirySweeper(interval=60, batch_size=2, max_rows_per_second=0, retention=timedelta(days=1),
+                         session_factory=TestingSessionLocal)
+
+
+async def seed():
+    old = datetime.now(timezone.utc) - timedelta(days=2)
+    async with TestingSessionLocal() as db:
+        db.add(User(id=1, username="user", email="user@example.com", hashed_password="x"))
+        # sessione attiva: un token ruotato da tempo e la coppia corrente
+        active = Session(id=1, user_id=1, expires_at=datetime.now() + timedelta(days=30))
+        # sessione chiusa (logout) da più della retention, con tre rotazioni
+        closed = Session(id=2, user_id=1, expires_at=datetime.now() + timedelta(days=30), is_active=False,
+                         updated_at=old)
+        db.add_all([active, closed])
+        for n in range(2):
+            access = AccessToken(session_id=1, token=f"a1-{n}", is_expired=n == 0, updated_at=old)
+            db.add_all([access, RefreshToken(session_id=1, token=f"r1-{n}", accessToken=access, is_expired=n == 0,
+                                             updated_at=old)])
+        for n in range(3):
+            access = AccessToken(session_id=2, token=f"a2-{n}", is_expired=True)
+            db.add_all([access, RefreshToken(session_id=2, token=f"r2-{n}", accessToken=access, is_expired=True)])
+        await db.commit()
+
+
+async def count(model):
+    async with TestingSessionLocal() as db:
+        return (await db.execute(select(func.count()).select_from(model))).scalar_one()
+
+
+def test_sweep_removes_expired_rows_in_batches():
+    async def run():
+        await reset_database()
+        await seed()
+        sweeper = make_sweeper()
+        assert await sweeper.count_backlog() == 2 + 6 + 1
+        assert await sweeper.sweep() == 9
+        assert sweeper.deleted == {"refreshTokens": 4, "accessTokens": 4, "sessions": 1}
+        assert sweeper.backlog == 0
+        # resta solo la coppia corrente della sessione attiva
+        assert await count(Session) == 1
+        assert await count(AccessToken) == 1
+        assert await count(RefreshToken) == 1
+        assert await sweeper.sweep() == 0
+    asyncio.run(run())
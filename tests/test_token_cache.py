@@ -0,0 +1,47 @@
+import time
+
+from app.services.http_client import HttpClientException
+from app.services.token_cache import TokenCache
+
+
+def test_hit_and_miss_counters():
+    cache = TokenCache(max_entries=10, max_ttl=60, negative_ttl=5)
+    assert cache.get("token") is None
+    cache.put("token", {"verified": True, "expired": False, "session_id": 1})
+    assert cache.get("token")["session_id"] == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_bounded_by_token_exp():
+    cache = TokenCache(max_entries=10, max_ttl=60, negative_ttl=5)
+    cache.put("token", {"verified": True, "expired": False, "exp": time.time() + 2})
+    expires_at, _ = next(iter(cache.entries.values()))
+    assert expires_at - time.monotonic() <= 2
+    # già scaduto (es. verificato con leeway): non va servito come valido
+    cache.put("late", {"verified": True, "expired": False, "exp": time.time() - 1})
+    assert cache.get("late") is None and len(cache.entries) == 1
+
+
+def test_lru_eviction():
+    cache = TokenCache(max_entries=2, max_ttl=60, negative_ttl=5)
+    cache.put("a", {"verified": True, "expired": False})
+    cache.put("b", {"verified": True, "expired": False})
+    cache.get("a")
+    cache.put("c", {"verified": True, "expired": False})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_negative_cache_and_session_invalidation():
+    cache = TokenCache(max_entries=10, max_ttl=60, negative_ttl=5)
+    cache.put_error("bad", HttpClientException("HTTP Error 401", "Invalid token", 401, "/token/verify"))
+    assert cache.get("bad") == ("HTTP Error 401", "Invalid token", 401, "/token/verify")
+
+    cache.put("access", {"verified": True, "expired": False, "session_id": 7})
+    cache.put("refresh", {"verified": True, "expired": False, "session_id": 7})
+    cache.invalidate_session(7)
+    assert cache.get("access") is None
+    assert cache.get("refresh") is None
+    assert cache.stats()["invalidations"] == 2
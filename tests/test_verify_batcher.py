@@ -0,0 +1,65 @@
+import asyncio
+import json
+import time
+from collections import Counter
+
+import httpx
+import pytest
+from jose import JWTError, jwt
+
+from app.services.http_client import HttpClientException, HttpUrl
+from app.services.verify_batcher import VerifyBatcher
+
+SECRET = "test-secret"
+
+
+def sign(data: dict) -> str:
+    return jwt.encode({**data, "exp": int(time.time()) + 60}, SECRET, algorithm="HS256")
+
+
+@pytest.fixture
+def token_service(upstream):
+    """Servizio token finto con l'endpoint di verifica a blocchi; restituisce il numero di richieste per endpoint."""
+    requests = Counter()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests[request.url.path.rsplit("/", 1)[-1]] += 1
+        results = []
+        for token in json.loads(request.content)["tokens"]:
+            try:
+                results.append({**jwt.decode(token, SECRET, algorithms=["HS256"]), "verified": True, "expired": False})
+            except JWTError as e:
+                results.append({"status_code": 401, "detail": f"Invalid token: {e}"})
+        return httpx.Response(200, json={"results": results})
+
+    upstream(HttpUrl.TOKEN_SERVICE, handler)
+    return requests
+
+
+def test_concurrent_verifications_share_one_request(token_service):
+    async def run():
+        batcher = VerifyBatcher(endpoint="/token/verify_batch", window=0.01, max_batch=64)
+        tokens = [sign({"user_id": n}) for n in range(10)]
+
+        results = await asyncio.gather(*(batcher.verify(token) for token in tokens + tokens[:3]))
+        assert [result["user_id"] for result in results] == list(range(10)) + [0, 1, 2]
+        assert token_service["verify_batch"] == 1
+        assert batcher.coalesced == 3
+
+        # un token non valido fallisce da solo, gli altri dello stesso blocco vengono verificati
+        valid, invalid = await asyncio.gather(batcher.verify(tokens[0]), batcher.verify("not-a-token"),
+                                              return_exceptions=True)
+        assert valid["verified"] is True
+        assert isinstance(invalid, HttpClientException) and invalid.status_code == 401
+        assert token_service["verify_batch"] == 2
+    asyncio.run(run())
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window(token_service):
+    async def run():
+        batcher = VerifyBatcher(endpoint="/token/verify_batch", window=60, max_batch=4)
+        tokens = [sign({"user_id": n}) for n in range(8)]
+        results = await asyncio.wait_for(asyncio.gather(*(batcher.verify(token) for token in tokens)), timeout=5)
+        assert len(results) == 8
+        assert batcher.batches == 2
+    asyncio.run(run())